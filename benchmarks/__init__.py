@@ -0,0 +1,3 @@
+"""
+Benchmarks and local fakes for measuring pipeline performance offline.
+"""
@@ -0,0 +1,50 @@
+"""
+Compare sequential and batched message fetches against the fake Gmail service.
+
+Usage:
+    python benchmarks/bench_gmail_fetch.py --messages 500 --latency 0.02
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from benchmarks.fake_gmail import FakeGmailService, make_message
+from gmail_client import GmailClient
+
+
+def main():
+    """Run the fetch benchmark and print the results."""
+    parser = argparse.ArgumentParser(description="Benchmark Gmail message fetching")
+    parser.add_argument("--messages", type=int, default=500, help="Number of messages in the fake mailbox")
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated round-trip latency in seconds")
+    parser.add_argument("--batch-size", type=int, default=50, help="Calls per batch request")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent batch requests")
+    args = parser.parse_args()
+
+    messages = [make_message(f"msg-{i:06d}", f"【法人名】株式会社テスト{i}\n") for i in range(args.messages)]
+    message_ids = [message['id'] for message in messages]
+
+    service = FakeGmailService(messages, latency=args.latency)
+    start = time.perf_counter()
+    for message_id in message_ids:
+        service.users().messages().get(userId='me', id=message_id).execute()
+    sequential = time.perf_counter() - start
+    print(f"sequential: {sequential:.2f}s, {service.round_trips} round trips")
+
+    service = FakeGmailService(messages, latency=args.latency)
+    client = GmailClient(service=service)
+    client.batch_size = args.batch_size
+    client.fetch_workers = args.workers
+    start = time.perf_counter()
+    emails = client.fetch_messages(message_ids)
+    batched = time.perf_counter() - start
+    print(f"batched:    {batched:.2f}s, {service.round_trips} round trips, {len(emails)} emails")
+    print(f"speedup:    {sequential / batched:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
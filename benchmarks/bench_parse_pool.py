@@ -0,0 +1,64 @@
+"""
+Measure how MIME decoding plus regex extraction scales with the --workers process pool.
+
+Usage:
+    python benchmarks/bench_parse_pool.py --emails 20000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from benchmarks.corpus import make_body
+from benchmarks.fake_gmail import make_message
+from email_parser import EmailParser
+from gmail_client import GmailClient
+from parse_pool import ParsePool
+
+
+def undecoded_emails(gmail_client, messages):
+    """Email dicts carrying the raw payload, as fetched with decode_bodies off."""
+    return [gmail_client._to_email_data(message) for message in messages]
+
+
+def main():
+    """Run the parse pool benchmark and print the results."""
+    parser = argparse.ArgumentParser(description="Benchmark the parse process pool")
+    parser.add_argument("--emails", type=int, default=20000, help="Number of synthetic emails")
+    parser.add_argument("--workers", type=int, nargs='+', default=[1, 2, 4, 8], help="Pool sizes to measure")
+    parser.add_argument("--chunk-size", type=int, default=64, help="Emails per pool task")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the corpus")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    messages = [make_message(f"msg-{i:06d}", make_body(rng)) for i in range(args.emails)]
+    gmail_client = GmailClient(service=object())
+    email_parser = EmailParser()
+    print(f"{args.emails} emails, {os.cpu_count()} CPUs")
+
+    gmail_client.decode_bodies = True
+    start = time.perf_counter()
+    expected = [email_parser.extract_info_regex(gmail_client._to_email_data(message)['body'])
+                for message in messages]
+    baseline = time.perf_counter() - start
+    print(f"in-process: {baseline:.2f}s ({args.emails / baseline:,.0f} emails/s)")
+
+    gmail_client.decode_bodies = False
+    for workers in args.workers:
+        emails = undecoded_emails(gmail_client, messages)
+        with ParsePool(workers, chunk_size=args.chunk_size) as pool:
+            pool.parse(undecoded_emails(gmail_client, messages[:workers * args.chunk_size]))  # warm up
+            start = time.perf_counter()
+            results = pool.parse(emails)
+            elapsed = time.perf_counter() - start
+        assert results == expected
+        print(f"{workers} workers: {elapsed:.2f}s ({args.emails / elapsed:,.0f} emails/s, "
+              f"{baseline / elapsed:.2f}x in-process)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compare running fetch, parse, AI and write one after another with the staged pipeline.
+
+Each stage sleeps for a fixed time per chunk, standing in for its network or
+CPU cost.
+
+Usage:
+    python benchmarks/bench_pipeline.py --chunks 20 --fetch 0.05 --parse 0.01 --ai 0.2 --write 0.05 --ai-workers 2
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from pipeline import Pipeline, Stage
+
+
+def sleeper(seconds):
+    """Stage function that sleeps per chunk and passes the chunk on."""
+    def run(chunk):
+        time.sleep(seconds)
+        return chunk
+    return run
+
+
+def main():
+    """Run the pipeline benchmark and print the results."""
+    parser = argparse.ArgumentParser(description="Benchmark the staged pipeline")
+    parser.add_argument("--chunks", type=int, default=20, help="Number of chunks to process")
+    parser.add_argument("--chunk-size", type=int, default=16, help="Emails per chunk")
+    parser.add_argument("--fetch", type=float, default=0.05, help="Fetch time per chunk in seconds")
+    parser.add_argument("--parse", type=float, default=0.01, help="Parse time per chunk in seconds")
+    parser.add_argument("--ai", type=float, default=0.2, help="AI extraction time per chunk in seconds")
+    parser.add_argument("--write", type=float, default=0.05, help="Write time per chunk in seconds")
+    parser.add_argument("--ai-workers", type=int, default=2, help="Workers of the AI stage")
+    parser.add_argument("--queue-size", type=int, default=4, help="Chunks queued in front of each stage")
+    args = parser.parse_args()
+
+    def source():
+        for i in range(args.chunks):
+            time.sleep(args.fetch)
+            yield list(range(i * args.chunk_size, (i + 1) * args.chunk_size))
+
+    start = time.perf_counter()
+    for chunk in source():
+        for seconds in (args.parse, args.ai, args.write):
+            chunk = sleeper(seconds)(chunk)
+    sequential = time.perf_counter() - start
+    print(f"sequential: {sequential:.2f}s")
+
+    pipeline = Pipeline('fetch', source(), [
+        Stage('parse', sleeper(args.parse)),
+        Stage('ai', sleeper(args.ai), workers=args.ai_workers),
+        Stage('write', sleeper(args.write)),
+    ], queue_size=args.queue_size)
+    pipeline.run()
+    print(f"pipelined:  {pipeline.elapsed:.2f}s")
+    for line in pipeline.report():
+        print(f"  {line}")
+
+    slowest = max(args.fetch, args.parse, args.ai / args.ai_workers, args.write) * args.chunks
+    print(f"slowest stage bound: {slowest:.2f}s, speedup: {sequential / pipeline.elapsed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Micro-benchmark of EmailParser.extract_info_regex over synthetic 案件 bodies.
+
+Compares the label-dispatch extractor with the previous implementation that
+ran eleven uncompiled re.search calls per email.
+
+Usage:
+    python benchmarks/bench_regex.py --emails 2000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from benchmarks.corpus import make_body
+from email_parser import EmailParser
+
+
+def legacy_extract_info_regex(email_body):
+    """Previous implementation of extract_info_regex, kept as the baseline."""
+    result = {
+        'company_name': '',
+        'url': '',
+        'industry': '',
+        'established_year': '',
+        'capital': '',
+        'revenue': '',
+        'fiscal_year_end': '',
+        'employee_count': '',
+        'prefecture': '',
+        'nearest_station': '',
+        'company_overview': ''
+    }
+
+    patterns = [
+        ('company_name', r'【法人名】\s*(.+?)(?=\n|【)'),
+        ('url', r'【URL】\s*(https?://[^\s]+)'),
+        ('industry', r'【業界】\s*(.+?)(?=\n|【)'),
+        ('established_year', r'【設立】\s*(\d{4}年\d{1,2}月\d{1,2}日)'),
+        ('capital', r'【資本金】\s*([0-9,]+円)'),
+        ('revenue', r'【売上】\s*(.+?)(?=\n|【)'),
+        ('fiscal_year_end', r'【決算】\s*(\d{1,2}月)'),
+        ('employee_count', r'【社員数】\s*(\d+名)'),
+        ('prefecture', r'【都道府県】\s*(.+?[都道府県])(?=\n|【)'),
+        ('nearest_station', r'【最寄駅】\s*(.+?駅)(?=\n|【)'),
+        ('company_overview', r'【法人概要】\s*([\s\S]+?)(?=\n【|$)'),
+    ]
+    for field, pattern in patterns:
+        match = re.search(pattern, email_body)
+        if match:
+            result[field] = match.group(1).strip()
+
+    return result
+
+
+def main():
+    """Run the regex benchmark and print emails/second for both implementations."""
+    parser = argparse.ArgumentParser(description="Benchmark regex extraction")
+    parser.add_argument("--emails", type=int, default=2000, help="Number of synthetic bodies")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the corpus")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = [make_body(rng) for _ in range(args.emails)]
+    email_parser = EmailParser()
+
+    for name, extract in [("before", legacy_extract_info_regex), ("after", email_parser.extract_info_regex)]:
+        start = time.perf_counter()
+        for body in corpus:
+            extract(body)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>6}: {len(corpus) / elapsed:,.0f} emails/s")
+
+    mismatches = sum(legacy_extract_info_regex(body) != email_parser.extract_info_regex(body) for body in corpus)
+    print(f"mismatches: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
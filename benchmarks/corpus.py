@@ -0,0 +1,122 @@
+"""
+Seeded generator of synthetic 案件 emails for benchmarks and tests.
+
+Bodies follow the 【法人名】…【法人概要】 layout of the real mails, with the
+noise seen in practice: greetings and signatures, blank lines, full-width
+spaces around values, missing fields, overviews and project sections of
+varying length, quoted replies, and a share of mails without a 案件 at all.
+Every generated body comes with the regex fields it should produce.
+"""
+import random
+from typing import Any, Dict, List, Tuple
+
+COMPANY_KINDS = ['株式会社', '合同会社', '有限会社']
+INDUSTRIES = ['IT / ソフトウェア', '建設 / 総合建設 / ビル・住宅建築', '金融 / 銀行', '製造 / 電子部品', '小売 / EC']
+PREFECTURES = ['東京都', '大阪府', '京都府', '北海道', '福岡県', '神奈川県', '愛知県']
+STATIONS = ['渋谷駅', '梅田駅', '京都駅', '札幌駅', '博多駅', '横浜駅', '名古屋駅', '太秦天神川駅']
+OVERVIEW_LINES = [
+    '新築住宅分譲事業を展開しています。',
+    '工業団地の分譲による雇用創出も行っています。',
+    'クラウド基盤の構築・運用を手掛けています。',
+    '全国に拠点を持ち、法人向けサービスを提供しています。',
+    'データ活用による業務改善を支援しています。',
+]
+SKILLS = ['Python', 'SQL', 'AWS', 'GCP', 'BigQuery', 'TypeScript', 'Spark', 'dbt']
+GREETINGS = ['お世話になっております。', 'いつもお世話になっております。\n株式会社フロンティアの山田です。', '']
+SIGNATURES = ['', '--\n山田 太郎\nTEL: 03-0000-0000', '────────\n配信停止はこちら\nhttps://example.jp/unsubscribe']
+NON_PROJECT_BODIES = [
+    'ただいま不在にしております。\n戻り次第ご連絡いたします。',
+    '今月のメルマガをお届けします。\n配信停止はこちら',
+    'お打ち合わせの日程について、ご確認をお願いいたします。',
+]
+SPACES = ['', ' ', '　', '  ']
+
+
+def make_case(rng: random.Random) -> Tuple[str, Dict[str, str]]:
+    """
+    Build one synthetic body and the regex fields it should yield.
+
+    Args:
+        rng: Random generator the body is drawn from
+
+    Returns:
+        Tuple of (body, expected regex fields keyed like extract_info_regex)
+    """
+    expected = {key: '' for key in ('company_name', 'url', 'industry', 'established_year', 'capital', 'revenue',
+                                    'fiscal_year_end', 'employee_count', 'prefecture', 'nearest_station',
+                                    'company_overview')}
+    greeting = rng.choice(GREETINGS)
+
+    if rng.random() < 0.1:
+        return '\n'.join(filter(None, [greeting, rng.choice(NON_PROJECT_BODIES)])), expected
+
+    values = {
+        'company_name': ('法人名', f"{rng.choice(COMPANY_KINDS)}サンプル{rng.randint(1, 9999)}"),
+        'url': ('URL', f"https://example{rng.randint(1, 999)}.co.jp/{rng.choice(['', 'company/', 'about'])}"),
+        'industry': ('業界', rng.choice(INDUSTRIES)),
+        'established_year': ('設立', f"{rng.randint(1950, 2022)}年{rng.randint(1, 12)}月{rng.randint(1, 28)}日"),
+        'capital': ('資本金', f"{rng.randint(1, 900) * 1000000:,}円"),
+        'revenue': ('売上', f"{rng.randint(1, 900) * 10000000:,}円"),
+        'fiscal_year_end': ('決算', f"{rng.randint(1, 12)}月"),
+        'employee_count': ('社員数', f"{rng.randint(1, 5000)}名"),
+        'prefecture': ('都道府県', rng.choice(PREFECTURES)),
+        'nearest_station': ('最寄駅', rng.choice(STATIONS)),
+    }
+
+    lines = []
+    for key, (label, value) in values.items():
+        if rng.random() < 0.1:
+            continue
+        # Values matched up to a fixed suffix (URL, 都道府県, 駅) cannot carry trailing spaces.
+        trailing = '' if key in ('url', 'prefecture', 'nearest_station') else rng.choice(SPACES)
+        lines.append(f"【{label}】{rng.choice(SPACES)}{value}{trailing}")
+        expected[key] = value
+
+    project = ("■案件概要\n【案件名】データ基盤構築\n【契約形態】準委任\n【必須スキル】\n"
+               + ''.join(f"・{rng.choice(SKILLS)}\n" for _ in range(rng.randint(0, 20))))
+    if rng.random() < 0.9:
+        overview = '\n'.join(rng.choice(OVERVIEW_LINES) for _ in range(rng.randint(1, 40)))
+        lines.append(f"【法人概要】{rng.choice(SPACES)}{overview}\n\n{project}")
+        expected['company_overview'] = f"{overview}\n\n■案件概要"
+    else:
+        lines.append(f"\n{project}")
+
+    parts = [greeting, '\n'.join(lines), rng.choice(SIGNATURES)]
+    if rng.random() < 0.2:
+        parts.append('\n'.join(f"> {line}" for line in rng.choice(NON_PROJECT_BODIES).splitlines()))
+    return '\n'.join(filter(None, parts)), expected
+
+
+def make_body(rng: random.Random) -> str:
+    """
+    Build one synthetic body.
+
+    Args:
+        rng: Random generator the body is drawn from
+
+    Returns:
+        The body text
+    """
+    return make_case(rng)[0]
+
+
+def make_corpus(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Build a reproducible list of email data dictionaries.
+
+    Args:
+        count: Number of emails
+        seed: Random seed; the same seed always gives the same corpus
+
+    Returns:
+        Email data dictionaries shaped like GmailClient output
+    """
+    rng = random.Random(seed)
+    return [{
+        'id': f"msg-{index:06d}",
+        'subject': rng.choice(['案件のご紹介', '【案件】データエンジニア募集', 'ご連絡', '自動返信: 不在']),
+        'from': 'sender@example.com',
+        'to': 'rc_support@frontier-gr.jp',
+        'date': f"Mon, {rng.randint(1, 28):02d} May 2023 {rng.randint(0, 23):02d}:00:00 +0900",
+        'body': make_body(rng),
+    } for index in range(count)]
@@ -0,0 +1,97 @@
+"""
+In-process fake of google.cloud.bigquery.Client for streaming inserts.
+"""
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set
+
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+
+class FakeBigQueryClient:
+    """
+    Records streamed rows and simulates per-request latency.
+
+    Rows whose email_id is in ``invalid_ids`` are always rejected as invalid;
+    rows in ``flaky_ids`` fail once with a retriable ``stopped`` error.
+    """
+
+    def __init__(self, latency: float = 0.0, invalid_ids: Optional[Set[str]] = None,
+                 flaky_ids: Optional[Set[str]] = None):
+        self.project = 'fake-project'
+        self.latency = latency
+        self.invalid_ids = set(invalid_ids or ())
+        self.flaky_ids = set(flaky_ids or ())
+        self.rows: List[Dict[str, Any]] = []
+        self.table_rows: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.insert_calls = 0
+        self.loaded_files: List[Dict[str, Any]] = []
+        self.created_tables: List[Any] = []
+        self.tables: Dict[str, Any] = {}
+        self.updated_tables: List[Any] = []
+        self.metadata_calls = 0
+        self.deleted_tables: List[Any] = []
+        self.queries: List[str] = []
+
+    def dataset(self, dataset_id: str) -> bigquery.DatasetReference:
+        return bigquery.DatasetReference(self.project, dataset_id)
+
+    def insert_rows_json(self, table, json_rows, row_ids=None, **kwargs):
+        self.insert_calls += 1
+        time.sleep(self.latency)
+        errors = []
+        for index, row in enumerate(json_rows):
+            email_id = row.get('email_id')
+            if email_id in self.invalid_ids:
+                errors.append({'index': index, 'errors': [{'reason': 'invalid', 'message': 'bad row'}]})
+            elif email_id in self.flaky_ids:
+                self.flaky_ids.discard(email_id)
+                errors.append({'index': index, 'errors': [{'reason': 'backendError', 'message': 'try again'}]})
+        failed = {error['index'] for error in errors}
+        inserted = [row for index, row in enumerate(json_rows) if index not in failed]
+        self.rows.extend(inserted)
+        self.table_rows[table.table_id].extend(inserted)
+        return errors
+
+    def load_table_from_file(self, file_obj, destination, job_config=None, **kwargs):
+        data = file_obj.read()
+        self.loaded_files.append({'data': data, 'source_format': job_config.source_format,
+                                  'destination': destination.table_id})
+        return FakeJob()
+
+    def get_dataset(self, dataset, **kwargs):
+        self.metadata_calls += 1
+        return bigquery.Dataset(dataset)
+
+    def get_table(self, table, **kwargs):
+        self.metadata_calls += 1
+        if table.table_id not in self.tables:
+            raise NotFound(f"Table {table.table_id} not found")
+        return self.tables[table.table_id]
+
+    def create_table(self, table, exists_ok=False, **kwargs):
+        self.created_tables.append(table)
+        self.tables[table.table_id] = table
+        return table
+
+    def update_table(self, table, fields, **kwargs):
+        self.updated_tables.append((table, list(fields)))
+        return table
+
+    def delete_table(self, table, not_found_ok=False, **kwargs):
+        self.deleted_tables.append(table)
+
+    def query(self, sql, job_config=None, **kwargs):
+        self.queries.append(sql)
+        return FakeJob(num_dml_affected_rows=sum(data['data'].count(b'\n') for data in self.loaded_files))
+
+
+class FakeJob:
+    """Completed job returned by the fake client."""
+
+    def __init__(self, num_dml_affected_rows=None):
+        self.num_dml_affected_rows = num_dml_affected_rows
+
+    def result(self, timeout=None):
+        return self
@@ -0,0 +1,165 @@
+"""
+In-process fake of the Gmail API service with simulated network latency.
+"""
+import base64
+import time
+import httplib2
+from googleapiclient.errors import HttpError
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+
+def make_message(message_id: str, body: str, subject: str = '案件のご紹介',
+                 sender: str = 'sender@example.com', to: str = 'rc_support@frontier-gr.jp',
+                 date: str = 'Mon, 01 May 2023 09:00:00 +0900',
+                 internal_date: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Build a Gmail API message resource with a single text/plain body.
+
+    Args:
+        message_id: Gmail message id
+        body: Plain-text body
+        subject: Subject header
+        sender: From header
+        to: To header
+        date: Date header
+        internal_date: Receive time in epoch milliseconds. Defaults to now.
+
+    Returns:
+        Gmail API message dictionary
+    """
+    return {
+        'id': message_id,
+        'threadId': message_id,
+        'sizeEstimate': len(body.encode('utf-8')),
+        'internalDate': str(internal_date if internal_date is not None else int(time.time() * 1000)),
+        'payload': {
+            'mimeType': 'text/plain',
+            'headers': [
+                {'name': 'Subject', 'value': subject},
+                {'name': 'From', 'value': sender},
+                {'name': 'To', 'value': to},
+                {'name': 'Date', 'value': date},
+            ],
+            'body': {'data': base64.urlsafe_b64encode(body.encode('utf-8')).decode('ascii')}
+        }
+    }
+
+
+class FakeRequest:
+    """A single pending API call that sleeps for one round trip when executed."""
+
+    def __init__(self, service: 'FakeGmailService', handler: Callable[[], Any]):
+        self.service = service
+        self.handler = handler
+
+    def execute(self, http=None):
+        self.service.round_trips += 1
+        time.sleep(self.service.latency)
+        return self.handler()
+
+
+class FakeBatch:
+    """Fake HTTP batch: one round trip for all queued calls, per-call callbacks."""
+
+    def __init__(self, service: 'FakeGmailService', callback: Optional[Callable] = None):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request: FakeRequest, callback: Optional[Callable] = None, request_id: Optional[str] = None):
+        self.requests.append((request_id or str(len(self.requests)), request, callback or self.callback))
+
+    def execute(self, http=None):
+        self.service.round_trips += 1
+        time.sleep(self.service.latency + self.service.per_item_latency * len(self.requests))
+        for request_id, request, callback in self.requests:
+            try:
+                response, exception = request.handler(), None
+            except Exception as e:
+                response, exception = None, e
+            if callback is not None:
+                callback(request_id, response, exception)
+
+
+class FakeGmailService:
+    """
+    Minimal stand-in for ``build('gmail', 'v1')`` backed by an in-memory mailbox.
+
+    Only the call chains used by GmailClient are implemented.
+    """
+
+    def __init__(self, messages: Iterable[Dict[str, Any]], latency: float = 0.05,
+                 per_item_latency: float = 0.0, failing_ids: Optional[Set[str]] = None):
+        self.mailbox = {message['id']: message for message in messages}
+        self.order = list(self.mailbox)
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.failing_ids = set(failing_ids or ())
+        self.round_trips = 0
+        self.history_id = 1000
+        self.history_records = []
+        self.oldest_history_id = self.history_id
+
+    def add_message(self, message: Dict[str, Any]) -> None:
+        """Deliver a new message, recording a messageAdded history entry."""
+        self.history_id += 1
+        self.mailbox[message['id']] = message
+        self.order.append(message['id'])
+        self.history_records.append({
+            'id': str(self.history_id),
+            'messagesAdded': [{'message': {'id': message['id'], 'threadId': message['id']}}]
+        })
+
+    def users(self):
+        return self
+
+    def getProfile(self, userId: str = 'me'):
+        return FakeRequest(self, lambda: {'emailAddress': userId, 'historyId': str(self.history_id)})
+
+    def history(self):
+        return FakeHistory(self)
+
+    # users().messages()
+    def messages(self):
+        return self
+
+    def list(self, userId: str = 'me', q: str = '', maxResults: int = 100, pageToken: Optional[str] = None):
+        def handler():
+            start = int(pageToken or 0)
+            ids = self.order[start:start + maxResults]
+            page = {'messages': [{'id': message_id, 'threadId': message_id} for message_id in ids]}
+            if start + maxResults < len(self.order):
+                page['nextPageToken'] = str(start + maxResults)
+            return page
+        return FakeRequest(self, handler)
+
+    def get(self, userId: str = 'me', id: str = '', format: str = 'full'):
+        def handler():
+            if id in self.failing_ids:
+                raise RuntimeError(f"simulated failure for {id}")
+            return self.mailbox[id]
+        return FakeRequest(self, handler)
+
+    def new_batch_http_request(self, callback: Optional[Callable] = None):
+        return FakeBatch(self, callback)
+
+
+class FakeHistory:
+    """users().history() resource of the fake service."""
+
+    def __init__(self, service: FakeGmailService):
+        self.service = service
+
+    def list(self, userId: str = 'me', startHistoryId: str = '0', historyTypes=None,
+             maxResults: int = 100, pageToken: Optional[str] = None):
+        def handler():
+            if int(startHistoryId) < self.service.oldest_history_id:
+                raise HttpError(httplib2.Response({'status': 404}), b'Requested entity was not found.')
+            records = [record for record in self.service.history_records
+                       if int(record['id']) > int(startHistoryId)]
+            start = int(pageToken or 0)
+            page = {'history': records[start:start + maxResults], 'historyId': str(self.service.history_id)}
+            if start + maxResults < len(records):
+                page['nextPageToken'] = str(start + maxResults)
+            return page
+        return FakeRequest(self.service, handler)
@@ -0,0 +1,124 @@
+"""
+Local fake of the OpenAI chat completions endpoint.
+
+Point ``OPENAI_BASE_URL`` at ``FakeCompletionServer.base_url`` to exercise the
+real OpenAI client without network access or API spend.
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULT_ANSWER = {
+    '案件種別': '新規開発',
+    '契約形態': '準委任',
+    '業界': '不動産',
+    '使用技術': 'Python',
+    '使用データ': '取引データ',
+    '使用ツール・基盤': 'GCP',
+    '担当フェーズ': '開発',
+    '担当役割': 'エンジニア',
+}
+
+
+def default_answer(messages: List[Dict[str, Any]]) -> str:
+    """
+    Answer like the model would: one object for a single email, or a JSON
+    array with one object per ``メールID`` for a batch prompt.
+    """
+    prompt = messages[-1]['content']
+    email_ids = re.findall(r'メールID: (\S+) ---', prompt)
+    if not email_ids:
+        return json.dumps(DEFAULT_ANSWER, ensure_ascii=False)
+    return json.dumps([dict(DEFAULT_ANSWER, id=email_id) for email_id in email_ids], ensure_ascii=False)
+
+
+class FakeCompletionServer:
+    """
+    Threaded HTTP server answering POST /chat/completions.
+
+    The first ``fail_first`` requests are answered with ``fail_status`` to
+    exercise retry handling. ``answer`` builds the completion text from the
+    request messages.
+    """
+
+    def __init__(self, latency: float = 0.0, fail_first: int = 0, fail_status: int = 429,
+                 answer: Optional[Callable[[List[Dict[str, Any]]], str]] = None):
+        self.latency = latency
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.answer = answer or default_answer
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> 'FakeCompletionServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with fake._lock:
+                    fake.requests += 1
+                    number = fake.requests
+                    fake.in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+                try:
+                    time.sleep(fake.latency)
+                    if number <= fake.fail_first:
+                        self._send(fake.fail_status, {'error': {'message': 'simulated failure', 'type': 'fake'}},
+                                   {'retry-after': '0'})
+                        return
+                    content = fake.answer(payload['messages'])
+                    self._send(200, {
+                        'id': f"chatcmpl-{number}",
+                        'object': 'chat.completion',
+                        'created': int(time.time()),
+                        'model': payload['model'],
+                        'choices': [{'index': 0, 'finish_reason': 'stop',
+                                     'message': {'role': 'assistant', 'content': content}}],
+                        'usage': {'prompt_tokens': 100, 'completion_tokens': 50, 'total_tokens': 150},
+                    })
+                finally:
+                    with fake._lock:
+                        fake.in_flight -= 1
+
+            def _send(self, status, body, headers=None):
+                data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
@@ -0,0 +1,208 @@
+"""
+Run the benchmark suite and write the results as JSON.
+
+Each benchmark runs over the same seeded corpus, so results from different
+commits can be compared directly.
+
+Usage:
+    python benchmarks/run.py --emails 2000 --output bench.json
+    python benchmarks/run.py --only regex decode
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from benchmarks.corpus import make_corpus
+from benchmarks.fake_bigquery import FakeBigQueryClient
+from benchmarks.fake_gmail import FakeGmailService, make_message
+
+
+def timed(func: Callable[[], Any], emails: int, repeat: int = 3) -> Dict[str, Any]:
+    """
+    Time a function over the corpus, keeping the best of several runs.
+
+    Args:
+        func: Function processing the whole corpus once
+        emails: Number of emails processed per call
+        repeat: Number of runs
+
+    Returns:
+        Result dictionary with the best time and throughput
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    return {
+        'emails': emails,
+        'seconds': round(best, 6),
+        'emails_per_second': round(emails / best, 1) if best else None,
+        'runs': [round(timing, 6) for timing in timings],
+    }
+
+
+def bench_regex(corpus: List[Dict[str, Any]], args) -> Dict[str, Any]:
+    """extract_info_regex over every body."""
+    from email_parser import EmailParser
+
+    email_parser = EmailParser()
+    bodies = [email['body'] for email in corpus]
+    return timed(lambda: [email_parser.extract_info_regex(body) for body in bodies], len(bodies), args.repeat)
+
+
+def bench_decode(corpus: List[Dict[str, Any]], args) -> Dict[str, Any]:
+    """Body decoding of Gmail API message resources."""
+    from gmail_client import get_email_body
+
+    messages = [make_message(email['id'], email['body']) for email in corpus]
+    return timed(lambda: [get_email_body(message) for message in messages], len(messages), args.repeat)
+
+
+def bench_rows(corpus: List[Dict[str, Any]], args) -> Dict[str, Any]:
+    """Row building and sizing done by BigQueryClient.add_row, without any flush."""
+    from bigquery_client import BigQueryClient
+    from email_parser import EmailParser
+    from field_registry import empty_ai_result
+
+    email_parser = EmailParser()
+    regex_results = [email_parser.extract_info_regex(email['body']) for email in corpus]
+    ai_data = empty_ai_result()
+    client = BigQueryClient(client=FakeBigQueryClient())
+    client.buffer_rows = client.buffer_bytes = float('inf')
+
+    def build():
+        for email, regex_data in zip(corpus, regex_results):
+            client.add_row(email, regex_data, ai_data)
+        client._buffer, client._buffer_size = [], 0
+
+    return timed(build, len(corpus), args.repeat)
+
+
+def bench_end_to_end(corpus: List[Dict[str, Any]], args) -> Dict[str, Any]:
+    """Gmail fetch, parse, AI and BigQuery write against the in-process fakes."""
+    from benchmarks.fake_openai import FakeCompletionServer
+    from bigquery_client import BigQueryClient
+    from email_classifier import EmailClassifier
+    from email_parser import EmailParser
+    from gmail_client import GmailClient
+    from metrics import METRICS
+    from runner import run_pipeline
+
+    messages = [make_message(email['id'], email['body'], subject=email['subject'], date=email['date'])
+                for email in corpus]
+
+    with FakeCompletionServer(latency=args.ai_latency) as server:
+        # The fake server has no quota, so the client-side rate limits are lifted too.
+        settings = {'OPENAI_API_KEY': 'bench-key', 'OPENAI_BASE_URL': server.base_url, 'OPENAI_CACHE_FILE': '',
+                    'OPENAI_RPM': '1000000', 'OPENAI_TPM': '1000000000'}
+        saved = {name: os.environ.get(name) for name in settings}
+        os.environ.update(settings)
+        try:
+            email_parser = EmailParser()
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+        gmail_client = GmailClient(service=FakeGmailService(messages, latency=args.gmail_latency))
+        fake_bigquery = FakeBigQueryClient(latency=args.bigquery_latency)
+        bigquery_client = BigQueryClient(client=fake_bigquery)
+
+        METRICS.reset()
+        start = time.perf_counter()
+        pipeline = run_pipeline(gmail_client.iter_emails(days=1), email_parser, EmailClassifier(), bigquery_client)
+        elapsed = time.perf_counter() - start
+
+    return {
+        'emails': len(corpus),
+        'seconds': round(elapsed, 6),
+        'emails_per_second': round(len(corpus) / elapsed, 1) if elapsed else None,
+        'ai_requests': email_parser.requests_made,
+        'bigquery_insert_calls': bigquery_client.insert_calls,
+        'rows_written': len(fake_bigquery.table_rows[bigquery_client.table_id]),
+        'stages': {stats.name: stats.as_dict() for stats in pipeline.stats},
+        'operations': METRICS.summary(),
+    }
+
+
+BENCHMARKS = {
+    'regex': bench_regex,
+    'decode': bench_decode,
+    'rows': bench_rows,
+    'end_to_end': bench_end_to_end,
+}
+
+
+def git_commit() -> str:
+    """Commit of the working tree, or '' outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run_benchmarks(args) -> Dict[str, Any]:
+    """
+    Run the selected benchmarks.
+
+    Args:
+        args: Parsed command line options
+
+    Returns:
+        JSON-serializable results with the run metadata
+    """
+    corpus = make_corpus(args.emails, seed=args.seed)
+    results = {name: BENCHMARKS[name](corpus, args) for name in args.only}
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'seed': args.seed,
+        'emails': args.emails,
+        'results': results,
+    }
+
+
+def parse_args(argv=None):
+    """Parse the command line options."""
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and print JSON results")
+    parser.add_argument("--emails", type=int, default=2000, help="Number of synthetic emails")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the corpus")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per micro-benchmark; the best is kept")
+    parser.add_argument("--only", nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help="Benchmarks to run")
+    parser.add_argument("--gmail-latency", type=float, default=0.01, help="Fake Gmail round-trip latency")
+    parser.add_argument("--ai-latency", type=float, default=0.02, help="Fake OpenAI response latency")
+    parser.add_argument("--bigquery-latency", type=float, default=0.01, help="Fake BigQuery insert latency")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main():
+    """Run the benchmarks and write the results."""
+    args = parse_args()
+    results = json.dumps(run_benchmarks(args), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(results + '\n')
+    else:
+        print(results)
+
+
+if __name__ == "__main__":
+    main()
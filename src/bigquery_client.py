@@ -2,79 +2,348 @@
 BigQuery client for storing extracted email information.
 """
 import os
-from typing import Dict, Any, List
+import json
+import hashlib
+import logging
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Iterator, List, Tuple
 from google.cloud import bigquery
 from dotenv import load_dotenv
 
+from field_registry import FIELDS, RAW_FIELDS, build_raw_row, build_row
+from row_stager import NDJSON, RowStager
+from metadata_cache import MetadataCache
+from metrics import METRICS
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+def _build_schema(fields) -> List[bigquery.SchemaField]:
+    return [bigquery.SchemaField(spec.column, spec.bq_type, mode=spec.mode, description=spec.description)
+            for spec in fields]
+
+SCHEMA = _build_schema(FIELDS)
+RAW_SCHEMA = _build_schema(RAW_FIELDS)
+
+# Dashboards filter on the received day and on company or prefecture, so the
+# table is partitioned by day on received_date and clustered on those columns.
+PARTITION_FIELD = 'received_date'
+CLUSTERING_FIELDS = ['company_name', 'prefecture']
+RAW_CLUSTERING_FIELDS = ['email_id']
+
+# Tables created before the raw table existed keep the bodies in this column
+# until --migrate-table moves them.
+LEGACY_BODY_COLUMN = 'email_body'
+
+def schema_version(schema: List[bigquery.SchemaField], clustering_fields: List[str]) -> str:
+    """
+    Get a short fingerprint of a table layout, recorded in the metadata cache.
+    
+    Args:
+        schema: Schema of the table
+        clustering_fields: Columns the table is clustered on
+        
+    Returns:
+        First 16 hex digits of the SHA-256 of the layout
+    """
+    layout = [[field.name, field.field_type, field.mode] for field in schema]
+    layout.append([PARTITION_FIELD] + list(clustering_fields))
+    return hashlib.sha256(json.dumps(layout).encode('utf-8')).hexdigest()[:16]
+
+# Streaming insert limits: BigQuery recommends at most 500 rows per request and
+# rejects requests over 10 MB, so chunks stay a little below that.
+MAX_ROWS_PER_REQUEST = 500
+MAX_BYTES_PER_REQUEST = 9 * 1024 * 1024
+
 class BigQueryClient:
     """Client for interacting with BigQuery."""
     
-    def __init__(self):
-        """Initialize the BigQuery client."""
+    def __init__(self, client=None, load_mode: str = 'stream', upsert: bool = False,
+                 metadata_cache: MetadataCache = None):
+        """
+        Initialize the BigQuery client.
+        
+        Args:
+            client: Pre-built google.cloud.bigquery client. Built from the
+                environment on first use when omitted.
+            load_mode: 'stream' for streaming inserts, or 'batch' to stage rows
+                in local files and submit load jobs when the client is closed
+            upsert: Stage rows in files, load them into a temporary table and
+                MERGE them into the table on email_id when the client is closed
+            metadata_cache: Cache of known datasets and table schema versions
+                that lets repeated runs skip the existence checks
+        
+        Every email is written as two rows: the extracted fields go to the
+        table and the raw body to the raw table (``<table>_raw`` by default),
+        both linked by email_id and written in the same flush.
+        """
+        if load_mode not in ('stream', 'batch'):
+            raise ValueError(f"Unsupported load mode: {load_mode}")
+        
         self.project_id = os.getenv('BIGQUERY_PROJECT_ID', '')
         self.dataset_id = os.getenv('BIGQUERY_DATASET_ID', 'email_data')
         self.table_id = os.getenv('BIGQUERY_TABLE_ID', 'extracted_info')
-        self.client = bigquery.Client(project=self.project_id)
+        self.raw_table_id = os.getenv('BIGQUERY_RAW_TABLE_ID', f"{self.table_id}_raw")
+        self._client = client
+        self.metadata_cache = metadata_cache
+        self.body_compression = os.getenv('BIGQUERY_BODY_COMPRESSION') or None
+        
+        self.buffer_rows = int(os.getenv('BIGQUERY_BUFFER_ROWS', '500'))
+        self.buffer_bytes = int(os.getenv('BIGQUERY_BUFFER_BYTES', str(5 * 1024 * 1024)))
+        self.insert_retries = int(os.getenv('BIGQUERY_INSERT_RETRIES', '3'))
+        self.retry_base_delay = float(os.getenv('BIGQUERY_RETRY_BASE_DELAY', '0.5'))
+        self.insert_calls = 0
+        self.failed_rows = 0
+        self._buffer = []
+        self._buffer_size = 0
+        self._lock = threading.Lock()
+        
+        self.load_mode = load_mode
+        self.upsert = upsert
+        self.load_jobs = 0
+        self.merged_rows = 0
+        self._received_range = None
+        self.stager = None
+        self.raw_stager = None
+        # RowStager is not thread-safe; concurrent write workers take turns.
+        self._stage_lock = threading.Lock()
+        if load_mode == 'batch' or upsert:
+            stage_dir = os.getenv('BIGQUERY_STAGE_DIR', 'bq_staging')
+            file_format = os.getenv('BIGQUERY_LOAD_FORMAT', NDJSON)
+            max_file_rows = int(os.getenv('BIGQUERY_LOAD_FILE_ROWS', '1000000'))
+            self.stager = RowStager(stage_dir, file_format=file_format, max_file_rows=max_file_rows)
+            self.raw_stager = RowStager(stage_dir, file_format=file_format, max_file_rows=max_file_rows,
+                                        fields=RAW_FIELDS, prefix='raw')
+    
+    @property
+    def client(self):
+        """The google.cloud.bigquery client, authenticated on first use."""
+        if self._client is None:
+            self._client = bigquery.Client(project=self.project_id)
+        return self._client
+    
+    @property
+    def table_ref(self) -> bigquery.TableReference:
+        return self.client.dataset(self.dataset_id).table(self.table_id)
+    
+    @property
+    def raw_table_ref(self) -> bigquery.TableReference:
+        return self.client.dataset(self.dataset_id).table(self.raw_table_id)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
         
     def create_dataset_if_not_exists(self):
         """Create the dataset if it doesn't exist."""
+        cache_key = f"{self.project_id}.{self.dataset_id}"
+        if self.metadata_cache and self.metadata_cache.has_dataset(cache_key):
+            return
+        
         dataset_ref = self.client.dataset(self.dataset_id)
         
         try:
             self.client.get_dataset(dataset_ref)
-            print(f"Dataset {self.dataset_id} already exists")
+            logger.info("Dataset %s already exists", self.dataset_id)
         except Exception:
             dataset = bigquery.Dataset(dataset_ref)
             dataset.location = "asia-northeast1"  # Tokyo region
             dataset = self.client.create_dataset(dataset)
-            print(f"Dataset {self.dataset_id} created")
+            logger.info("Dataset %s created", self.dataset_id)
+        
+        if self.metadata_cache:
+            self.metadata_cache.add_dataset(cache_key)
     
     def create_table_if_not_exists(self):
-        """Create the table if it doesn't exist."""
-        dataset_ref = self.client.dataset(self.dataset_id)
-        table_ref = dataset_ref.table(self.table_id)
+        """Create the table and the raw table if they don't exist, or add columns missing from them."""
+        table = self._create_or_update_table(self.table_id, SCHEMA, CLUSTERING_FIELDS)
+        if table is not None and not self._is_partitioned(table):
+            logger.warning("Table %s is not partitioned by %s; "
+                           "run with --migrate-table to rebuild it partitioned and clustered",
+                           self.table_id, PARTITION_FIELD)
+        if table is not None and self._has_legacy_body(table):
+            logger.warning("Table %s still has the %s column; "
+                           "run with --migrate-table to move the bodies into %s",
+                           self.table_id, LEGACY_BODY_COLUMN, self.raw_table_id)
+        
+        self._create_or_update_table(self.raw_table_id, RAW_SCHEMA, RAW_CLUSTERING_FIELDS)
+    
+    def _create_or_update_table(self, table_id: str, schema: List[bigquery.SchemaField],
+                                clustering_fields: List[str]):
+        """
+        Create a partitioned, clustered table, or add missing columns to an existing one.
+        
+        Tables the metadata cache records at the current schema version are
+        not looked up at all.
+        
+        Args:
+            table_id: Id of the table in the dataset
+            schema: Schema of the table
+            clustering_fields: Columns the table is clustered on
+            
+        Returns:
+            The existing table, or None if it was created or is known to be current
+        """
+        cache_key = f"{self.project_id}.{self.dataset_id}.{table_id}"
+        version = schema_version(schema, clustering_fields)
+        if self.metadata_cache and self.metadata_cache.table_version(cache_key) == version:
+            return None
+        
+        table = self._get_or_create_table(table_id, schema, clustering_fields)
+        if self.metadata_cache:
+            self.metadata_cache.set_table_version(cache_key, version)
+        return table
+    
+    def _get_or_create_table(self, table_id: str, schema: List[bigquery.SchemaField],
+                             clustering_fields: List[str]):
+        """
+        Look up a table, creating it or adding missing columns as needed.
+        
+        Args:
+            table_id: Id of the table in the dataset
+            schema: Schema of the table
+            clustering_fields: Columns the table is clustered on
+            
+        Returns:
+            The existing table, or None if it was created
+        """
+        table_ref = self.client.dataset(self.dataset_id).table(table_id)
         
         try:
-            self.client.get_table(table_ref)
-            print(f"Table {self.table_id} already exists")
+            table = self.client.get_table(table_ref)
         except Exception:
-            schema = [
-                bigquery.SchemaField("email_id", "STRING", mode="REQUIRED", description="Email ID"),
-                bigquery.SchemaField("subject", "STRING", description="Email subject"),
-                bigquery.SchemaField("from_email", "STRING", description="Sender email"),
-                bigquery.SchemaField("to_email", "STRING", description="Recipient email"),
-                bigquery.SchemaField("received_date", "TIMESTAMP", description="Date email was received"),
-                bigquery.SchemaField("processed_date", "TIMESTAMP", description="Date email was processed"),
-                
-                bigquery.SchemaField("company_name", "STRING", description="法人名"),
-                bigquery.SchemaField("url", "STRING", description="URL"),
-                bigquery.SchemaField("industry", "STRING", description="業界"),
-                bigquery.SchemaField("established_year", "STRING", description="設立年"),
-                bigquery.SchemaField("capital", "STRING", description="資本金"),
-                bigquery.SchemaField("revenue", "STRING", description="売上"),
-                bigquery.SchemaField("fiscal_year_end", "STRING", description="決算月"),
-                bigquery.SchemaField("employee_count", "STRING", description="社員数"),
-                bigquery.SchemaField("prefecture", "STRING", description="所在地（都道府県）"),
-                bigquery.SchemaField("nearest_station", "STRING", description="最寄り駅"),
-                bigquery.SchemaField("company_overview", "STRING", description="法人概要"),
-                
-                bigquery.SchemaField("project_type", "STRING", description="案件種別"),
-                bigquery.SchemaField("contract_type", "STRING", description="契約形態"),
-                bigquery.SchemaField("ai_industry", "STRING", description="業界 (AI抽出)"),
-                bigquery.SchemaField("technologies", "STRING", description="使用技術"),
-                bigquery.SchemaField("data_types", "STRING", description="使用データ"),
-                bigquery.SchemaField("tools_platforms", "STRING", description="使用ツール・基盤"),
-                bigquery.SchemaField("project_phases", "STRING", description="担当フェーズ"),
-                bigquery.SchemaField("roles", "STRING", description="担当役割"),
-                
-                bigquery.SchemaField("email_body", "STRING", description="Raw email body")
-            ]
-            
             table = bigquery.Table(table_ref, schema=schema)
-            table = self.client.create_table(table)
-            print(f"Table {self.table_id} created")
+            table.time_partitioning = bigquery.TimePartitioning(
+                type_=bigquery.TimePartitioningType.DAY, field=PARTITION_FIELD
+            )
+            table.clustering_fields = clustering_fields
+            self.client.create_table(table)
+            logger.info("Table %s created", table_id)
+            return None
+        
+        logger.info("Table %s already exists", table_id)
+        self._add_missing_columns(table, schema)
+        return table
+    
+    @staticmethod
+    def _is_partitioned(table: bigquery.Table) -> bool:
+        """
+        Check whether a table is partitioned on received_date.
+        
+        Args:
+            table: The existing BigQuery table
+            
+        Returns:
+            True if the table is time-partitioned on PARTITION_FIELD
+        """
+        return bool(table.time_partitioning) and table.time_partitioning.field == PARTITION_FIELD
+    
+    @staticmethod
+    def _has_legacy_body(table: bigquery.Table) -> bool:
+        """
+        Check whether a table still stores the bodies in the email_body column.
+        
+        Args:
+            table: The existing BigQuery table
+            
+        Returns:
+            True if the table has the LEGACY_BODY_COLUMN column
+        """
+        return any(field.name == LEGACY_BODY_COLUMN for field in table.schema)
+    
+    def migrate_table(self) -> bool:
+        """
+        Rebuild an existing table partitioned on received_date and clustered.
+        
+        BigQuery cannot partition a table in place, so the rows are copied into
+        a new partitioned and clustered table that then takes over the table's
+        name. The old table is kept under a ``_unpartitioned_<date>`` name so
+        it can be checked and dropped by hand. A table that is already
+        partitioned only has its clustering updated, which applies to rows
+        written from then on.
+        
+        A table that still has the email_body column first has its bodies
+        copied into the raw table (skipping emails already there), and the
+        column is then left out of the rebuilt table, or dropped from an
+        already partitioned one.
+        
+        Streaming inserts should be stopped while the migration runs, since
+        rows still in the streaming buffer are not copied.
+        
+        Returns:
+            True if the table was rebuilt or updated, False if nothing changed
+        """
+        table = self.client.get_table(self.table_ref)
+        has_body = self._has_legacy_body(table)
+        dataset = f"`{self.client.project}.{self.dataset_id}"
+        script = []
+        if has_body:
+            self._create_or_update_table(self.raw_table_id, RAW_SCHEMA, RAW_CLUSTERING_FIELDS)
+            script.append(
+                f"INSERT INTO {dataset}.{self.raw_table_id}` (email_id, received_date, body, body_sha256)\n"
+                f"SELECT email_id, received_date, {LEGACY_BODY_COLUMN}, TO_HEX(SHA256({LEGACY_BODY_COLUMN}))\n"
+                f"FROM {dataset}.{self.table_id}`\n"
+                f"WHERE {LEGACY_BODY_COLUMN} IS NOT NULL\n"
+                f"AND email_id NOT IN (SELECT email_id FROM {dataset}.{self.raw_table_id}`);"
+            )
+        
+        if self._is_partitioned(table):
+            clustered = list(table.clustering_fields or []) == CLUSTERING_FIELDS
+            if clustered and not has_body:
+                logger.info("Table %s is already partitioned and clustered", self.table_id)
+                return False
+            if not clustered:
+                table.clustering_fields = CLUSTERING_FIELDS
+                self.client.update_table(table, ['clustering_fields'])
+                logger.info("Updated clustering of %s to %s", self.table_id, ', '.join(CLUSTERING_FIELDS))
+            if has_body:
+                script.append(f"ALTER TABLE {dataset}.{self.table_id}` DROP COLUMN {LEGACY_BODY_COLUMN};")
+                self.client.query('\n'.join(script)).result()
+                logger.info("Moved %s of %s into %s", LEGACY_BODY_COLUMN, self.table_id, self.raw_table_id)
+            return True
+        
+        self._add_missing_columns(table)
+        new_id = f"{self.table_id}_partitioned"
+        backup_id = f"{self.table_id}_unpartitioned_{datetime.now(timezone.utc):%Y%m%d}"
+        columns = f"* EXCEPT ({LEGACY_BODY_COLUMN})" if has_body else "*"
+        
+        script.append(
+            f"CREATE TABLE {dataset}.{new_id}`\n"
+            f"PARTITION BY DATE({PARTITION_FIELD})\n"
+            f"CLUSTER BY {', '.join(CLUSTERING_FIELDS)}\n"
+            f"AS SELECT {columns} FROM {dataset}.{self.table_id}`;\n"
+            f"ALTER TABLE {dataset}.{self.table_id}` RENAME TO {backup_id};\n"
+            f"ALTER TABLE {dataset}.{new_id}` RENAME TO {self.table_id};"
+        )
+        self.client.query('\n'.join(script)).result()
+        logger.info("Rebuilt %s partitioned by %s; previous table kept as %s", self.table_id, PARTITION_FIELD, backup_id)
+        if has_body:
+            logger.info("Moved %s of %s into %s", LEGACY_BODY_COLUMN, self.table_id, self.raw_table_id)
+        return True
+    
+    def _add_missing_columns(self, table: bigquery.Table, schema: List[bigquery.SchemaField] = SCHEMA) -> None:
+        """
+        Append registry columns that an existing table does not have yet.
+        
+        Args:
+            table: The existing BigQuery table
+            schema: Schema the table should have
+        """
+        existing = {field.name for field in table.schema}
+        missing = [field for field in schema if field.name not in existing]
+        if not missing:
+            return
+        
+        table.schema = list(table.schema) + missing
+        self.client.update_table(table, ['schema'])
+        logger.info("Added columns to %s: %s", table.table_id, ', '.join(field.name for field in missing))
     
     def insert_data(self, email_data: Dict[str, Any], regex_data: Dict[str, Any], ai_data: Dict[str, Any]) -> bool:
         """
@@ -88,47 +357,254 @@ class BigQueryClient:
         Returns:
             True if successful, False otherwise
         """
-        from datetime import datetime
-        
-        row = {
-            "email_id": email_data.get('id', ''),
-            "subject": email_data.get('subject', ''),
-            "from_email": email_data.get('from', ''),
-            "to_email": email_data.get('to', ''),
-            "received_date": email_data.get('date', ''),
-            "processed_date": datetime.now().isoformat(),
-            
-            "company_name": regex_data.get('company_name', ''),
-            "url": regex_data.get('url', ''),
-            "industry": regex_data.get('industry', ''),
-            "established_year": regex_data.get('established_year', ''),
-            "capital": regex_data.get('capital', ''),
-            "revenue": regex_data.get('revenue', ''),
-            "fiscal_year_end": regex_data.get('fiscal_year_end', ''),
-            "employee_count": regex_data.get('employee_count', ''),
-            "prefecture": regex_data.get('prefecture', ''),
-            "nearest_station": regex_data.get('nearest_station', ''),
-            "company_overview": regex_data.get('company_overview', ''),
-            
-            "project_type": ai_data.get('project_type', ''),
-            "contract_type": ai_data.get('contract_type', ''),
-            "ai_industry": ai_data.get('industry', ''),
-            "technologies": ai_data.get('technologies', ''),
-            "data_types": ai_data.get('data_types', ''),
-            "tools_platforms": ai_data.get('tools_platforms', ''),
-            "project_phases": ai_data.get('project_phases', ''),
-            "roles": ai_data.get('roles', ''),
-            
-            "email_body": email_data.get('body', '')
-        }
-        
-        table_ref = self.client.dataset(self.dataset_id).table(self.table_id)
-        errors = self.client.insert_rows_json(table_ref, [row])
-        
-        if errors:
-            print(f"Errors inserting row: {errors}")
-            return False
+        row = build_row(email_data, regex_data, ai_data)
+        raw_row = build_raw_row(email_data, self.body_compression)
+        
+        inserted = self.insert_batch_data([row])
+        raw_inserted = self._insert_sized_rows([(raw_row, self._row_size(raw_row))], self.raw_table_ref)
+        return inserted and raw_inserted
+    
+    def add_row(self, email_data: Dict[str, Any], regex_data: Dict[str, Any], ai_data: Dict[str, Any]) -> None:
+        """
+        Buffer extracted data and flush once the buffer reaches its row or byte threshold.
+        
+        Args:
+            email_data: Email metadata
+            regex_data: Data extracted using regex
+            ai_data: Data extracted using AI
+        """
+        row = build_row(email_data, regex_data, ai_data)
+        raw_row = build_raw_row(email_data, self.body_compression)
+        size = self._row_size(row)
+        raw_size = self._row_size(raw_row)
+        received = row[PARTITION_FIELD]
         
+        with self._lock:
+            self._buffer.append((row, size, raw_row, raw_size))
+            self._buffer_size += size + raw_size
+            if received:
+                if self._received_range is None:
+                    self._received_range = (received, received)
+                else:
+                    low, high = self._received_range
+                    self._received_range = (min(low, received), max(high, received))
+            full = len(self._buffer) >= self.buffer_rows or self._buffer_size >= self.buffer_bytes
+        
+        if full:
+            self.flush()
+    
+    def flush(self) -> bool:
+        """
+        Insert every buffered row into the table and the raw table, or append
+        them to the staging files in batch mode.
+        
+        Returns:
+            True if all buffered rows were inserted, False otherwise
+        """
+        with self._lock:
+            buffered, self._buffer, self._buffer_size = self._buffer, [], 0
+        
+        if not buffered:
+            return True
+        
+        if self.stager:
+            with self._stage_lock:
+                self.stager.write_rows([row for row, _, _, _ in buffered])
+                self.raw_stager.write_rows([raw_row for _, _, raw_row, _ in buffered])
+            return True
+        
+        inserted = self._insert_sized_rows([(row, size) for row, size, _, _ in buffered])
+        raw_inserted = self._insert_sized_rows([(raw_row, raw_size) for _, _, raw_row, raw_size in buffered],
+                                               self.raw_table_ref)
+        return inserted and raw_inserted
+    
+    def close(self) -> bool:
+        """
+        Flush buffered rows and load every staged file.
+        
+        In batch mode the files are loaded straight into the table. In upsert
+        mode they are loaded into a temporary staging table that is merged
+        into the table with a single MERGE statement.
+        
+        Returns:
+            True if all rows were written, False otherwise
+        """
+        success = self._close_stagers()
+        with self._lock:
+            # The next MERGE only needs to cover the rows added after this one.
+            self._received_range = None
+        if not success and self.metadata_cache:
+            # A table may have been dropped or changed behind our back.
+            self.metadata_cache.clear()
+        return success
+    
+    def _close_stagers(self) -> bool:
+        """
+        Flush buffered rows and load or merge every staged file.
+        
+        Returns:
+            True if all rows were written, False otherwise
+        """
+        success = self.flush()
+        if not self.stager:
+            return success
+        
+        for stager, table_id, schema in ((self.stager, self.table_id, SCHEMA),
+                                         (self.raw_stager, self.raw_table_id, RAW_SCHEMA)):
+            with self._stage_lock:
+                staged_files = stager.close()
+                stager.files = []
+            if not staged_files:
+                continue
+            
+            if self.upsert:
+                success = self._upsert_files(staged_files, table_id, schema) and success
+                continue
+            
+            destination = self.client.dataset(self.dataset_id).table(table_id)
+            for staged in staged_files:
+                success = self._load_file(staged['path'], staged['rows'], destination, schema) and success
+        
+        return success
+    
+    def _upsert_files(self, staged_files: List[Dict[str, Any]], table_id: str,
+                      schema: List[bigquery.SchemaField]) -> bool:
+        """
+        Load staged files into a temporary table and MERGE it into a table.
+        
+        Args:
+            staged_files: {'path', 'rows'} dictionaries from the stager
+            table_id: Id of the table to merge into
+            schema: Schema of that table
+            
+        Returns:
+            True if every file was loaded and merged, False otherwise
+        """
+        staging_id = f"{table_id}_staging_{uuid.uuid4().hex[:12]}"
+        staging_ref = self.client.dataset(self.dataset_id).table(staging_id)
+        
+        staging_table = bigquery.Table(staging_ref, schema=schema)
+        staging_table.expires = datetime.now(timezone.utc) + timedelta(days=1)
+        self.client.create_table(staging_table)
+        
+        try:
+            loaded = [staged for staged in staged_files
+                      if self._load_file(staged['path'], staged['rows'], staging_ref, schema, keep=True)]
+            if not loaded:
+                return False
+            
+            with METRICS.timed('bigquery_merge') as counts:
+                try:
+                    job = self.client.query(self._merge_sql(staging_id, table_id, schema))
+                    job.result()
+                except Exception as e:
+                    logger.error("Error merging %s into %s, keeping %s for a retry: %s", staging_id, table_id,
+                                 ', '.join(staged['path'] for staged in loaded), e)
+                    counts['errors'] = 1
+                    with self._lock:
+                        self.failed_rows += sum(staged['rows'] for staged in loaded)
+                    return False
+                counts['bytes'] = getattr(job, 'total_bytes_processed', None) or 0
+            
+            for staged in loaded:
+                os.remove(staged['path'])
+            if table_id == self.table_id:
+                self.merged_rows += job.num_dml_affected_rows or 0
+            logger.info("Merged %s rows into %s", job.num_dml_affected_rows, table_id)
+            return len(loaded) == len(staged_files)
+        finally:
+            self.client.delete_table(staging_ref, not_found_ok=True)
+    
+    def _merge_sql(self, staging_id: str, table_id: str = None, schema: List[bigquery.SchemaField] = SCHEMA) -> str:
+        """
+        Build the MERGE statement that upserts a staging table on email_id.
+        
+        Duplicate email_ids within the staging table are reduced to one row
+        first, the most recently processed one when the table records it. The
+        target is restricted to the range of received dates seen in this run
+        (plus the NULL partition), so BigQuery only scans the partitions the
+        staged rows can match.
+        
+        Args:
+            staging_id: Table id of the staging table
+            table_id: Id of the table to merge into, the table by default
+            schema: Schema shared by both tables
+            
+        Returns:
+            The MERGE statement
+        """
+        table_id = table_id or self.table_id
+        dataset = f"`{self.client.project}.{self.dataset_id}"
+        columns = [field.name for field in schema]
+        updates = ', '.join(f"{column} = S.{column}" for column in columns if column != 'email_id')
+        insert_columns = ', '.join(columns)
+        insert_values = ', '.join(f"S.{column}" for column in columns)
+        window = 'PARTITION BY email_id'
+        if 'processed_date' in columns:
+            window += ' ORDER BY processed_date DESC'
+        prune = ''
+        if self._received_range:
+            low, high = self._received_range
+            prune = (f" AND (T.{PARTITION_FIELD} BETWEEN TIMESTAMP('{low}') AND TIMESTAMP('{high}')"
+                     f" OR T.{PARTITION_FIELD} IS NULL)")
+        
+        return (
+            f"MERGE {dataset}.{table_id}` T\n"
+            f"USING (\n"
+            f"  SELECT * EXCEPT (_row_number) FROM (\n"
+            f"    SELECT *, ROW_NUMBER() OVER ({window}) AS _row_number\n"
+            f"    FROM {dataset}.{staging_id}`\n"
+            f"  ) WHERE _row_number = 1\n"
+            f") S\n"
+            f"ON T.email_id = S.email_id{prune}\n"
+            f"WHEN MATCHED THEN UPDATE SET {updates}\n"
+            f"WHEN NOT MATCHED THEN INSERT ({insert_columns}) VALUES ({insert_values})"
+        )
+    
+    def _load_file(self, path: str, rows: int, destination,
+                   schema: List[bigquery.SchemaField] = SCHEMA, keep: bool = False) -> bool:
+        """
+        Load one staged file with a single load job.
+        
+        The file is removed after a successful load and kept for a manual
+        retry otherwise.
+        
+        Args:
+            path: Path of the staged file
+            rows: Number of rows in the file
+            destination: Reference of the table to load into
+            schema: Schema of that table
+            keep: Keep the file after a successful load too, for loads into
+                a staging table whose rows are only safe once merged
+            
+        Returns:
+            True if the load job succeeded, False otherwise
+        """
+        source_format = (bigquery.SourceFormat.PARQUET if path.endswith('.parquet')
+                         else bigquery.SourceFormat.NEWLINE_DELIMITED_JSON)
+        job_config = bigquery.LoadJobConfig(
+            source_format=source_format,
+            schema=schema,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND
+        )
+        
+        with METRICS.timed('bigquery_load') as counts:
+            counts['bytes'] = os.path.getsize(path)
+            try:
+                with open(path, 'rb') as f:
+                    job = self.client.load_table_from_file(f, destination, job_config=job_config)
+                self.load_jobs += 1
+                job.result()
+            except Exception as e:
+                logger.error("Error loading %s (%d rows): %s", path, rows, e)
+                counts['errors'] = 1
+                with self._lock:
+                    self.failed_rows += rows
+                return False
+        
+        logger.info("Loaded %d rows from %s", rows, path)
+        if not keep:
+            os.remove(path)
         return True
     
     def insert_batch_data(self, rows: List[Dict[str, Any]]) -> bool:
@@ -141,11 +617,118 @@ class BigQueryClient:
         Returns:
             True if successful, False otherwise
         """
-        table_ref = self.client.dataset(self.dataset_id).table(self.table_id)
-        errors = self.client.insert_rows_json(table_ref, rows)
+        return self._insert_sized_rows([(row, self._row_size(row)) for row in rows])
+    
+    @staticmethod
+    def _row_size(row: Dict[str, Any]) -> int:
+        """Size of a row encoded as JSON, as counted against the request limits."""
+        return len(json.dumps(row, ensure_ascii=False).encode('utf-8'))
+    
+    def _insert_sized_rows(self, sized_rows: List[tuple], table_ref=None) -> bool:
+        """
+        Insert (row, size) pairs in chunks that respect the streaming API limits.
         
-        if errors:
-            print(f"Errors inserting rows: {errors}")
-            return False
+        Args:
+            sized_rows: Rows paired with their encoded JSON size
+            table_ref: Reference of the table to insert into, the table by default
+            
+        Returns:
+            True if every row was inserted, False otherwise
+        """
+        table_ref = table_ref or self.table_ref
+        failed = 0
+        for chunk, chunk_size in self._chunk_rows(sized_rows):
+            failed += self._insert_chunk(chunk, table_ref, chunk_size)
         
-        return True
+        with self._lock:
+            self.failed_rows += failed
+        return failed == 0
+    
+    def _chunk_rows(self, sized_rows: List[tuple]) -> Iterator[Tuple[List[Dict[str, Any]], int]]:
+        """
+        Split rows into request-sized chunks.
+        
+        Args:
+            sized_rows: Rows paired with their encoded JSON size
+            
+        Yields:
+            (rows, encoded size) of one insert request
+        """
+        chunk = []
+        chunk_size = 0
+        for row, size in sized_rows:
+            if chunk and (len(chunk) >= MAX_ROWS_PER_REQUEST or chunk_size + size > MAX_BYTES_PER_REQUEST):
+                yield chunk, chunk_size
+                chunk, chunk_size = [], 0
+            chunk.append(row)
+            chunk_size += size
+        if chunk:
+            yield chunk, chunk_size
+    
+    def _insert_chunk(self, rows: List[Dict[str, Any]], table_ref, size: int = 0) -> int:
+        """
+        Stream one chunk of rows, retrying only the rows that failed.
+        
+        Each row is sent with its email_id as insertId, so BigQuery drops
+        duplicates of rows resent shortly after a partial failure. Rows
+        rejected as invalid are dropped rather than retried, since resending
+        them cannot succeed. Retries wait with exponential backoff and jitter.
+        
+        Args:
+            rows: Rows for one insert request
+            table_ref: Reference of the table to insert into
+            size: Encoded size of the rows, recorded in the run metrics
+            
+        Returns:
+            Number of rows that could not be inserted
+        """
+        with METRICS.timed('bigquery_insert') as counts:
+            counts['bytes'] = size
+            pending = rows
+            dropped = 0
+            for attempt in range(self.insert_retries + 1):
+                with self._lock:
+                    self.insert_calls += 1
+                if attempt:
+                    counts['retries'] = attempt
+                    time.sleep(self._retry_delay(attempt - 1))
+                try:
+                    errors = self.client.insert_rows_json(table_ref, pending,
+                                                          row_ids=[row['email_id'] for row in pending])
+                except Exception as e:
+                    logger.warning("Error inserting %d rows (attempt %d): %s", len(pending), attempt + 1, e)
+                    counts['errors'] = counts.get('errors', 0) + 1
+                    continue
+                
+                counts['errors'] = counts.get('errors', 0) + len(errors)
+                retry = []
+                for error in errors:
+                    reasons = {detail.get('reason') for detail in error.get('errors', [])}
+                    if reasons == {'invalid'}:
+                        email_id = pending[error['index']].get('email_id')
+                        logger.warning("Dropping invalid row %s: %s", email_id, error['errors'],
+                                       extra={'email_id': email_id})
+                        dropped += 1
+                    else:
+                        retry.append(pending[error['index']])
+                
+                if not retry:
+                    return dropped
+                
+                logger.warning("Retrying %d of %d rows", len(retry), len(pending))
+                pending = retry
+            
+            logger.error("Errors inserting rows: giving up on %d rows", len(pending))
+            return dropped + len(pending)
+    
+    def _retry_delay(self, attempt: int) -> float:
+        """
+        Get the exponential backoff delay, with jitter, before the next insert attempt.
+        
+        Args:
+            attempt: Zero-based number of the failed attempt
+            
+        Returns:
+            Delay in seconds
+        """
+        return self.retry_base_delay * (2 ** attempt) * (1 + random.random())
@@ -0,0 +1,295 @@
+"""
+Long-running daemon that keeps the clients warm and polls Gmail for new mail.
+
+Unlike the daily schedule, which rebuilds and re-authenticates every client
+once a day, the daemon builds the Gmail, OpenAI and BigQuery clients once and
+then asks the Gmail history API for mail added since the last poll. The wait
+between polls adapts to the mailbox: it drops to the minimum as soon as a poll
+finds mail and grows geometrically towards the maximum while the mailbox is
+idle. SIGUSR1 triggers an immediate poll, so an external push-notification
+listener can wake the daemon. SIGTERM and SIGINT stop it after the current
+poll, with every buffered row written to BigQuery.
+"""
+import logging
+import os
+import signal
+import threading
+import time
+from datetime import datetime, timezone
+from itertools import chain, takewhile
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, Optional
+
+from email_classifier import EmailClassifier
+from gmail_client import GmailClient
+from message_cache import MessageCache
+from metadata_cache import MetadataCache
+from runner import run_pipeline, write_run_metrics
+from sync_state import SyncState
+
+if TYPE_CHECKING:
+    from email_parser import EmailParser
+    from bigquery_client import BigQueryClient
+
+logger = logging.getLogger(__name__)
+
+class AdaptiveInterval:
+    """Wait between polls: the minimum while mail flows, growing while idle."""
+
+    def __init__(self, min_interval: float = None, max_interval: float = None, backoff: float = None):
+        """
+        Initialize the interval.
+
+        Args:
+            min_interval: Seconds between polls while mail is arriving.
+                Defaults to DAEMON_MIN_INTERVAL or 30.
+            max_interval: Upper bound in seconds for an idle mailbox.
+                Defaults to DAEMON_MAX_INTERVAL or 900.
+            backoff: Factor the interval grows by after every empty poll.
+                Defaults to DAEMON_BACKOFF or 2.
+        """
+        self.min_interval = min_interval if min_interval is not None else float(os.getenv('DAEMON_MIN_INTERVAL', '30'))
+        self.max_interval = max_interval if max_interval is not None else float(os.getenv('DAEMON_MAX_INTERVAL', '900'))
+        self.backoff = backoff if backoff is not None else float(os.getenv('DAEMON_BACKOFF', '2'))
+        if self.max_interval < self.min_interval:
+            raise ValueError("DAEMON_MAX_INTERVAL must not be smaller than DAEMON_MIN_INTERVAL")
+        self.current = self.min_interval
+
+    def next(self, email_count: int) -> float:
+        """
+        Get the wait before the next poll.
+
+        Args:
+            email_count: Number of emails the last poll processed
+
+        Returns:
+            Seconds to wait
+        """
+        if email_count:
+            self.current = self.min_interval
+        else:
+            self.current = min(self.max_interval, self.current * self.backoff)
+        return self.current
+
+
+class Daemon:
+    """Polls Gmail with warm clients until it is stopped."""
+
+    def __init__(self, days: int = 1, ai_gating: bool = True, load_mode: str = 'stream', upsert: bool = False,
+                 workers: int = 1, cache_dir: str = None, interval: Optional[AdaptiveInterval] = None,
+                 gmail_client: Optional[GmailClient] = None, email_parser: 'EmailParser' = None,
+                 bigquery_client: 'BigQueryClient' = None, sync_state: Optional[SyncState] = None):
+        """
+        Initialize the daemon.
+
+        Clients that are not passed in are built on first use and kept for the
+        lifetime of the daemon.
+
+        Args:
+            days: Look-back window of the first poll when there is no history
+                checkpoint yet
+            ai_gating: Skip AI extraction for emails the classifier finds no 案件 in
+            load_mode: 'stream' for streaming inserts, 'batch' for file load jobs
+            upsert: MERGE the rows of every poll into the table on email_id
+            workers: Number of processes decoding bodies and running regex
+                extraction. Parsing stays in this process when 1.
+            cache_dir: Directory of the raw message cache. Disabled when None.
+            interval: Wait between polls. Defaults to AdaptiveInterval().
+            gmail_client: Pre-built Gmail client
+            email_parser: Pre-built parser
+            bigquery_client: Pre-built BigQuery client
+            sync_state: History checkpoint store. Defaults to SyncState().
+        """
+        self.days = days
+        self.load_mode = load_mode
+        self.upsert = upsert
+        self.workers = workers
+        self.interval = interval or AdaptiveInterval()
+        self.classifier = EmailClassifier() if ai_gating else None
+        self.sync_state = sync_state or SyncState()
+        if gmail_client is None:
+            gmail_client = GmailClient(cache=MessageCache(cache_dir) if cache_dir else None)
+            gmail_client.decode_bodies = workers <= 1
+        self.gmail_client = gmail_client
+        self._email_parser = email_parser
+        self._bigquery_client = bigquery_client
+        self._table_ready = False
+        self._history_id = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self.polls = 0
+        self.emails = 0
+        self.failed_rows = 0
+        self.last_failed_rows = 0
+
+    @property
+    def email_parser(self) -> 'EmailParser':
+        """The parser, built with its OpenAI client on first use."""
+        if self._email_parser is None:
+            from email_parser import EmailParser
+            self._email_parser = EmailParser()
+        return self._email_parser
+
+    @property
+    def bigquery_client(self) -> 'BigQueryClient':
+        """The BigQuery client, with the dataset and table created on first use."""
+        if self._bigquery_client is None:
+            from bigquery_client import BigQueryClient
+            self._bigquery_client = BigQueryClient(load_mode=self.load_mode, upsert=self.upsert,
+                                                   metadata_cache=MetadataCache())
+        if not self._table_ready:
+            self._bigquery_client.create_dataset_if_not_exists()
+            self._bigquery_client.create_table_if_not_exists()
+            self._table_ready = True
+        return self._bigquery_client
+
+    @property
+    def stopping(self) -> bool:
+        """Whether a stop has been requested."""
+        return self._stop.is_set()
+
+    def stop(self) -> None:
+        """Ask the daemon to exit once the current poll has written its rows."""
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self) -> None:
+        """Start the next poll now instead of waiting out the interval."""
+        self._wake.set()
+
+    def _until_stopped(self, emails: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Stop fetching once a stop is requested; emails already fetched are still written."""
+        return takewhile(lambda _: not self._stop.is_set(), emails)
+
+    def poll(self) -> int:
+        """
+        Process the mail added since the previous poll.
+
+        The history checkpoint only advances when every email was fetched and
+        written, so a poll cut short by a stop, by messages that could not be
+        fetched or by failed inserts is repeated from the same point by the
+        next poll.
+
+        Returns:
+            Number of emails processed
+        """
+        if self._history_id is None:
+            self._history_id = self.sync_state.load_history_id()
+        latest_history_id = self.gmail_client.get_history_id()
+        failed_fetches_before = self.gmail_client.failed_fetches
+
+        if self._history_id:
+            emails = self.gmail_client.iter_emails_since(self._history_id, days=self.days)
+        else:
+            logger.info("No history checkpoint, fetching emails of the last %d days", self.days)
+            emails = self.gmail_client.iter_emails(days=self.days)
+
+        emails = iter(emails)
+        first_email = next(emails, None)
+        if first_email is None:
+            if self.gmail_client.failed_fetches > failed_fetches_before:
+                logger.error("Failed to fetch every new message, keeping history checkpoint")
+            else:
+                self._save_checkpoint(latest_history_id)
+            return 0
+
+        bigquery_client = self.bigquery_client
+        failed_before = bigquery_client.failed_rows
+        pipeline = run_pipeline(self._until_stopped(chain([first_email], emails)), self.email_parser,
+                                self.classifier, bigquery_client, workers=self.workers)
+
+        email_count = pipeline.stages[-1].stats.items
+        failed_count = bigquery_client.failed_rows - failed_before
+        failed_fetches = self.gmail_client.failed_fetches - failed_fetches_before
+        self.emails += email_count
+        self.failed_rows += failed_count
+        self.last_failed_rows = failed_count
+        logger.info("Processed %d emails", email_count, extra={'emails': email_count})
+
+        if failed_count:
+            logger.error("Failed to insert data for %d emails, keeping history checkpoint", failed_count)
+            # close() cleared the metadata cache; the table may be gone.
+            self._table_ready = False
+        elif failed_fetches:
+            logger.error("Failed to fetch %d messages, keeping history checkpoint", failed_fetches)
+        elif self.stopping:
+            logger.info("Stopped before the poll finished, keeping history checkpoint")
+        else:
+            self._save_checkpoint(latest_history_id)
+        return email_count
+
+    def _save_checkpoint(self, history_id: str) -> None:
+        self._history_id = history_id
+        self.sync_state.save_history_id(history_id)
+
+    def run(self) -> None:
+        """
+        Poll until stop() is called, then write every buffered row.
+
+        A failed poll is logged and retried after the idle interval, so a
+        Gmail or BigQuery outage slows the daemon down instead of ending it.
+        """
+        started = time.time()
+        logger.info("Daemon started, polling every %.0f to %.0f seconds",
+                    self.interval.min_interval, self.interval.max_interval)
+
+        while not self.stopping:
+            poll_started = time.time()
+            status = 'failed'
+            email_count = 0
+            self.last_failed_rows = 0
+            try:
+                email_count = self.poll()
+                status = 'ok' if email_count else 'no_mail'
+            except Exception as e:
+                logger.exception("Error polling emails: %s", e)
+            self.polls += 1
+
+            wait = self.interval.next(email_count)
+            self._write_metrics(started, poll_started, status, email_count, wait)
+            if self.stopping:
+                break
+            logger.debug("Next poll in %.0f seconds", wait)
+            self._wake.wait(wait)
+            self._wake.clear()
+
+        if self._bigquery_client is not None:
+            self._bigquery_client.close()
+        logger.info("Daemon stopped after %d polls and %d emails", self.polls, self.emails)
+
+    def _write_metrics(self, started: float, poll_started: float, status: str, email_count: int,
+                       wait: float) -> None:
+        # Operation metrics and AI gating decisions accumulate over the
+        # daemon's lifetime; the run fields describe the latest poll, the
+        # totals the whole lifetime.
+        finished = time.time()
+        write_run_metrics({
+            'mode': 'daemon',
+            'started_at': datetime.fromtimestamp(started, timezone.utc).isoformat(),
+            'finished_at': datetime.fromtimestamp(finished, timezone.utc).isoformat(),
+            'finished_at_epoch': round(finished, 3),
+            'duration_seconds': round(finished - poll_started, 3),
+            'status': 'partial' if status == 'ok' and self.last_failed_rows else status,
+            'emails': email_count,
+            'failed_rows': self.last_failed_rows,
+            'polls': self.polls,
+            'total_emails': self.emails,
+            'total_failed_rows': self.failed_rows,
+            'ai_decisions': dict(self.classifier.decisions) if self.classifier else {},
+            'next_poll_seconds': wait,
+        })
+
+    def install_signal_handlers(self) -> None:
+        """
+        Stop on SIGTERM and SIGINT and poll immediately on SIGUSR1.
+
+        A second SIGINT interrupts the daemon without waiting for the poll.
+        """
+        def handle_stop(signum, frame):
+            logger.info("Received %s, stopping after the current poll", signal.Signals(signum).name)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            self.stop()
+
+        signal.signal(signal.SIGTERM, handle_stop)
+        signal.signal(signal.SIGINT, handle_stop)
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.wake())
@@ -0,0 +1,66 @@
+"""
+Cheap pre-classifier deciding whether an email needs AI extraction.
+"""
+import threading
+from collections import Counter
+from typing import Any, Dict, Tuple
+
+# Markers of a 案件 section; any of them means the mail describes a project.
+PROJECT_MARKERS = ('■案件概要', '【案件名】', '【業務内容】', '【必須スキル】')
+
+# Weaker signals that only count together with a company name found by regex.
+PROJECT_KEYWORDS = ('案件', '契約形態', '準委任', '請負', '単価', '稼働')
+
+AUTO_REPLY_SUBJECTS = ('自動返信', '自動応答', '不在', 'auto-reply', 'automatic reply', 'out of office')
+
+NEWSLETTER_MARKERS = ('配信停止', '配信解除', 'メルマガ', 'unsubscribe')
+
+class EmailClassifier:
+    """
+    Rule-based gate in front of the AI extraction step.
+
+    Decisions are counted by reason in ``decisions`` so they can be reported
+    in the run log.
+    """
+
+    def __init__(self):
+        """Initialize the classifier."""
+        self.decisions = Counter()
+        self._lock = threading.Lock()
+
+    def needs_ai(self, email: Dict[str, Any], regex_data: Dict[str, Any]) -> Tuple[bool, str]:
+        """
+        Decide whether an email should be sent to the AI extractor.
+
+        Args:
+            email: Email data dictionary
+            regex_data: Data extracted from the body using regex
+
+        Returns:
+            Tuple of (needs AI, reason)
+        """
+        needs, reason = self._classify(email, regex_data)
+        with self._lock:
+            self.decisions[reason] += 1
+        return needs, reason
+
+    def _classify(self, email: Dict[str, Any], regex_data: Dict[str, Any]) -> Tuple[bool, str]:
+        body = email.get('body', '')
+        if not body.strip():
+            return False, 'empty_body'
+
+        subject = email.get('subject', '').lower()
+        if any(marker in subject for marker in AUTO_REPLY_SUBJECTS):
+            return False, 'auto_reply'
+
+        if any(marker in body for marker in PROJECT_MARKERS):
+            return True, 'project_section'
+
+        if regex_data.get('company_name') and any(keyword in body for keyword in PROJECT_KEYWORDS):
+            return True, 'company_with_project_keywords'
+
+        lowered = body.lower()
+        if any(marker in lowered for marker in NEWSLETTER_MARKERS):
+            return False, 'newsletter'
+
+        return False, 'no_project_section'
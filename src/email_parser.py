@@ -2,89 +2,184 @@
 Email parser module for extracting information from email content using regex.
 """
 import re
-from typing import Dict, Any, Optional, List
+import json
+import hashlib
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple
 import openai
 import os
 from dotenv import load_dotenv
 
+from field_registry import AI_FIELDS, REGEX_FIELDS, REGEX_FIELDS_BY_LABEL, empty_ai_result
+from llm_cache import LLMCache
+from metrics import METRICS
+from rate_limiter import RateLimiter
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "あなたはメール本文から情報を抽出するAIアシスタントです。"
+
+PROMPT_TEMPLATE = """
+        以下のメール本文から、案件に関する情報を抽出してください。
+        
+        抽出項目:
+        1. 案件種別 (例: 新規開発、保守運用、コンサルティングなど)
+        2. 契約形態 (例: 準委任、請負など)
+        3. 業界 (例: 金融、医療、小売など)
+        4. 使用技術 (例: Python、Java、TensorFlow、PyTorchなど)
+        5. 使用データ (例: 顧客データ、センサーデータ、画像データなど)
+        6. 使用ツール・基盤 (例: AWS、GCP、Azure、Kubernetesなど)
+        7. 担当フェーズ (例: 要件定義、設計、開発、テスト、運用など)
+        8. 担当役割 (例: PM、エンジニア、データサイエンティストなど)
+        
+        メール本文:
+        {email_body}
+        
+        JSON形式で回答してください。情報が見つからない場合はnullとしてください。
+        """
+
+BATCH_PROMPT_TEMPLATE = """
+        以下の複数のメール本文それぞれから、案件に関する情報を抽出してください。
+        
+        抽出項目:
+        1. 案件種別 (例: 新規開発、保守運用、コンサルティングなど)
+        2. 契約形態 (例: 準委任、請負など)
+        3. 業界 (例: 金融、医療、小売など)
+        4. 使用技術 (例: Python、Java、TensorFlow、PyTorchなど)
+        5. 使用データ (例: 顧客データ、センサーデータ、画像データなど)
+        6. 使用ツール・基盤 (例: AWS、GCP、Azure、Kubernetesなど)
+        7. 担当フェーズ (例: 要件定義、設計、開発、テスト、運用など)
+        8. 担当役割 (例: PM、エンジニア、データサイエンティストなど)
+        
+        {emails}
+        
+        メールごとに1つのJSONオブジェクトを作り、JSON配列で回答してください。
+        各オブジェクトには "id" としてメールIDを含めてください。情報が見つからない場合はnullとしてください。
+        """
+
+BATCH_EMAIL_TEMPLATE = """
+        --- メールID: {email_id} ---
+        {email_body}
+"""
+
+# Changes whenever the prompts change, so cached answers for an old prompt are never reused.
+PROMPT_VERSION = hashlib.sha256(
+    (SYSTEM_PROMPT + PROMPT_TEMPLATE + BATCH_PROMPT_TEMPLATE + BATCH_EMAIL_TEMPLATE).encode('utf-8')
+).hexdigest()[:16]
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimate the token count of a text for rate limiting.
+    
+    Japanese characters are counted as one token each and other characters
+    as a quarter token, which errs on the high side for mixed text.
+    
+    Args:
+        text: Text to measure
+        
+    Returns:
+        Estimated number of tokens
+    """
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return non_ascii + (len(text) - non_ascii) // 4 + 1
+
 class EmailParser:
     """Parser for extracting information from email content."""
     
+    FIELDS_BY_LABEL = REGEX_FIELDS_BY_LABEL
+    FIELD_NAMES = [spec.key for spec in REGEX_FIELDS]
+    MAX_LABEL_LENGTH = max(len(label) for label in FIELDS_BY_LABEL)
+    
     def __init__(self):
         """Initialize the email parser."""
         self.openai_api_key = os.getenv('OPENAI_API_KEY')
-        if self.openai_api_key:
-            openai.api_key = self.openai_api_key
+        self.model = os.getenv('OPENAI_MODEL', 'gpt-4')
+        self.max_tokens = 1000
+        self.max_concurrency = int(os.getenv('OPENAI_MAX_CONCURRENCY', '4'))
+        self.max_retries = int(os.getenv('OPENAI_MAX_RETRIES', '5'))
+        self.retry_base_delay = float(os.getenv('OPENAI_RETRY_BASE_DELAY', '1.0'))
+        self.batch_size = int(os.getenv('OPENAI_BATCH_SIZE', '1'))
+        self.context_tokens = int(os.getenv('OPENAI_CONTEXT_TOKENS', '8192'))
+        self.batch_output_tokens = int(os.getenv('OPENAI_BATCH_OUTPUT_TOKENS', '300'))
+        self.requests_made = 0
+        self.tokens_used = 0
+        self._stats_lock = threading.Lock()
+        # Shared by every caller, so pipeline AI workers running
+        # extract_info_ai_many side by side stay within max_concurrency.
+        self._in_flight = threading.BoundedSemaphore(self.max_concurrency)
+        self.rate_limiter = RateLimiter(
+            requests_per_minute=float(os.getenv('OPENAI_RPM', '500')),
+            tokens_per_minute=float(os.getenv('OPENAI_TPM', '40000'))
+        )
+        
+        self.base_url = os.getenv('OPENAI_BASE_URL') or None
+        self.cache_file = os.getenv('OPENAI_CACHE_FILE', 'llm_cache.sqlite3')
+        self.cache_ttl_seconds = float(os.getenv('OPENAI_CACHE_TTL_DAYS', '30')) * 86400
+        self.cache_max_entries = int(os.getenv('OPENAI_CACHE_MAX_ENTRIES', '100000'))
+        self._client = None
+        self._cache = None
+        self._init_lock = threading.Lock()
+    
+    @property
+    def client(self) -> Optional[openai.OpenAI]:
+        """The OpenAI client, built on first use, or None without an API key."""
+        with self._init_lock:
+            if self._client is None and self.openai_api_key:
+                self._client = openai.OpenAI(
+                    api_key=self.openai_api_key,
+                    base_url=self.base_url,
+                    max_retries=0
+                )
+        return self._client
+    
+    @property
+    def cache(self) -> Optional[LLMCache]:
+        """The LLM response cache, opened on first use, or None when disabled."""
+        with self._init_lock:
+            if self._cache is None and self.openai_api_key and self.cache_file:
+                self._cache = LLMCache(
+                    self.cache_file,
+                    ttl_seconds=self.cache_ttl_seconds,
+                    max_entries=self.cache_max_entries
+                )
+        return self._cache
     
     def extract_info_regex(self, email_body: str) -> Dict[str, Any]:
         """
         Extract information from email body using regex.
         
+        The body is scanned once from 【 to 【. Each known label is handed to
+        the precompiled pattern of its registered field, which is matched right
+        after the label; the first occurrence that matches wins.
+        
         Args:
             email_body: The email body text
             
         Returns:
             Dictionary with extracted information
         """
-        result = {
-            'company_name': '',
-            'url': '',
-            'industry': '',
-            'established_year': '',
-            'capital': '',
-            'revenue': '',
-            'fiscal_year_end': '',
-            'employee_count': '',
-            'prefecture': '',
-            'nearest_station': '',
-            'company_overview': ''
-        }
-        
-        company_name_match = re.search(r'【法人名】\s*(.+?)(?=\n|【)', email_body)
-        if company_name_match:
-            result['company_name'] = company_name_match.group(1).strip()
-        
-        url_match = re.search(r'【URL】\s*(https?://[^\s]+)', email_body)
-        if url_match:
-            result['url'] = url_match.group(1).strip()
-        
-        industry_match = re.search(r'【業界】\s*(.+?)(?=\n|【)', email_body)
-        if industry_match:
-            result['industry'] = industry_match.group(1).strip()
-        
-        established_match = re.search(r'【設立】\s*(\d{4}年\d{1,2}月\d{1,2}日)', email_body)
-        if established_match:
-            result['established_year'] = established_match.group(1).strip()
-        
-        capital_match = re.search(r'【資本金】\s*([0-9,]+円)', email_body)
-        if capital_match:
-            result['capital'] = capital_match.group(1).strip()
-        
-        revenue_match = re.search(r'【売上】\s*(.+?)(?=\n|【)', email_body)
-        if revenue_match:
-            result['revenue'] = revenue_match.group(1).strip()
-        
-        fiscal_match = re.search(r'【決算】\s*(\d{1,2}月)', email_body)
-        if fiscal_match:
-            result['fiscal_year_end'] = fiscal_match.group(1).strip()
-        
-        employee_match = re.search(r'【社員数】\s*(\d+名)', email_body)
-        if employee_match:
-            result['employee_count'] = employee_match.group(1).strip()
-        
-        prefecture_match = re.search(r'【都道府県】\s*(.+?[都道府県])(?=\n|【)', email_body)
-        if prefecture_match:
-            result['prefecture'] = prefecture_match.group(1).strip()
-        
-        station_match = re.search(r'【最寄駅】\s*(.+?駅)(?=\n|【)', email_body)
-        if station_match:
-            result['nearest_station'] = station_match.group(1).strip()
-        
-        overview_match = re.search(r'【法人概要】\s*([\s\S]+?)(?=\n【|$)', email_body)
-        if overview_match:
-            result['company_overview'] = overview_match.group(1).strip()
+        result = dict.fromkeys(self.FIELD_NAMES, '')
+        pending = dict(self.FIELDS_BY_LABEL)
+        
+        with METRICS.timed('regex_extract'):
+            start = email_body.find('【')
+            while start != -1 and pending:
+                end = email_body.find('】', start + 1, start + self.MAX_LABEL_LENGTH + 2)
+                if end != -1:
+                    label = email_body[start + 1:end]
+                    spec = pending.get(label)
+                    if spec is not None:
+                        value_match = spec.pattern.match(email_body, end + 1)
+                        if value_match:
+                            result[spec.key] = spec.normalizer(value_match.group(1))
+                            del pending[label]
+                start = email_body.find('【', start + 1)
         
         return result
     
@@ -92,95 +187,341 @@ class EmailParser:
         """
         Extract information from email body using AI.
         
+        Results are served from the persistent cache when the same normalized
+        body was already extracted with the current prompt and model.
+        
         Args:
             email_body: The email body text
             
         Returns:
             Dictionary with extracted information
         """
-        if not self.openai_api_key:
-            return {
-                'project_type': '',
-                'contract_type': '',
-                'industry': '',
-                'technologies': '',
-                'data_types': '',
-                'tools_platforms': '',
-                'project_phases': '',
-                'roles': ''
-            }
-        
-        prompt = f"""
-        以下のメール本文から、案件に関する情報を抽出してください。
-        
-        抽出項目:
-        1. 案件種別 (例: 新規開発、保守運用、コンサルティングなど)
-        2. 契約形態 (例: 準委任、請負など)
-        3. 業界 (例: 金融、医療、小売など)
-        4. 使用技術 (例: Python、Java、TensorFlow、PyTorchなど)
-        5. 使用データ (例: 顧客データ、センサーデータ、画像データなど)
-        6. 使用ツール・基盤 (例: AWS、GCP、Azure、Kubernetesなど)
-        7. 担当フェーズ (例: 要件定義、設計、開発、テスト、運用など)
-        8. 担当役割 (例: PM、エンジニア、データサイエンティストなど)
+        if not self.client:
+            return empty_ai_result()
         
-        メール本文:
-        {email_body}
+        cached = self._get_cached(email_body)
+        if cached is not None:
+            return cached
         
-        JSON形式で回答してください。情報が見つからない場合はnullとしてください。
+        return self._extract_single(email_body)
+    
+    def _extract_single(self, email_body: str) -> Dict[str, Any]:
         """
+        Extract information from one email body with a single-email request.
         
+        Args:
+            email_body: The email body text
+            
+        Returns:
+            Dictionary with extracted information
+        """
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "あなたはメール本文から情報を抽出するAIアシスタントです。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                max_tokens=1000
-            )
-            
-            ai_response = response.choices[0].message.content
-            
-            import json
-            try:
-                extracted_info = json.loads(ai_response)
-            except json.JSONDecodeError:
-                json_match = re.search(r'```json\n([\s\S]+?)\n```', ai_response)
-                if json_match:
-                    extracted_info = json.loads(json_match.group(1))
-                else:
-                    extracted_info = {
-                        'project_type': '',
-                        'contract_type': '',
-                        'industry': '',
-                        'technologies': '',
-                        'data_types': '',
-                        'tools_platforms': '',
-                        'project_phases': '',
-                        'roles': ''
-                    }
-            
-            return {
-                'project_type': extracted_info.get('案件種別'),
-                'contract_type': extracted_info.get('契約形態'),
-                'industry': extracted_info.get('業界'),
-                'technologies': extracted_info.get('使用技術'),
-                'data_types': extracted_info.get('使用データ'),
-                'tools_platforms': extracted_info.get('使用ツール・基盤'),
-                'project_phases': extracted_info.get('担当フェーズ'),
-                'roles': extracted_info.get('担当役割')
-            }
+            ai_response = self._complete(self._build_messages(email_body), self.max_tokens)
+            result = self._parse_ai_response(ai_response)
+            self._put_cached(email_body, result)
+            return result
+            
+        except ValueError as e:
+            # Not cached, so the next sighting of this body asks the model again.
+            logger.warning("Malformed AI answer, not caching it: %s", e)
+            return empty_ai_result()
+        except Exception as e:
+            logger.error("Error calling OpenAI API: %s", e)
+            return empty_ai_result()
+    
+    def extract_info_ai_many(self, email_bodies: List[str]) -> List[Dict[str, Any]]:
+        """
+        Extract information from several email bodies with concurrent AI calls.
+        
+        At most ``max_concurrency`` requests are in flight at once, counted
+        across every concurrent caller, and every request goes through the
+        shared rate limiter. When ``batch_size`` is greater than one, uncached
+        bodies are packed into multi-email prompts that fit the model's
+        context window.
+        
+        Args:
+            email_bodies: The email body texts
+            
+        Returns:
+            List of extracted information dictionaries, in input order
+        """
+        if not self.client or not email_bodies:
+            return [empty_ai_result() for _ in email_bodies]
+        
+        if self.batch_size <= 1:
+            tasks = [(self.extract_info_ai, body) for body in email_bodies]
+        else:
+            results = [self._get_cached(body) for body in email_bodies]
+            pending = [(index, body) for index, (body, result) in enumerate(zip(email_bodies, results))
+                       if result is None]
+            tasks = [(self._extract_batch, batch) for batch in self._pack_batches(pending)]
+        
+        workers = max(1, min(self.max_concurrency, len(tasks)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outputs = list(executor.map(lambda task: task[0](task[1]), tasks))
+        
+        if self.batch_size <= 1:
+            return outputs
+        
+        for batch_results in outputs:
+            for index, result in batch_results.items():
+                results[index] = result
+        return results
+    
+    def _pack_batches(self, items: List[Tuple[int, str]]) -> List[List[Tuple[int, str]]]:
+        """
+        Group bodies into batches that fit the context window.
+        
+        Args:
+            items: (index, body) pairs to extract
+            
+        Returns:
+            List of batches of (index, body) pairs
+        """
+        overhead = estimate_tokens(SYSTEM_PROMPT + BATCH_PROMPT_TEMPLATE)
+        budget = self.context_tokens - overhead
+        batches = []
+        batch = []
+        used = 0
+        
+        for index, body in items:
+            cost = estimate_tokens(BATCH_EMAIL_TEMPLATE) + estimate_tokens(body) + self.batch_output_tokens
+            if batch and (len(batch) >= self.batch_size or used + cost > budget):
+                batches.append(batch)
+                batch, used = [], 0
+            batch.append((index, body))
+            used += cost
+        
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    def _extract_batch(self, batch: List[Tuple[int, str]]) -> Dict[int, Dict[str, Any]]:
+        """
+        Extract information for a batch of bodies with a single request.
+        
+        A malformed or incomplete answer splits the batch in half and retries
+        each half; a single body falls back to a single-email request. If the
+        API call itself fails, every email in the batch gets an empty result.
+        
+        Args:
+            batch: (index, body) pairs to extract
             
+        Returns:
+            Extracted information dictionaries keyed by index
+        """
+        if len(batch) == 1:
+            index, body = batch[0]
+            return {index: self._extract_single(body)}
+        
+        try:
+            ai_response = self._complete(self._build_batch_messages(batch),
+                                         self.batch_output_tokens * len(batch))
         except Exception as e:
-            print(f"Error calling OpenAI API: {e}")
-            return {
-                'project_type': '',
-                'contract_type': '',
-                'industry': '',
-                'technologies': '',
-                'data_types': '',
-                'tools_platforms': '',
-                'project_phases': '',
-                'roles': ''
-            }
+            logger.error("Error calling OpenAI API: %s", e)
+            return {index: empty_ai_result() for index, _ in batch}
+        
+        try:
+            answers = self._parse_batch_response(ai_response, len(batch))
+        except ValueError as e:
+            logger.warning("Malformed answer for a batch of %d emails, splitting: %s", len(batch), e)
+            middle = len(batch) // 2
+            results = self._extract_batch(batch[:middle])
+            results.update(self._extract_batch(batch[middle:]))
+            return results
+        
+        results = {}
+        for position, (index, body) in enumerate(batch):
+            result = self._map_ai_fields(answers[str(position)])
+            self._put_cached(body, result)
+            results[index] = result
+        return results
+    
+    def _build_messages(self, email_body: str) -> List[Dict[str, str]]:
+        """
+        Build the chat messages for one email.
+        
+        Args:
+            email_body: The email body text
+            
+        Returns:
+            List of chat messages
+        """
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": PROMPT_TEMPLATE.format(email_body=email_body)}
+        ]
+    
+    def _build_batch_messages(self, batch: List[Tuple[int, str]]) -> List[Dict[str, str]]:
+        """
+        Build the chat messages for a batch of emails.
+        
+        Emails are identified by their position in the batch.
+        
+        Args:
+            batch: (index, body) pairs to extract
+            
+        Returns:
+            List of chat messages
+        """
+        emails = ''.join(BATCH_EMAIL_TEMPLATE.format(email_id=position, email_body=body)
+                         for position, (_, body) in enumerate(batch))
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": BATCH_PROMPT_TEMPLATE.format(emails=emails)}
+        ]
+    
+    def _get_cached(self, email_body: str) -> Optional[Dict[str, Any]]:
+        """Look up an email body in the LLM cache, if enabled."""
+        if not self.cache:
+            return None
+        return self.cache.get(LLMCache.make_key(email_body, PROMPT_VERSION, self.model))
+    
+    def _put_cached(self, email_body: str, result: Dict[str, Any]) -> None:
+        """Store an extraction result in the LLM cache, if enabled."""
+        if self.cache:
+            self.cache.put(LLMCache.make_key(email_body, PROMPT_VERSION, self.model), result)
+    
+    def _complete(self, messages: List[Dict[str, str]], max_tokens: int) -> str:
+        """
+        Send a chat completion request with rate limiting and retries.
+        
+        Rate-limit (429), server (5xx) and connection errors are retried with
+        exponential backoff, honouring Retry-After when the API sends it. The
+        whole call, rate limiter waits and retries included, is recorded as
+        one 'ai_extract' operation.
+        
+        Args:
+            messages: Chat messages to send
+            max_tokens: Completion token limit
+            
+        Returns:
+            The content of the first completion choice
+        """
+        estimated_tokens = sum(estimate_tokens(message['content']) for message in messages) + max_tokens
+        
+        with METRICS.timed('ai_extract') as counts:
+            for attempt in range(self.max_retries + 1):
+                self.rate_limiter.acquire(estimated_tokens)
+                try:
+                    with self._in_flight:
+                        response = self.client.chat.completions.create(
+                            model=self.model,
+                            messages=messages,
+                            temperature=0.3,
+                            max_tokens=max_tokens
+                        )
+                    with self._stats_lock:
+                        self.requests_made += 1
+                        if response.usage:
+                            self.tokens_used += response.usage.total_tokens
+                    if response.usage:
+                        counts['tokens'] = response.usage.total_tokens
+                    return response.choices[0].message.content
+                except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+                    with self._stats_lock:
+                        self.requests_made += 1
+                    if attempt == self.max_retries:
+                        raise
+                    counts['retries'] = attempt + 1
+                    delay = self._retry_delay(e, attempt)
+                    logger.warning("OpenAI request failed (%s), retrying in %.1fs", e.__class__.__name__, delay)
+                    time.sleep(delay)
+    
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """
+        Get the backoff delay before the next retry.
+        
+        Args:
+            error: The error raised by the last attempt
+            attempt: Zero-based number of the failed attempt
+            
+        Returns:
+            Delay in seconds
+        """
+        response = getattr(error, 'response', None)
+        if response is not None:
+            retry_after = response.headers.get('retry-after')
+            if retry_after:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+        
+        return self.retry_base_delay * (2 ** attempt) * (1 + random.random())
+    
+    def _parse_ai_response(self, ai_response: str) -> Dict[str, Any]:
+        """
+        Map the JSON answer of the model onto the AI fields.
+        
+        Args:
+            ai_response: Raw completion text
+            
+        Returns:
+            Dictionary with extracted information
+            
+        Raises:
+            ValueError: If the answer is not a JSON object, e.g. because it
+                was cut off at the token limit
+        """
+        extracted_info = self._load_json(ai_response)
+        if not isinstance(extracted_info, dict):
+            raise ValueError("answer is not a JSON object")
+        return self._map_ai_fields(extracted_info)
+    
+    def _parse_batch_response(self, ai_response: str, size: int) -> Dict[str, Dict[str, Any]]:
+        """
+        Parse the JSON array answer of a batch request.
+        
+        Args:
+            ai_response: Raw completion text
+            size: Number of emails in the batch
+            
+        Returns:
+            Answers keyed by email id
+            
+        Raises:
+            ValueError: If the answer is not a JSON array covering every email
+        """
+        answers = self._load_json(ai_response)
+        if not isinstance(answers, list):
+            raise ValueError("batch answer is not a JSON array")
+        
+        by_id = {str(answer.get('id')): answer for answer in answers if isinstance(answer, dict)}
+        missing = [str(position) for position in range(size) if str(position) not in by_id]
+        if missing:
+            raise ValueError(f"batch answer is missing email ids {missing}")
+        return by_id
+    
+    def _load_json(self, ai_response: str) -> Any:
+        """
+        Load JSON from a completion, accepting a fenced ```json block.
+        
+        Args:
+            ai_response: Raw completion text
+            
+        Returns:
+            The decoded JSON value
+            
+        Raises:
+            ValueError: If no valid JSON is found
+        """
+        try:
+            return json.loads(ai_response)
+        except json.JSONDecodeError:
+            json_match = re.search(r'```json\n([\s\S]+?)\n```', ai_response)
+            if json_match:
+                return json.loads(json_match.group(1))
+            raise
+    
+    def _map_ai_fields(self, extracted_info: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Map a model answer keyed by Japanese labels onto the AI field keys.
+        
+        Args:
+            extracted_info: Decoded JSON answer for one email
+            
+        Returns:
+            Dictionary with extracted information
+        """
+        return {spec.key: extracted_info.get(spec.label) for spec in AI_FIELDS}
@@ -0,0 +1,189 @@
+"""
+Single registry of the fields extracted from emails and stored in BigQuery.
+
+Every column of the extracted_info table and of its raw body table is
+declared once here. The regex extractor, the BigQuery schema and the row
+builder are all derived from this table when the module is imported.
+"""
+import base64
+import hashlib
+import re
+import zlib
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, NamedTuple, Optional, Pattern
+
+def to_timestamp(date_header: str) -> Optional[str]:
+    """
+    Convert an RFC 2822 Date header to an ISO 8601 UTC timestamp.
+    
+    Args:
+        date_header: Value of the Date header, e.g. 'Mon, 1 May 2023 09:00:00 +0900'
+        
+    Returns:
+        ISO 8601 timestamp in UTC, or None if the header is missing or malformed
+    """
+    if not date_header:
+        return None
+    try:
+        parsed = parsedate_to_datetime(date_header)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+class FieldSpec(NamedTuple):
+    """Declaration of one extracted field."""
+    column: str
+    bq_type: str
+    description: str
+    source: str
+    key: Optional[str] = None
+    label: Optional[str] = None
+    pattern: Optional[Pattern] = None
+    normalizer: Callable[[str], Any] = str.strip
+    mode: str = 'NULLABLE'
+    converter: Optional[Callable[[Any], Any]] = None
+
+
+# Sources a field value can come from.
+EMAIL = 'email'
+REGEX = 'regex'
+AI = 'ai'
+RUN = 'run'
+RAW = 'raw'
+
+# For regex fields, ``label`` is the text inside 【】 and ``pattern`` is matched
+# right after the label, capturing the value in group 1. For AI fields,
+# ``label`` is the key requested from the model in the JSON answer; AI fields
+# without a label are filled in by the pipeline rather than the model.
+# ``converter`` turns the source value into the form stored in BigQuery.
+FIELDS = [
+    FieldSpec('email_id', 'STRING', 'Email ID', EMAIL, key='id', mode='REQUIRED'),
+    FieldSpec('subject', 'STRING', 'Email subject', EMAIL, key='subject'),
+    FieldSpec('from_email', 'STRING', 'Sender email', EMAIL, key='from'),
+    FieldSpec('to_email', 'STRING', 'Recipient email', EMAIL, key='to'),
+    FieldSpec('received_date', 'TIMESTAMP', 'Date email was received', EMAIL, key='date',
+              converter=to_timestamp),
+    FieldSpec('processed_date', 'TIMESTAMP', 'Date email was processed', RUN, key='processed_date'),
+
+    FieldSpec('company_name', 'STRING', '法人名', REGEX, key='company_name', label='法人名',
+              pattern=re.compile(r'\s*(.[^\n【]*)(?=[\n【])')),
+    FieldSpec('url', 'STRING', 'URL', REGEX, key='url', label='URL',
+              pattern=re.compile(r'\s*(https?://[^\s]+)')),
+    FieldSpec('industry', 'STRING', '業界', REGEX, key='industry', label='業界',
+              pattern=re.compile(r'\s*(.[^\n【]*)(?=[\n【])')),
+    FieldSpec('established_year', 'STRING', '設立年', REGEX, key='established_year', label='設立',
+              pattern=re.compile(r'\s*(\d{4}年\d{1,2}月\d{1,2}日)')),
+    FieldSpec('capital', 'STRING', '資本金', REGEX, key='capital', label='資本金',
+              pattern=re.compile(r'\s*([0-9,]+円)')),
+    FieldSpec('revenue', 'STRING', '売上', REGEX, key='revenue', label='売上',
+              pattern=re.compile(r'\s*(.[^\n【]*)(?=[\n【])')),
+    FieldSpec('fiscal_year_end', 'STRING', '決算月', REGEX, key='fiscal_year_end', label='決算',
+              pattern=re.compile(r'\s*(\d{1,2}月)')),
+    FieldSpec('employee_count', 'STRING', '社員数', REGEX, key='employee_count', label='社員数',
+              pattern=re.compile(r'\s*(\d+名)')),
+    FieldSpec('prefecture', 'STRING', '所在地（都道府県）', REGEX, key='prefecture', label='都道府県',
+              pattern=re.compile(r'\s*(.+?[都道府県])(?=\n|【)')),
+    FieldSpec('nearest_station', 'STRING', '最寄り駅', REGEX, key='nearest_station', label='最寄駅',
+              pattern=re.compile(r'\s*(.+?駅)(?=\n|【)')),
+    FieldSpec('company_overview', 'STRING', '法人概要', REGEX, key='company_overview', label='法人概要',
+              pattern=re.compile(r'\s*(\S[^\n]*(?:\n(?!【)[^\n]*)*)')),
+
+    FieldSpec('project_type', 'STRING', '案件種別', AI, key='project_type', label='案件種別'),
+    FieldSpec('contract_type', 'STRING', '契約形態', AI, key='contract_type', label='契約形態'),
+    FieldSpec('ai_industry', 'STRING', '業界 (AI抽出)', AI, key='industry', label='業界'),
+    FieldSpec('technologies', 'STRING', '使用技術', AI, key='technologies', label='使用技術'),
+    FieldSpec('data_types', 'STRING', '使用データ', AI, key='data_types', label='使用データ'),
+    FieldSpec('tools_platforms', 'STRING', '使用ツール・基盤', AI, key='tools_platforms', label='使用ツール・基盤'),
+    FieldSpec('project_phases', 'STRING', '担当フェーズ', AI, key='project_phases', label='担当フェーズ'),
+    FieldSpec('roles', 'STRING', '担当役割', AI, key='roles', label='担当役割'),
+    FieldSpec('ai_skip_reason', 'STRING', 'AI抽出をスキップした理由', AI, key='skip_reason'),
+]
+
+# The raw email bodies live in a separate table joined on email_id, so scans of
+# the extracted fields never read them. ``body`` is NULL when the body is stored
+# compressed; ``body_compressed`` is then the zlib stream (base64 in JSON rows).
+RAW_FIELDS = [
+    FieldSpec('email_id', 'STRING', 'Email ID', EMAIL, key='id', mode='REQUIRED'),
+    FieldSpec('received_date', 'TIMESTAMP', 'Date email was received', EMAIL, key='date',
+              converter=to_timestamp),
+    FieldSpec('body', 'STRING', 'Raw email body', EMAIL, key='body'),
+    FieldSpec('body_sha256', 'STRING', 'SHA-256 of the UTF-8 email body', RAW, key='body_sha256'),
+    FieldSpec('body_encoding', 'STRING', 'Encoding of body_compressed, NULL when body is plain', RAW,
+              key='body_encoding'),
+    FieldSpec('body_compressed', 'BYTES', 'Compressed email body', RAW, key='body_compressed'),
+]
+
+ZLIB = 'zlib'
+
+REGEX_FIELDS = [spec for spec in FIELDS if spec.source == REGEX]
+AI_FIELDS = [spec for spec in FIELDS if spec.source == AI and spec.label]
+
+# Regex field specs keyed by their 【】 label, used by the extractor.
+REGEX_FIELDS_BY_LABEL = {spec.label: spec for spec in REGEX_FIELDS}
+
+# (column, source index, key) for every column, in schema order.
+_SOURCE_INDEX = {EMAIL: 0, REGEX: 1, AI: 2, RUN: 3}
+_ROW_PLAN = tuple((spec.column, _SOURCE_INDEX[spec.source], spec.key) for spec in FIELDS)
+_ROW_CONVERTERS = tuple((spec.column, spec.converter) for spec in FIELDS if spec.converter)
+
+
+def empty_ai_result() -> Dict[str, Any]:
+    """
+    Get the AI result used when no information could be extracted.
+
+    Returns:
+        Dictionary with every AI field set to an empty string
+    """
+    return {spec.key: '' for spec in AI_FIELDS}
+
+
+def build_row(email_data: Dict[str, Any], regex_data: Dict[str, Any], ai_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build a BigQuery row from the email metadata and extraction results.
+
+    Args:
+        email_data: Email metadata
+        regex_data: Data extracted using regex
+        ai_data: Data extracted using AI
+
+    Returns:
+        Row dictionary keyed by column name
+    """
+    sources = (email_data, regex_data, ai_data, {'processed_date': datetime.now(timezone.utc).isoformat()})
+    row = {column: sources[index].get(key, '') for column, index, key in _ROW_PLAN}
+    for column, converter in _ROW_CONVERTERS:
+        row[column] = converter(row[column])
+    return row
+
+
+def build_raw_row(email_data: Dict[str, Any], compression: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build a row of the raw body table from the email metadata.
+    
+    Args:
+        email_data: Email metadata
+        compression: 'zlib' to store the body compressed, or None to store it as text
+        
+    Returns:
+        Row dictionary keyed by raw table column name
+    """
+    body = email_data.get('body') or ''
+    encoded = body.encode('utf-8')
+    row = {
+        'email_id': email_data.get('id', ''),
+        'received_date': to_timestamp(email_data.get('date', '')),
+        'body': body,
+        'body_sha256': hashlib.sha256(encoded).hexdigest(),
+        'body_encoding': None,
+        'body_compressed': None,
+    }
+    if compression == ZLIB:
+        row['body'] = None
+        row['body_encoding'] = ZLIB
+        row['body_compressed'] = base64.b64encode(zlib.compress(encoded)).decode('ascii')
+    elif compression:
+        raise ValueError(f"Unsupported body compression: {compression}")
+    return row
@@ -2,32 +2,94 @@
 Gmail API client for fetching emails from a specific email address.
 """
 import os
-import base64
+import logging
+import random
 import re
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional
 from email.message import EmailMessage
 import pickle
 from pathlib import Path
 from datetime import datetime, timedelta
 
+import httplib2
+import google_auth_httplib2
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from dotenv import load_dotenv
 
+from message_cache import MessageCache
+from mime_body import extract_body
+from metrics import METRICS
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 
+# Gmail accepts up to 100 calls per batch but recommends staying at 50 or below
+# to avoid rateLimitExceeded responses on individual parts.
+MAX_BATCH_SIZE = 100
+
+def get_email_body(message: Dict[str, Any]) -> str:
+    """
+    Extract the email body from a Gmail API message.
+
+    Kept at module level so that parse pool workers can decode bodies
+    without a client. See mime_body.extract_body for how the part is chosen
+    and decoded.
+
+    Args:
+        message: The Gmail API message object, or at least its 'payload'
+
+    Returns:
+        The email body as text
+    """
+    with METRICS.timed('body_decode') as counts:
+        body, counts['bytes'] = extract_body(message['payload'])
+        return body
+
 class GmailClient:
     """Client for interacting with Gmail API."""
 
-    def __init__(self):
-        """Initialize the Gmail API client."""
+    def __init__(self, service=None, cache: Optional[MessageCache] = None):
+        """
+        Initialize the Gmail API client.
+
+        Args:
+            service: Pre-built Gmail service object. When omitted, the client
+                authenticates and builds the real Gmail API service on first use.
+            cache: Optional write-through cache of raw messages
+        """
         self.credentials_file = os.getenv('GMAIL_CREDENTIALS_FILE', 'credentials.json')
         self.token_file = os.getenv('GMAIL_TOKEN_FILE', 'token.json')
         self.target_email = os.getenv('GMAIL_TARGET_EMAIL', 'rc_support@frontier-gr.jp')
-        self.service = self._get_gmail_service()
+        self.batch_size = min(int(os.getenv('GMAIL_BATCH_SIZE', '50')), MAX_BATCH_SIZE)
+        self.fetch_workers = int(os.getenv('GMAIL_FETCH_WORKERS', '4'))
+        self.fetch_retries = int(os.getenv('GMAIL_FETCH_RETRIES', '1'))
+        self.fetch_retry_delay = float(os.getenv('GMAIL_FETCH_RETRY_DELAY', '1.0'))
+        # Messages that could not be fetched after every retry, over the
+        # client's lifetime; runs must not advance their checkpoint past them.
+        self.failed_fetches = 0
+        self.credentials = None
+        self._thread_local = threading.local()
+        self._service = service
+        self.cache = cache
+        # When False, emails carry the undecoded 'payload' and a None 'body',
+        # leaving the decoding to a parse pool.
+        self.decode_bodies = True
+
+    @property
+    def service(self):
+        """The Gmail API service, authenticated on first access."""
+        if self._service is None:
+            self._service = self._get_gmail_service()
+        return self._service
 
     def _get_gmail_service(self):
         """Authenticate and build the Gmail service."""
@@ -48,8 +110,28 @@ class GmailClient:
             with open(self.token_file, 'wb') as token:
                 pickle.dump(creds, token)
 
+        self.credentials = creds
         return build('gmail', 'v1', credentials=creds)
 
+    def _get_thread_http(self):
+        """
+        Return an authorized HTTP object owned by the calling thread.
+
+        httplib2 connections are not thread-safe, so every fetch worker executes
+        its batches over its own connection.
+
+        Returns:
+            An authorized HTTP object, or None when the service was injected
+        """
+        if self.credentials is None:
+            return None
+
+        http = getattr(self._thread_local, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http())
+            self._thread_local.http = http
+        return http
+
     def get_emails(self, days: int = 1) -> List[Dict[str, Any]]:
         """
         Get emails from the target email address within the specified time period.
@@ -60,33 +142,247 @@ class GmailClient:
         Returns:
             List of email data dictionaries
         """
+        return list(self.iter_emails(days=days))
+
+    def iter_emails(self, days: int = 1, page_size: int = 100) -> Iterator[Dict[str, Any]]:
+        """
+        Stream emails from the target email address, following every result page.
+
+        Each page of message ids is fetched as soon as it is listed, so only one
+        page of messages is held in memory at a time.
+
+        Args:
+            days: Number of days to look back for emails
+            page_size: Number of message ids requested per list call
+
+        Yields:
+            Email data dictionaries
+        """
+        query = self._build_query(days)
+        page_token = None
+
+        while True:
+            with METRICS.timed('gmail_list'):
+                results = self.service.users().messages().list(
+                    userId='me', q=query, maxResults=page_size, pageToken=page_token).execute()
+            messages = results.get('messages', [])
+
+            if messages:
+                yield from self.fetch_messages([message['id'] for message in messages])
+
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+
+    def iter_cached_emails(self, days: int = 1) -> Iterator[Dict[str, Any]]:
+        """
+        Replay emails for the look-back window from the cache without any API calls.
+
+        Args:
+            days: Number of days to look back for emails
+
+        Yields:
+            Email data dictionaries
+        """
+        if not self.cache:
+            return
+
+        cutoff = (datetime.now() - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+        cutoff_ms = int(cutoff.timestamp() * 1000)
+
+        for message in self.cache.iter_messages():
+            if int(message.get('internalDate', 0)) < cutoff_ms:
+                continue
+            email = self._to_email_data(message)
+            if self.target_email.lower() in email['to'].lower():
+                yield email
+
+    def get_history_id(self) -> str:
+        """
+        Get the current history id of the mailbox.
+
+        Returns:
+            The latest Gmail history id
+        """
+        profile = self.service.users().getProfile(userId='me').execute()
+        return str(profile['historyId'])
+
+    def iter_emails_since(self, start_history_id: str, days: int = 1,
+                          page_size: int = 100) -> Iterator[Dict[str, Any]]:
+        """
+        Stream emails added to the mailbox after the given history id.
+
+        Only messages reported as added by the Gmail history API are fetched.
+        If the history id is too old for Gmail to serve (HTTP 404), this falls
+        back to a full scan of the look-back window.
+
+        Args:
+            start_history_id: History id stored by the previous run
+            days: Look-back window used when the checkpoint has expired
+            page_size: Number of history records requested per list call
+
+        Yields:
+            Email data dictionaries
+        """
+        seen = set()
+        page_token = None
+
+        while True:
+            try:
+                with METRICS.timed('gmail_list'):
+                    results = self.service.users().history().list(
+                        userId='me', startHistoryId=start_history_id, historyTypes=['messageAdded'],
+                        maxResults=page_size, pageToken=page_token).execute()
+            except HttpError as e:
+                if e.resp.status != 404 or page_token is not None:
+                    raise
+                logger.warning("History id %s has expired, falling back to a full scan", start_history_id)
+                yield from self.iter_emails(days=days)
+                return
+
+            message_ids = []
+            for record in results.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message_id = added['message']['id']
+                    if message_id not in seen:
+                        seen.add(message_id)
+                        message_ids.append(message_id)
+
+            if message_ids:
+                for email in self.fetch_messages(message_ids):
+                    if self.target_email.lower() in email['to'].lower():
+                        yield email
+
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+
+    def _build_query(self, days: int) -> str:
+        """
+        Build the Gmail search query for the look-back window.
+
+        Args:
+            days: Number of days to look back for emails
+
+        Returns:
+            Gmail search query string
+        """
         after_date = (datetime.now() - timedelta(days=days)).strftime('%Y/%m/%d')
 
-        query = f"to:{self.target_email} after:{after_date}"
+        return f"to:{self.target_email} after:{after_date}"
+
+    def fetch_messages(self, message_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Fetch full messages using batched, concurrent Gmail API requests.
+
+        Messages found in the cache are served from disk. The remaining ids are
+        split into HTTP batch requests of ``batch_size`` calls and up to
+        ``fetch_workers`` batches are executed at the same time. Messages that
+        fail are retried up to ``fetch_retries`` times, after an exponential
+        backoff with jitter, and then skipped and counted in
+        ``failed_fetches``.
+
+        Args:
+            message_ids: Gmail message ids to fetch
+
+        Returns:
+            List of email data dictionaries, in the order of message_ids
+        """
+        fetched = {}
+        if self.cache:
+            for message_id in message_ids:
+                message = self.cache.get(message_id)
+                if message is not None:
+                    fetched[message_id] = message
+
+        pending = [message_id for message_id in message_ids if message_id not in fetched]
+
+        for attempt in range(self.fetch_retries + 1):
+            if not pending:
+                break
+            if attempt:
+                METRICS.count('gmail_fetch', retries=len(pending))
+                # rateLimitExceeded parts usually fail again when retried at once.
+                time.sleep(self.fetch_retry_delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+            chunks = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+            workers = max(1, min(self.fetch_workers, len(chunks)))
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for results in executor.map(self._execute_batch, chunks):
+                    fetched.update(results)
+                    if self.cache:
+                        for message in results.values():
+                            self.cache.put(message)
+
+            pending = [message_id for message_id in pending if message_id not in fetched]
 
-        results = self.service.users().messages().list(userId='me', q=query).execute()
-        messages = results.get('messages', [])
+        if pending:
+            self.failed_fetches += len(pending)
+            logger.error("Failed to fetch %d messages: %s", len(pending), pending)
 
-        emails = []
-        for message in messages:
-            msg = self.service.users().messages().get(userId='me', id=message['id']).execute()
+        return [self._to_email_data(fetched[message_id]) for message_id in message_ids if message_id in fetched]
 
-            headers = {header['name']: header['value'] for header in msg['payload']['headers']}
+    def _execute_batch(self, message_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetch a group of messages in a single Gmail HTTP batch request.
+
+        Args:
+            message_ids: Gmail message ids to fetch in this batch
 
-            body = self._get_email_body(msg)
+        Returns:
+            Dictionary of successfully fetched messages keyed by message id
+        """
+        results = {}
+        errors = []
 
-            email_data = {
-                'id': message['id'],
-                'subject': headers.get('Subject', ''),
-                'from': headers.get('From', ''),
-                'to': headers.get('To', ''),
-                'date': headers.get('Date', ''),
-                'body': body
-            }
+        def callback(request_id, response, exception):
+            if exception is not None:
+                logger.warning("Error fetching message %s: %s", request_id, exception, extra={'email_id': request_id})
+                errors.append(request_id)
+            else:
+                results[request_id] = response
 
-            emails.append(email_data)
+        batch = self.service.new_batch_http_request(callback=callback)
+        for message_id in message_ids:
+            batch.add(self.service.users().messages().get(userId='me', id=message_id), request_id=message_id)
 
-        return emails
+        with METRICS.timed('gmail_fetch') as counts:
+            try:
+                batch.execute(http=self._get_thread_http())
+            except Exception as e:
+                logger.error("Error executing batch of %d messages: %s", len(message_ids), e)
+                errors.append(None)
+            counts['errors'] = len(errors)
+            counts['bytes'] = sum(message.get('sizeEstimate', 0) for message in results.values())
+
+        return results
+
+    def _to_email_data(self, msg: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Convert a Gmail API message into an email data dictionary.
+
+        Args:
+            msg: The Gmail API message object
+
+        Returns:
+            Email data dictionary
+        """
+        headers = {header['name']: header['value'] for header in msg['payload']['headers']}
+
+        email_data = {
+            'id': msg['id'],
+            'subject': headers.get('Subject', ''),
+            'from': headers.get('From', ''),
+            'to': headers.get('To', ''),
+            'date': headers.get('Date', ''),
+            'body': None
+        }
+        if self.decode_bodies:
+            email_data['body'] = self._get_email_body(msg)
+        else:
+            email_data['payload'] = msg['payload']
+        return email_data
 
     def _get_email_body(self, message: Dict[str, Any]) -> str:
         """
@@ -98,13 +394,4 @@ class GmailClient:
         Returns:
             The email body as text
         """
-        if 'parts' in message['payload']:
-            for part in message['payload']['parts']:
-                if part['mimeType'] == 'text/plain':
-                    if 'data' in part['body']:
-                        return base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-
-        if 'body' in message['payload'] and 'data' in message['payload']['body']:
-            return base64.urlsafe_b64decode(message['payload']['body']['data']).decode('utf-8')
-
-        return ""
+        return get_email_body(message)
@@ -0,0 +1,133 @@
+"""
+Persistent SQLite cache of AI extraction results.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Optional
+
+def normalize_body(email_body: str) -> str:
+    """
+    Normalize an email body so re-posts of the same mail share a cache key.
+
+    Args:
+        email_body: The email body text
+
+    Returns:
+        NFKC-normalized body with whitespace runs collapsed
+    """
+    return ' '.join(unicodedata.normalize('NFKC', email_body).split())
+
+
+class LLMCache:
+    """
+    Cache of AI extraction results keyed by normalized body, prompt and model.
+
+    Entries older than ``ttl_seconds`` are ignored and purged, and the least
+    recently used entries are evicted once there are more than ``max_entries``.
+    """
+
+    EVICT_EVERY = 100
+
+    def __init__(self, db_path: str, ttl_seconds: float, max_entries: int):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            db_path: Path of the SQLite database file
+            ttl_seconds: Maximum age of a usable entry
+            max_entries: Maximum number of entries kept
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._conn.commit()
+        with self._lock:
+            self._evict()
+
+    @staticmethod
+    def make_key(email_body: str, prompt_version: str, model: str) -> str:
+        """
+        Build the cache key for an email.
+
+        Args:
+            email_body: The email body text
+            prompt_version: Identifier of the prompt template in use
+            model: Model name
+
+        Returns:
+            Hex digest identifying the request
+        """
+        data = '\0'.join([model, prompt_version, normalize_body(email_body)])
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached result.
+
+        Args:
+            key: Cache key from make_key
+
+        Returns:
+            The cached result, or None on a miss or an expired entry
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        """
+        Store a result.
+
+        Args:
+            key: Cache key from make_key
+            value: AI extraction result
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now)
+            )
+            self._puts += 1
+            if self._puts % self.EVICT_EVERY == 0:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Purge expired entries and trim the cache to max_entries. Caller holds the lock."""
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
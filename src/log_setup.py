@@ -0,0 +1,178 @@
+"""
+Non-blocking, structured logging for the processor.
+
+Loggers only put records on an in-memory queue (QueueHandler). A single
+QueueListener thread formats them and writes them to the log file and stdout,
+so pipeline threads never wait on disk or terminal I/O. Records are written
+as JSON lines by default; fields passed with ``extra=`` become fields of the
+line. Worker processes have no listener of their own and send their records
+to the parent through a LogForwarder.
+"""
+import atexit
+import copy
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes of every LogRecord; anything else on a record came from extra=.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_listener = None
+_queue_handler = None
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    """
+    QueueHandler that keeps the traceback out of the message.
+
+    The message is still rendered in the logging thread, since its arguments
+    may change once the call returns, but the traceback travels separately
+    in exc_text so it ends up in its own JSON field.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def configure_logging(level: Optional[str] = None, log_file: Optional[str] = None,
+                      log_format: Optional[str] = None) -> QueueListener:
+    """
+    Route every logger through a queue to the log file and stdout.
+
+    Calling it again returns the running listener unchanged.
+
+    Args:
+        level: Root log level. Defaults to LOG_LEVEL or INFO; per-email
+            detail is only logged at DEBUG.
+        log_file: Log file path, '' for stdout only. Defaults to LOG_FILE or
+            email_processor.log.
+        log_format: 'json' for JSON lines or 'text' for the classic
+            one-line format. Defaults to LOG_FORMAT or json.
+
+    Returns:
+        The started listener
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _listener
+
+    level = level or os.getenv('LOG_LEVEL', 'INFO')
+    log_file = os.getenv('LOG_FILE', 'email_processor.log') if log_file is None else log_file
+    log_format = log_format or os.getenv('LOG_FORMAT', 'json')
+    if log_format not in ('json', 'text'):
+        raise ValueError(f"Unsupported log format: {log_format}")
+
+    formatter = JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = _QueueHandler(log_queue)
+    root = logging.getLogger()
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    root.addHandler(_queue_handler)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging() -> None:
+    """Write out every queued record and detach the queue from the root logger."""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = _queue_handler = None
+
+
+class _ForwardHandler(logging.Handler):
+    """Hands records received from worker processes to the logger they were logged with."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        logging.getLogger(record.name).handle(record)
+
+
+class LogForwarder:
+    """
+    Carries the log records of worker processes to this process's handlers.
+
+    Workers set up with configure_worker_logging put their records on a
+    multiprocessing queue, and a thread here passes each one on, so they end
+    up in the same log file and stdout as the parent's records.
+    """
+
+    def __init__(self):
+        """Create the queue and start forwarding."""
+        self.queue = multiprocessing.Queue()
+        self.level = logging.getLogger().getEffectiveLevel()
+        self._listener = QueueListener(self.queue, _ForwardHandler())
+        self._listener.start()
+
+    def close(self) -> None:
+        """Forward the remaining records and stop; the workers must have exited."""
+        self._listener.stop()
+        self.queue.close()
+
+
+def configure_worker_logging(log_queue: multiprocessing.Queue, level: int) -> None:
+    """
+    Send every record of a worker process to its parent's LogForwarder.
+
+    A forked worker inherits the parent's queue handler, but not the thread
+    emptying that queue, so its records would otherwise be lost.
+
+    Args:
+        log_queue: LogForwarder.queue of the parent
+        level: Root log level of the parent
+    """
+    global _listener, _queue_handler
+    _listener = _queue_handler = None
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(log_queue))
+    root.setLevel(level)
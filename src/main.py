@@ -1,68 +1,164 @@
 """
 Main script for fetching emails, extracting information, and storing in BigQuery.
 """
-import os
-import sys
 import time
 import logging
-from datetime import datetime
-from typing import List, Dict, Any
+from datetime import datetime, timezone
+from itertools import chain
+from typing import TYPE_CHECKING
 import schedule
 
 from gmail_client import GmailClient
-from email_parser import EmailParser
-from bigquery_client import BigQueryClient
+from offline_source import OfflineSource
+from sync_state import SyncState
+from message_cache import MessageCache
+from metadata_cache import MetadataCache
+from email_classifier import EmailClassifier
+from runner import run_pipeline, write_run_metrics
+from metrics import METRICS
+from log_setup import configure_logging
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("email_processor.log"),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# The OpenAI and BigQuery libraries take about a second to import, so they are
+# only loaded once there is mail to process.
+if TYPE_CHECKING:
+    from email_parser import EmailParser
+    from bigquery_client import BigQueryClient
+    from profiler import RunProfiler
+
+# Handlers are installed by configure_logging when run as a script, so
+# importing this module has no side effects.
 logger = logging.getLogger(__name__)
 
-def process_emails(days: int = 1) -> None:
+def process_emails(days: int = 1, incremental: bool = False, cache_dir: str = None,
+                   cache_only: bool = False, ai_gating: bool = True, load_mode: str = 'stream',
+                   upsert: bool = False, workers: int = 1, source: str = None,
+                   profiler: 'RunProfiler' = None) -> None:
     """
     Process emails from the last specified number of days.
     
     Args:
         days: Number of days to look back for emails
+        incremental: Only process mail added since the stored history id,
+            falling back to the look-back window when there is no checkpoint
+        cache_dir: Directory of the raw message cache. Disabled when None.
+        cache_only: Replay the look-back window from the cache without calling Gmail
+        ai_gating: Skip AI extraction for emails the classifier finds no 案件 in
+        load_mode: 'stream' for streaming inserts, 'batch' for file load jobs
+        upsert: MERGE the run's rows into the table on email_id instead of appending
+        workers: Number of processes decoding bodies and running regex
+            extraction. Parsing stays in this process when 1.
+        source: Read emails from a .eml file or directory, mbox archive or
+            JSONL dump instead of Gmail. The look-back window does not apply.
+        profiler: Active profiler of the run, which gets a span per email
+    
+    When the fetch returns no mail the run ends before the OpenAI and BigQuery
+    clients are built or any BigQuery metadata is looked up. Every run ends by
+    writing its metrics (see write_run_metrics), failed runs included.
     """
-    logger.info(f"Starting email processing for the last {days} days")
+    logger.info("Starting email processing for the last %d days", days)
+    
+    METRICS.reset()
+    started = time.time()
+    run = {'started_at': datetime.fromtimestamp(started, timezone.utc).isoformat(), 'status': 'failed',
+           'emails': 0, 'failed_rows': 0, 'failed_fetches': 0, 'ai_requests': 0, 'ai_tokens': 0, 'ai_decisions': {}, 'stages': {}}
     
     try:
-        gmail_client = GmailClient()
+        cache = MessageCache(cache_dir) if cache_dir else None
+        gmail_client = GmailClient(cache=cache)
+        gmail_client.decode_bodies = workers <= 1
+        
+        sync_state = SyncState() if incremental and not cache_only and not source else None
+        if sync_state:
+            start_history_id = sync_state.load_history_id()
+            latest_history_id = gmail_client.get_history_id()
+        
+        if source:
+            logger.info("Reading emails from %s", source)
+            emails = OfflineSource(source).iter_emails()
+        elif cache_only:
+            logger.info("Replaying emails from cache %s", cache_dir)
+            emails = gmail_client.iter_cached_emails(days=days)
+        elif sync_state and start_history_id:
+            logger.info("Fetching emails added since history id %s", start_history_id)
+            emails = gmail_client.iter_emails_since(start_history_id, days=days)
+        else:
+            emails = gmail_client.iter_emails(days=days)
+        
+        emails = iter(emails)
+        first_email = next(emails, None)
+        if first_email is None:
+            if gmail_client.failed_fetches:
+                logger.warning("Keeping history checkpoint because %d messages could not be fetched",
+                               gmail_client.failed_fetches)
+                run.update(status='partial', failed_fetches=gmail_client.failed_fetches)
+                return
+            logger.info("No new emails to process")
+            if sync_state:
+                sync_state.save_history_id(latest_history_id)
+            run['status'] = 'no_mail'
+            return
+        emails = chain([first_email], emails)
+        
+        from email_parser import EmailParser
+        from bigquery_client import BigQueryClient
+        
         email_parser = EmailParser()
-        bigquery_client = BigQueryClient()
+        classifier = EmailClassifier() if ai_gating else None
+        bigquery_client = BigQueryClient(load_mode=load_mode, upsert=upsert, metadata_cache=MetadataCache())
         
         bigquery_client.create_dataset_if_not_exists()
         bigquery_client.create_table_if_not_exists()
         
-        emails = gmail_client.get_emails(days=days)
-        logger.info(f"Retrieved {len(emails)} emails")
+        pipeline = run_pipeline(emails, email_parser, classifier, bigquery_client, workers=workers,
+                                profiler=profiler)
+        
+        email_count = pipeline.stages[-1].stats.items
+        failed_count = bigquery_client.failed_rows
+        run.update(emails=email_count, failed_rows=failed_count, failed_fetches=gmail_client.failed_fetches,
+                   ai_requests=email_parser.requests_made,
+                   ai_tokens=email_parser.tokens_used,
+                   ai_decisions=dict(classifier.decisions) if classifier else {},
+                   stages={stats.name: stats.as_dict() for stats in pipeline.stats})
+        if failed_count:
+            logger.error("Failed to insert data for %d emails", failed_count)
+        logger.info("BigQuery insert calls: %d, load jobs: %d, merged rows: %d",
+                    bigquery_client.insert_calls, bigquery_client.load_jobs, bigquery_client.merged_rows)
+        
+        logger.info("Processed %d emails", email_count, extra={'emails': email_count})
+        if cache:
+            logger.info("Message cache hits: %d, misses: %d", cache.hits, cache.misses)
+        if email_parser.cache:
+            logger.info("LLM cache hits: %d, misses: %d", email_parser.cache.hits, email_parser.cache.misses)
+        if classifier:
+            logger.info("AI gating decisions: %s", dict(classifier.decisions))
+        if email_count:
+            logger.info(
+                "AI requests: %d (%.2f per email), tokens used: %d (%.0f per email), batch size: %d",
+                email_parser.requests_made, email_parser.requests_made / email_count,
+                email_parser.tokens_used, email_parser.tokens_used / email_count, email_parser.batch_size
+            )
         
-        for email in emails:
-            email_id = email.get('id', '')
-            logger.info(f"Processing email {email_id}")
-            
-            regex_data = email_parser.extract_info_regex(email.get('body', ''))
-            logger.info(f"Extracted regex data for email {email_id}")
-            
-            ai_data = email_parser.extract_info_ai(email.get('body', ''))
-            logger.info(f"Extracted AI data for email {email_id}")
-            
-            success = bigquery_client.insert_data(email, regex_data, ai_data)
-            if success:
-                logger.info(f"Successfully inserted data for email {email_id}")
+        if sync_state:
+            if failed_count:
+                logger.warning("Keeping history checkpoint because %d inserts failed", failed_count)
+            elif gmail_client.failed_fetches:
+                logger.warning("Keeping history checkpoint because %d messages could not be fetched",
+                               gmail_client.failed_fetches)
             else:
-                logger.error(f"Failed to insert data for email {email_id}")
+                sync_state.save_history_id(latest_history_id)
+                logger.info("Saved history checkpoint %s", latest_history_id)
         
+        run['status'] = 'partial' if failed_count or gmail_client.failed_fetches else 'ok'
         logger.info("Email processing completed successfully")
     
     except Exception as e:
-        logger.error(f"Error processing emails: {e}")
+        logger.exception("Error processing emails: %s", e)
+    
+    finally:
+        finished = time.time()
+        run.update(finished_at=datetime.fromtimestamp(finished, timezone.utc).isoformat(),
+                   finished_at_epoch=round(finished, 3), duration_seconds=round(finished - started, 3))
+        write_run_metrics(run)
 
 def run_daily_job() -> None:
     """Run the daily job to process emails."""
@@ -79,7 +175,7 @@ def schedule_daily_job(hour: int = 1, minute: int = 0) -> None:
         minute: Minute to run the job
     """
     schedule.every().day.at(f"{hour:02d}:{minute:02d}").do(run_daily_job)
-    logger.info(f"Scheduled daily job to run at {hour:02d}:{minute:02d}")
+    logger.info("Scheduled daily job to run at %02d:%02d", hour, minute)
     
     while True:
         schedule.run_pending()
@@ -94,11 +190,54 @@ if __name__ == "__main__":
     parser.add_argument("--hour", type=int, default=1, help="Hour to run the daily job (24-hour format)")
     parser.add_argument("--minute", type=int, default=0, help="Minute to run the daily job")
     parser.add_argument("--run-now", action="store_true", help="Run the job immediately")
+    parser.add_argument("--incremental", action="store_true", help="Only process mail added since the last run")
+    parser.add_argument("--cache-dir", help="Directory for the local cache of raw Gmail messages")
+    parser.add_argument("--cache-only", action="store_true", help="Replay emails from --cache-dir without calling Gmail")
+    parser.add_argument("--no-ai-gating", action="store_true", help="Send every email to AI extraction")
+    parser.add_argument("--load-mode", choices=["stream", "batch"], default="stream",
+                        help="Write rows with streaming inserts or with load jobs from staged files")
+    parser.add_argument("--upsert", action="store_true",
+                        help="Merge rows into the table on email_id instead of appending duplicates")
+    parser.add_argument("--source", help="Read emails from a .eml file or directory, mbox archive or JSONL dump "
+                                             "instead of Gmail")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes used to decode and regex-parse emails (for large backfills)")
+    parser.add_argument("--migrate-table", action="store_true",
+                        help="Rebuild an existing table partitioned by received_date and clustered")
+    parser.add_argument("--profile", nargs="?", const="profile", metavar="PREFIX",
+                        help="Profile the --run-now run and write PREFIX.pstats, PREFIX.collapsed "
+                             "and PREFIX.spans.json (default prefix: profile)")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running with warm clients and poll Gmail for new mail on an adaptive interval")
     
     args = parser.parse_args()
     
+    configure_logging()
+    
+    if args.migrate_table:
+        from bigquery_client import BigQueryClient
+        BigQueryClient().migrate_table()
+    
     if args.run_now:
-        process_emails(days=args.days)
+        run_options = dict(days=args.days, incremental=args.incremental,
+                           cache_dir=args.cache_dir, cache_only=args.cache_only,
+                           ai_gating=not args.no_ai_gating, load_mode=args.load_mode,
+                           upsert=args.upsert, workers=args.workers,
+                           source=args.source)
+        if args.profile:
+            from profiler import RunProfiler
+            with RunProfiler(args.profile) as profiler:
+                process_emails(profiler=profiler, **run_options)
+            for line in profiler.report():
+                logger.info(line)
+        else:
+            process_emails(**run_options)
     
-    if args.schedule:
+    if args.daemon:
+        from daemon import Daemon
+        daemon = Daemon(days=args.days, ai_gating=not args.no_ai_gating, load_mode=args.load_mode,
+                        upsert=args.upsert, workers=args.workers, cache_dir=args.cache_dir)
+        daemon.install_signal_handlers()
+        daemon.run()
+    elif args.schedule:
         schedule_daily_job(hour=args.hour, minute=args.minute)
@@ -0,0 +1,144 @@
+"""
+On-disk cache of raw Gmail API message payloads.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class MessageCache:
+    """
+    Write-through cache of raw Gmail messages keyed by message id.
+
+    Gmail messages are immutable once received, so cached entries never go
+    stale. Each message is stored as a JSON file whose path is derived from the
+    SHA-256 of its id. When the cache grows beyond ``max_bytes`` the least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: Optional[int] = None):
+        """
+        Initialize the cache and index the entries already on disk.
+
+        Args:
+            cache_dir: Directory that holds the cached messages
+            max_bytes: Maximum total size of the cache. Defaults to GMAIL_CACHE_MAX_BYTES.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes or int(os.getenv('GMAIL_CACHE_MAX_BYTES', str(1024 ** 3)))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._total_bytes = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self) -> None:
+        """Record the size and last access time of every cached entry."""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                self._entries[path] = (stat.st_mtime, stat.st_size)
+                self._total_bytes += stat.st_size
+
+    def _path(self, message_id: str) -> str:
+        """
+        Get the file path for a message id.
+
+        Args:
+            message_id: Gmail message id
+
+        Returns:
+            Path of the cache entry
+        """
+        digest = hashlib.sha256(message_id.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.json")
+
+    def get(self, message_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Load a cached message.
+
+        Args:
+            message_id: Gmail message id
+
+        Returns:
+            The raw Gmail API message, or None on a cache miss
+        """
+        path = self._path(message_id)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                message = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if path in self._entries:
+                os.utime(path)
+                self._entries[path] = (os.stat(path).st_mtime, self._entries[path][1])
+
+        return message
+
+    def put(self, message: Dict[str, Any]) -> None:
+        """
+        Store a raw message and evict old entries if the cache is over budget.
+
+        Args:
+            message: The raw Gmail API message
+        """
+        path = self._path(message['id'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            _, old_size = self._entries.get(path, (0, 0))
+            self._entries[path] = (os.stat(path).st_mtime, len(data))
+            self._total_bytes += len(data) - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until the cache is at 90% of its budget."""
+        target = int(self.max_bytes * 0.9)
+        for path, (_, size) in sorted(self._entries.items(), key=lambda item: item[1][0]):
+            if self._total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            del self._entries[path]
+            self._total_bytes -= size
+
+    def iter_messages(self) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over every cached message without touching the network.
+
+        Yields:
+            Raw Gmail API messages
+        """
+        with self._lock:
+            paths = sorted(self._entries)
+
+        for path in paths:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue
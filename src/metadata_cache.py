@@ -0,0 +1,103 @@
+"""
+Local cache of BigQuery dataset and table metadata.
+"""
+import json
+import logging
+import os
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+class MetadataCache:
+    """
+    Remembers in a local JSON file which datasets exist and which schema
+    version each table was last created or migrated to, so that frequent
+    runs can skip the get_dataset and get_table round trips.
+    """
+
+    def __init__(self, cache_file: Optional[str] = None):
+        """
+        Initialize the metadata cache.
+
+        Args:
+            cache_file: Path of the cache file. Defaults to BIGQUERY_METADATA_CACHE_FILE.
+        """
+        self.cache_file = cache_file or os.getenv('BIGQUERY_METADATA_CACHE_FILE', 'bq_metadata.json')
+        self._data = None
+
+    def has_dataset(self, dataset: str) -> bool:
+        """
+        Check whether a dataset was recorded as existing.
+
+        Args:
+            dataset: Fully qualified dataset id
+
+        Returns:
+            True if the dataset is known to exist
+        """
+        return dataset in self._load()['datasets']
+
+    def add_dataset(self, dataset: str) -> None:
+        """
+        Record that a dataset exists.
+
+        Args:
+            dataset: Fully qualified dataset id
+        """
+        data = self._load()
+        if dataset not in data['datasets']:
+            data['datasets'].append(dataset)
+            self._save()
+
+    def table_version(self, table: str) -> Optional[str]:
+        """
+        Get the schema version a table was last brought up to.
+
+        Args:
+            table: Fully qualified table id
+
+        Returns:
+            The recorded schema version, or None if the table is unknown
+        """
+        return self._load()['tables'].get(table)
+
+    def set_table_version(self, table: str, version: str) -> None:
+        """
+        Record the schema version of a table.
+
+        Args:
+            table: Fully qualified table id
+            version: Schema version the table now has
+        """
+        data = self._load()
+        if data['tables'].get(table) != version:
+            data['tables'][table] = version
+            self._save()
+
+    def clear(self) -> None:
+        """Forget everything, so the next run checks BigQuery again."""
+        self._data = {'datasets': [], 'tables': {}}
+        if os.path.exists(self.cache_file):
+            os.remove(self.cache_file)
+
+    def _load(self) -> dict:
+        if self._data is not None:
+            return self._data
+
+        self._data = {'datasets': [], 'tables': {}}
+        if os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, 'r') as f:
+                    self._data.update(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning("Ignoring unreadable metadata cache %s: %s", self.cache_file, e)
+        return self._data
+
+    def _save(self) -> None:
+        tmp_file = f"{self.cache_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self._data, f)
+        os.replace(tmp_file, self.cache_file)
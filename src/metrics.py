@@ -0,0 +1,327 @@
+"""
+Latency histograms and counters for the client operations of a run.
+
+Every Gmail, OpenAI and BigQuery call and every body decode and regex pass is
+recorded under an operation name in the process-wide ``METRICS`` registry. At
+the end of a run the registry is written as a JSON summary and, optionally, as
+a Prometheus text file for the node-exporter textfile collector.
+"""
+import json
+from bisect import bisect_left
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# Upper bounds of the latency buckets in seconds. They span sub-millisecond
+# regex passes up to OpenAI requests that sit out several retries.
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+COUNTERS = ('calls', 'errors', 'retries', 'bytes', 'tokens')
+
+PROMETHEUS_PREFIX = 'email_processor'
+
+class OperationMetrics:
+    """Counters and latency histogram of one operation."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.tokens = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        # One count per bucket of LATENCY_BUCKETS plus the +Inf bucket, not cumulative.
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, seconds: float) -> None:
+        self.latency_sum += seconds
+        if seconds > self.latency_max:
+            self.latency_max = seconds
+        self.bucket_counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    @property
+    def observations(self) -> int:
+        return sum(self.bucket_counts)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate a latency quantile from the histogram.
+
+        The value is interpolated linearly within the bucket holding the
+        quantile, as Prometheus' histogram_quantile does.
+
+        Args:
+            q: Quantile between 0 and 1
+
+        Returns:
+            Estimated latency in seconds, or None without observations
+        """
+        total = self.observations
+        if not total:
+            return None
+
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(self.bucket_counts):
+            if count and seen + count >= rank:
+                lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+                upper = LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else self.latency_max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.latency_max)
+            seen += count
+        return self.latency_max
+
+    def state(self) -> Dict[str, Any]:
+        """Raw counters and bucket counts, as passed between processes."""
+        state = {counter: getattr(self, counter) for counter in COUNTERS}
+        state.update(latency_sum=self.latency_sum, latency_max=self.latency_max,
+                     bucket_counts=list(self.bucket_counts))
+        return state
+
+    def merge(self, state: Dict[str, Any]) -> None:
+        for counter in COUNTERS:
+            setattr(self, counter, getattr(self, counter) + state[counter])
+        self.latency_sum += state['latency_sum']
+        self.latency_max = max(self.latency_max, state['latency_max'])
+        self.bucket_counts = [a + b for a, b in zip(self.bucket_counts, state['bucket_counts'])]
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarize the operation for the JSON report.
+
+        Returns:
+            Counters and latency statistics in seconds
+        """
+        observations = self.observations
+        summary = {counter: getattr(self, counter) for counter in COUNTERS}
+        summary['latency_seconds'] = {
+            'total': round(self.latency_sum, 6),
+            'mean': round(self.latency_sum / observations, 6) if observations else None,
+            'p50': _round(self.quantile(0.5)),
+            'p90': _round(self.quantile(0.9)),
+            'p99': _round(self.quantile(0.99)),
+            'max': round(self.latency_max, 6),
+        }
+        return summary
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 6)
+
+
+class Metrics:
+    """
+    Thread-safe registry of operation metrics.
+
+    Operations are created on first use, so instrumented code only needs to
+    pick a name.
+    """
+
+    def __init__(self):
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def _operation(self, name: str) -> OperationMetrics:
+        operation = self._operations.get(name)
+        if operation is None:
+            operation = self._operations[name] = OperationMetrics(name)
+        return operation
+
+    def timed(self, name: str) -> '_Timer':
+        """
+        Record one call of an operation and its latency.
+
+        Used as a context manager. The block may add to the other counters
+        through the dictionary it binds, for example
+        ``counts['bytes'] = len(data)``. An exception escaping the block
+        counts as an error.
+
+        Args:
+            name: Operation name
+
+        Returns:
+            Context manager binding the dictionary of counter increments
+            applied when the block ends
+        """
+        return _Timer(self, name)
+
+    def _record(self, name: str, elapsed: float, counts: Dict[str, int]) -> None:
+        with self._lock:
+            operation = self._operation(name)
+            operation.calls += 1
+            operation.observe(elapsed)
+            for counter, amount in counts.items():
+                setattr(operation, counter, getattr(operation, counter) + amount)
+
+    def count(self, name: str, **amounts: int) -> None:
+        """
+        Add to the counters of an operation without recording a call.
+
+        Args:
+            name: Operation name
+            **amounts: Increments keyed by counter ('errors', 'retries', 'bytes', 'tokens')
+        """
+        with self._lock:
+            operation = self._operation(name)
+            for counter, amount in amounts.items():
+                setattr(operation, counter, getattr(operation, counter) + amount)
+
+    def operations(self) -> List[OperationMetrics]:
+        with self._lock:
+            return [self._operations[name] for name in sorted(self._operations)]
+
+    def reset(self) -> None:
+        """Forget every operation, at the start of a run."""
+        with self._lock:
+            self._operations = {}
+
+    def drain(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Take the raw state of every operation and reset the registry.
+
+        Used by parse pool workers to hand their metrics to the parent process.
+
+        Returns:
+            Operation states keyed by name
+        """
+        with self._lock:
+            operations, self._operations = self._operations, {}
+        return {name: operation.state() for name, operation in operations.items()}
+
+    def merge(self, states: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Add operation states drained from another registry.
+
+        Args:
+            states: Operation states keyed by name
+        """
+        with self._lock:
+            for name, state in states.items():
+                self._operation(name).merge(state)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Summarize every operation.
+
+        Returns:
+            Operation summaries keyed by name
+        """
+        return {operation.name: operation.summary() for operation in self.operations()}
+
+    def write_json(self, path: str, run: Dict[str, Any]) -> None:
+        """
+        Write the run summary as JSON.
+
+        Args:
+            path: Destination file
+            run: Run-level fields (timestamps, email counts, stage stats)
+                written next to the operations
+        """
+        document = dict(run, operations=self.summary())
+        _write_atomic(path, json.dumps(document, ensure_ascii=False, indent=2) + '\n')
+
+    def write_prometheus(self, path: str, run: Dict[str, Any],
+                         ai_decisions: Optional[Dict[str, int]] = None) -> None:
+        """
+        Write the metrics in the Prometheus text exposition format.
+
+        The file is replaced atomically so the node-exporter textfile
+        collector never reads a partial file.
+
+        Args:
+            path: Destination file, normally ending in .prom
+            run: Run-level fields; the numeric ones are exported as
+                ``email_processor_last_run_<field>`` gauges
+            ai_decisions: AI gating decision counts by reason, exported as
+                ``email_processor_ai_decisions_total`` counters
+        """
+        _write_atomic(path, self.prometheus_text(run, ai_decisions))
+
+    def prometheus_text(self, run: Dict[str, Any], ai_decisions: Optional[Dict[str, int]] = None) -> str:
+        """
+        Format the metrics in the Prometheus text exposition format.
+
+        Args:
+            run: Run-level fields exported as gauges when numeric
+            ai_decisions: AI gating decision counts by reason, or None
+
+        Returns:
+            The exposition text
+        """
+        operations = self.operations()
+        histogram = f"{PROMETHEUS_PREFIX}_operation_duration_seconds"
+        lines = [
+            f"# HELP {histogram} Latency of client operations in the last run.",
+            f"# TYPE {histogram} histogram",
+        ]
+        for operation in operations:
+            label = f'operation="{operation.name}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + (math.inf,), operation.bucket_counts):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else repr(bound)
+                lines.append(f'{histogram}_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f"{histogram}_sum{{{label}}} {operation.latency_sum!r}")
+            lines.append(f"{histogram}_count{{{label}}} {cumulative}")
+
+        for counter in COUNTERS:
+            metric = f"{PROMETHEUS_PREFIX}_operation_{counter}_total"
+            lines.append(f"# HELP {metric} Operation {counter} in the last run.")
+            lines.append(f"# TYPE {metric} counter")
+            for operation in operations:
+                lines.append(f'{metric}{{operation="{operation.name}"}} {getattr(operation, counter)}')
+
+        if ai_decisions:
+            metric = f"{PROMETHEUS_PREFIX}_ai_decisions_total"
+            lines.append(f"# HELP {metric} Emails the AI gate sent to or kept from AI extraction, by reason.")
+            lines.append(f"# TYPE {metric} counter")
+            for reason, count in sorted(ai_decisions.items()):
+                lines.append(f'{metric}{{reason="{reason}"}} {count}')
+
+        for field, value in run.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metric = f"{PROMETHEUS_PREFIX}_last_run_{field}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value!r}")
+
+        return '\n'.join(lines) + '\n'
+
+
+class _Timer:
+    """Context manager returned by Metrics.timed.
+
+    A plain class rather than a generator-based context manager, since it
+    wraps every regex pass and body decode.
+    """
+
+    __slots__ = ('metrics', 'name', 'counts', 'start')
+
+    def __init__(self, metrics: Metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+        self.counts = {}
+
+    def __enter__(self) -> Dict[str, int]:
+        self.start = time.perf_counter()
+        return self.counts
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        elapsed = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.counts['errors'] = self.counts.get('errors', 0) + 1
+        self.metrics._record(self.name, elapsed, self.counts)
+
+
+def _write_atomic(path: str, text: str) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# Registry shared by every client in the process.
+METRICS = Metrics()
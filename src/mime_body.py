@@ -0,0 +1,233 @@
+"""
+Body extraction for Gmail API payloads and parsed MIME messages.
+
+The payload tree is walked through every level of nesting
+(multipart/mixed > multipart/alternative > text/plain is common) and the
+first text/plain part is used, falling back to the first text/html part
+converted to text. Attachments are never decoded. The part is decoded with
+its declared charset, so ISO-2022-JP and Shift_JIS mail comes out readable.
+Decoding streams in fixed-size blocks and stops at a size cap, so one huge
+mail cannot take up more than about the cap in memory.
+
+Only the standard library is used, as parse pool workers import this.
+"""
+import base64
+import codecs
+import logging
+import os
+import re
+from functools import lru_cache
+from html.parser import HTMLParser
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Decoded bytes of a body kept at most; the rest is dropped.
+DEFAULT_MAX_BODY_BYTES = 1024 * 1024
+
+# Base64 characters decoded per step; a multiple of 4 so every block decodes on its own.
+_BLOCK_CHARS = 64 * 1024
+
+# Japanese mail often declares the JIS charsets while using the vendor
+# extensions (①, ㈱, ...), which only these supersets decode.
+_CHARSET_ALIASES = {
+    'shift_jis': 'cp932',
+    'shift-jis': 'cp932',
+    'sjis': 'cp932',
+    'x-sjis': 'cp932',
+    'windows-31j': 'cp932',
+    'iso-2022-jp': 'iso2022_jp_ext',
+    'euc-jp': 'euc_jis_2004',
+}
+
+_CHARSET_PARAM = re.compile(r'charset\s*=\s*"?([^";\s]+)"?', re.IGNORECASE)
+
+# Tags that start a new line in the text rendering of an HTML body.
+_BLOCK_TAGS = {'br', 'p', 'div', 'tr', 'li', 'ul', 'ol', 'table', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+               'blockquote', 'pre', 'hr'}
+_SKIPPED_TAGS = {'script', 'style', 'head', 'title'}
+_BLANK_LINES = re.compile(r'\n[ \t　]*(?:\n[ \t　]*)+')
+
+@lru_cache(maxsize=64)
+def resolve_charset(charset: Optional[str]) -> str:
+    """
+    Get the Python codec for a declared charset.
+
+    Args:
+        charset: Charset from the Content-Type header, or None
+
+    Returns:
+        Codec name, UTF-8 for missing or unknown charsets
+    """
+    if not charset:
+        return 'utf-8'
+    charset = charset.strip().lower()
+    charset = _CHARSET_ALIASES.get(charset, charset)
+    try:
+        return codecs.lookup(charset).name
+    except LookupError:
+        return 'utf-8'
+
+
+def decode_text(data: bytes, charset: Optional[str] = None) -> str:
+    """
+    Decode a body with its declared charset, replacing undecodable bytes.
+
+    Args:
+        data: Raw body bytes
+        charset: Declared charset, or None for UTF-8
+
+    Returns:
+        The body as text
+    """
+    return data.decode(resolve_charset(charset), errors='replace')
+
+
+class _HTMLText(HTMLParser):
+    """Collects the visible text of an HTML document, one line per block."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIPPED_TAGS:
+            self._skipping += 1
+        elif tag in _BLOCK_TAGS:
+            self.chunks.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in _SKIPPED_TAGS:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in _BLOCK_TAGS:
+            self.chunks.append('\n')
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.chunks.append(data)
+
+    def text(self) -> str:
+        text = ''.join(self.chunks).replace('\xa0', ' ')
+        return _BLANK_LINES.sub('\n', text).strip()
+
+
+def html_to_text(html: str) -> str:
+    """
+    Convert an HTML body to plain text with a line break after every block.
+
+    Args:
+        html: HTML document
+
+    Returns:
+        The visible text
+    """
+    parser = _HTMLText()
+    parser.feed(html)
+    parser.close()
+    return parser.text()
+
+
+def _headers(part: Dict[str, Any]) -> Dict[str, str]:
+    return {header['name'].lower(): header['value'] for header in part.get('headers', [])}
+
+
+def _is_attachment(part: Dict[str, Any], headers: Dict[str, str]) -> bool:
+    return bool(part.get('filename')) or headers.get('content-disposition', '').lower().startswith('attachment')
+
+
+def find_body_part(payload: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    Find the part holding the body of a Gmail API payload.
+
+    Parts are visited depth first in document order. A part without a
+    mimeType that carries data is treated as text/plain.
+
+    Args:
+        payload: The 'payload' of a Gmail API message
+
+    Returns:
+        The first text/plain part with data, or the first text/html part
+        when there is none, or None; and whether the part is HTML
+    """
+    html_part = None
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        children = part.get('parts')
+        if children:
+            stack.extend(reversed(children))
+            continue
+
+        if 'data' not in part.get('body', {}) or _is_attachment(part, _headers(part)):
+            continue
+        mime_type = part.get('mimeType', 'text/plain').lower()
+        if mime_type == 'text/plain':
+            return part, False
+        if mime_type == 'text/html' and html_part is None:
+            html_part = part
+    return html_part, html_part is not None
+
+
+def _iter_decoded(data: str, charset: str, max_bytes: int) -> Iterator[Tuple[str, int]]:
+    """Yield (text, raw byte count) blocks of base64url data, stopping after max_bytes bytes."""
+    if len(data) <= _BLOCK_CHARS:
+        # Almost every body fits in one block and is decoded in one go.
+        raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))[:max_bytes]
+        yield raw.decode(charset, errors='replace'), len(raw)
+        return
+
+    decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+    remaining = max_bytes
+    for start in range(0, len(data), _BLOCK_CHARS):
+        block = data[start:start + _BLOCK_CHARS]
+        raw = base64.urlsafe_b64decode(block + '=' * (-len(block) % 4))
+        if len(raw) >= remaining:
+            yield decoder.decode(raw[:remaining], final=True), remaining
+            return
+        remaining -= len(raw)
+        yield decoder.decode(raw), len(raw)
+    yield decoder.decode(b'', final=True), 0
+
+
+def extract_body(payload: Dict[str, Any], max_bytes: Optional[int] = None) -> Tuple[str, int]:
+    """
+    Extract the body text of a Gmail API payload.
+
+    Args:
+        payload: The 'payload' of a Gmail API message
+        max_bytes: Decoded bytes kept at most. Defaults to
+            EMAIL_MAX_BODY_BYTES or 1 MiB.
+
+    Returns:
+        The body as text, '' when the message has no text part, and the
+        number of decoded bytes
+    """
+    part, is_html = find_body_part(payload)
+    if part is None:
+        return "", 0
+
+    if max_bytes is None:
+        max_bytes = int(os.getenv('EMAIL_MAX_BODY_BYTES', str(DEFAULT_MAX_BODY_BYTES)))
+    match = _CHARSET_PARAM.search(_headers(part).get('content-type', ''))
+    charset = resolve_charset(match.group(1) if match else None)
+
+    data = part['body']['data']
+    if is_html:
+        parser = _HTMLText()
+        add = parser.feed
+    else:
+        chunks = []
+        add = chunks.append
+
+    size = 0
+    for text, block_size in _iter_decoded(data, charset, max_bytes):
+        add(text)
+        size += block_size
+
+    if size >= max_bytes and len(data) * 3 // 4 > max_bytes:
+        logger.warning("Truncated a body of about %d bytes to %d bytes", len(data) * 3 // 4, max_bytes)
+    if is_html:
+        parser.close()
+        return parser.text(), size
+    return ''.join(chunks), size
@@ -0,0 +1,122 @@
+"""
+Process pool for the CPU-bound parsing steps of large backfills.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from email_parser import EmailParser
+from gmail_client import get_email_body
+from log_setup import LogForwarder, configure_worker_logging
+from metrics import METRICS
+
+# Headers mime_body reads from a part; the rest are not sent to the workers.
+_BODY_HEADERS = {'content-type', 'content-disposition'}
+
+# Parser of the current worker process, built once by the pool initializer.
+_parser = None
+
+def _init_worker(log_queue: multiprocessing.Queue, log_level: int) -> None:
+    global _parser
+    configure_worker_logging(log_queue, log_level)
+    _parser = EmailParser()
+    # A forked worker starts with a copy of the parent's metrics; only its own are sent back.
+    METRICS.reset()
+
+def _parse_chunk(items: List[Tuple[Optional[Dict[str, Any]], Optional[str]]]
+                 ) -> Tuple[List[Tuple[Optional[str], Tuple[str, ...]]], Dict[str, Dict[str, Any]]]:
+    """
+    Decode and regex-extract one chunk of emails in a worker process.
+
+    Args:
+        items: (payload, body) pairs. The payload is decoded when present,
+            otherwise the already decoded body is used.
+
+    Returns:
+        (decoded body, regex values) pairs in the order of items, and the
+        worker's metrics for the chunk. The regex values are a tuple in
+        FIELD_NAMES order, which pickles smaller than a dict. The decoded body
+        is None for items that were sent with a body, so it is not pickled
+        back to the parent.
+    """
+    results = []
+    for payload, body in items:
+        decoded = None
+        if payload is not None:
+            decoded = body = get_email_body({'payload': payload})
+        regex_data = _parser.extract_info_regex(body or '')
+        results.append((decoded, tuple(regex_data[name] for name in EmailParser.FIELD_NAMES)))
+    return results, METRICS.drain()
+
+
+class ParsePool:
+    """
+    Fans MIME decoding and regex extraction out to worker processes.
+
+    Emails are sent in chunks, and only the fields the workers need cross the
+    process boundary: the raw payload (or the body when it is already
+    decoded) on the way in, and the decoded body and regex fields on the way
+    back. Results always come back in input order, and the workers' decode
+    and regex metrics are merged into this process's registry. Their log
+    records are written by this process's log handlers.
+    """
+
+    def __init__(self, workers: int, chunk_size: int = 64):
+        """
+        Initialize the pool.
+
+        Args:
+            workers: Number of worker processes
+            chunk_size: Number of emails sent to a worker per task
+        """
+        self.workers = workers
+        self.chunk_size = max(1, chunk_size)
+        self._log_forwarder = LogForwarder()
+        self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                             initargs=(self._log_forwarder.queue, self._log_forwarder.level))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def parse(self, emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Decode the bodies of emails fetched with ``decode_bodies`` off and
+        run regex extraction on every email.
+
+        Each email's 'payload' is replaced by its decoded 'body' in place.
+
+        Args:
+            emails: Email data dictionaries
+
+        Returns:
+            Regex extraction results, in the order of emails
+        """
+        items = []
+        for email in emails:
+            payload = email.pop('payload', None)
+            if payload is not None:
+                # The fetch already read the other headers; only the ones
+                # choosing and decoding the body part go to the workers.
+                payload = dict(payload, headers=[header for header in payload.get('headers', [])
+                                                 if header['name'].lower() in _BODY_HEADERS])
+            items.append((payload, email.get('body') if payload is None else None))
+        chunks = [items[start:start + self.chunk_size] for start in range(0, len(items), self.chunk_size)]
+
+        regex_results = []
+        results = []
+        for chunk_results, metrics in self._executor.map(_parse_chunk, chunks):
+            results.extend(chunk_results)
+            METRICS.merge(metrics)
+        for email, (decoded, values) in zip(emails, results):
+            if decoded is not None:
+                email['body'] = decoded
+            regex_results.append(dict(zip(EmailParser.FIELD_NAMES, values)))
+        return regex_results
+
+    def close(self) -> None:
+        """Shut the worker processes down."""
+        self._executor.shutdown()
+        self._log_forwarder.close()
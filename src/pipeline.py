@@ -0,0 +1,225 @@
+"""
+Staged pipeline with bounded queues between stages.
+
+Each stage runs its own worker threads and hands chunks of items to the next
+stage through a bounded queue. A full queue blocks the stage feeding it, so a
+slow stage throttles everything upstream and the number of chunks in flight
+stays bounded by the queue sizes.
+"""
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, List, Optional
+
+# Marks the end of a stage's input.
+_DONE = object()
+
+class StageStats:
+    """Counters of one pipeline stage."""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.chunks = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.max_queue_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+        self._lock = threading.Lock()
+
+    def record(self, items: int, busy: float, blocked: float) -> None:
+        with self._lock:
+            self.items += items
+            self.chunks += 1
+            self.busy_seconds += busy
+            self.blocked_seconds += blocked
+
+    def sample_depth(self, depth: int) -> None:
+        with self._lock:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+            self._depth_total += depth
+            self._depth_samples += 1
+
+    @property
+    def mean_queue_depth(self) -> float:
+        return self._depth_total / self._depth_samples if self._depth_samples else 0.0
+
+    def as_dict(self) -> dict:
+        """The stage counters as a JSON-serializable dictionary."""
+        return {
+            'workers': self.workers,
+            'items': self.items,
+            'chunks': self.chunks,
+            'busy_seconds': round(self.busy_seconds, 6),
+            'blocked_seconds': round(self.blocked_seconds, 6),
+            'mean_queue_depth': round(self.mean_queue_depth, 3),
+            'max_queue_depth': self.max_queue_depth,
+        }
+
+    def summary(self, elapsed: float) -> str:
+        """
+        Format the stage's throughput and input queue depth.
+
+        Args:
+            elapsed: Wall time of the pipeline run in seconds
+
+        Returns:
+            One line describing the stage
+        """
+        throughput = self.items / elapsed if elapsed > 0 else 0.0
+        utilization = self.busy_seconds / (elapsed * self.workers) if elapsed > 0 else 0.0
+        return (
+            f"{self.name}: {self.items} items in {self.chunks} chunks, "
+            f"{throughput:.1f} items/s, {self.workers} workers {utilization:.0%} busy, "
+            f"blocked {self.blocked_seconds:.2f}s, "
+            f"input queue depth mean {self.mean_queue_depth:.1f} max {self.max_queue_depth}"
+        )
+
+
+class Stage:
+    """One step of the pipeline, applied to every chunk by a pool of threads."""
+
+    def __init__(self, name: str, func: Callable[[List[Any]], Optional[List[Any]]], workers: int = 1):
+        """
+        Initialize the stage.
+
+        Args:
+            name: Name used in the stage report
+            func: Function mapping an input chunk to the chunk handed to the
+                next stage. The return value of the last stage is discarded.
+            workers: Number of threads running the function
+        """
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.stats = StageStats(name, self.workers)
+
+
+class Pipeline:
+    """
+    Runs chunks from a source through a sequence of stages.
+
+    The source is consumed by a single thread, since it is usually a generator
+    such as the Gmail fetch, and the chunks it yields are passed through the
+    stages in turn. Chunks may complete out of order when a stage has several
+    workers. If any stage raises, the source stops, the remaining chunks are
+    drained without being processed and the first error is re-raised by
+    ``run``.
+    """
+
+    def __init__(self, source_name: str, source: Iterable[List[Any]], stages: List[Stage],
+                 queue_size: int = 4):
+        """
+        Initialize the pipeline.
+
+        Args:
+            source_name: Name of the source in the stage report
+            source: Iterable of chunks, each a list of items
+            stages: Stages applied to every chunk, in order
+            queue_size: Maximum number of chunks waiting in front of each stage
+        """
+        self.source = source
+        self.stages = stages
+        self.source_stats = StageStats(source_name, 1)
+        self.queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in stages]
+        self.elapsed = 0.0
+        self._error = None
+        self._failed = threading.Event()
+        self._remaining_workers = [stage.workers for stage in stages]
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> List[StageStats]:
+        """Stats of the source followed by every stage."""
+        return [self.source_stats] + [stage.stats for stage in self.stages]
+
+    def run(self) -> None:
+        """Run every chunk through the stages and wait for the last one to finish."""
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._read_source, name=f"pipeline-{self.source_stats.name}")]
+        for index, stage in enumerate(self.stages):
+            threads.extend(
+                threading.Thread(target=self._run_worker, args=(index,), name=f"pipeline-{stage.name}-{worker}")
+                for worker in range(stage.workers)
+            )
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - start
+
+        if self._error is not None:
+            raise self._error
+
+    def report(self) -> List[str]:
+        """
+        Describe the throughput and queue depth of every stage.
+
+        Returns:
+            One line per stage, source first
+        """
+        return [stats.summary(self.elapsed) for stats in self.stats]
+
+    def _put(self, index: int, chunk: Any) -> float:
+        """Hand a chunk to stage ``index`` and return the time spent blocked on a full queue."""
+        target = self.queues[index]
+        self.stages[index].stats.sample_depth(target.qsize())
+        start = time.perf_counter()
+        target.put(chunk)
+        return time.perf_counter() - start
+
+    def _fail(self, error: BaseException) -> None:
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._failed.set()
+
+    def _read_source(self) -> None:
+        try:
+            iterator = iter(self.source)
+            while not self._failed.is_set():
+                start = time.perf_counter()
+                chunk = next(iterator, _DONE)
+                busy = time.perf_counter() - start
+                if chunk is _DONE:
+                    break
+                blocked = self._put(0, chunk) if self.stages else 0.0
+                self.source_stats.record(len(chunk), busy, blocked)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            if self.stages:
+                for _ in range(self.stages[0].workers):
+                    self.queues[0].put(_DONE)
+
+    def _run_worker(self, index: int) -> None:
+        stage = self.stages[index]
+        is_last = index == len(self.stages) - 1
+        while True:
+            chunk = self.queues[index].get()
+            if chunk is _DONE:
+                break
+            if self._failed.is_set():
+                continue
+
+            try:
+                start = time.perf_counter()
+                result = stage.func(chunk)
+                busy = time.perf_counter() - start
+            except BaseException as e:
+                self._fail(e)
+                continue
+
+            blocked = 0.0 if is_last else self._put(index + 1, result)
+            stage.stats.record(len(chunk), busy, blocked)
+
+        with self._lock:
+            self._remaining_workers[index] -= 1
+            last_worker = self._remaining_workers[index] == 0
+        if last_worker and not is_last:
+            for _ in range(self.stages[index + 1].workers):
+                self.queues[index + 1].put(_DONE)
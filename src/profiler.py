@@ -0,0 +1,251 @@
+"""
+Profiler for a single run, enabled with --profile.
+
+A run is profiled three ways at once:
+
+- cProfile covering every thread, written as one pstats file
+  (``python -m pstats <prefix>.pstats``, snakeviz, ...). Before Python 3.12
+  every thread gets its own profile and they are merged at the end.
+- a sampler that records the Python stack of every thread at a fixed
+  interval, written as collapsed stacks for flamegraph.pl, speedscope or
+  inferno (``<prefix>.collapsed``)
+- per-email spans around the parse and write work, written as the CPU and
+  wall time of every email, slowest first (``<prefix>.spans.json``). Samples
+  taken inside a span carry an ``email:<id>`` frame under the thread name.
+
+Nothing here is imported or called unless --profile is given.
+"""
+import cProfile
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List
+
+# Leaf frames of threads parked on a queue, condition or join; sampling them
+# would only show idle pipeline and executor workers.
+_IDLE_FRAMES = {('threading.py', 'wait'), ('threading.py', '_wait_for_tstate_lock'),
+                ('queue.py', 'get'), ('queue.py', 'put'), ('thread.py', '_worker')}
+
+# Worker numbers in thread names ("pipeline-parse-1", "ThreadPoolExecutor-3_0"),
+# dropped so the stacks of a pool's threads add up.
+_THREAD_NUMBER = re.compile(r'[-_]\d+')
+
+class _Span:
+    """Context manager timing one email in one stage."""
+
+    __slots__ = ('profiler', 'stage', 'email_id', 'chars', 'cpu_start', 'wall_start')
+
+    def __init__(self, profiler: 'RunProfiler', stage: str, email_id: str, chars: int):
+        self.profiler = profiler
+        self.stage = stage
+        self.email_id = email_id
+        self.chars = chars
+
+    def __enter__(self):
+        self.profiler._tags[threading.get_ident()] = f"email:{self.email_id}"
+        self.cpu_start = time.thread_time()
+        self.wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        cpu = time.thread_time() - self.cpu_start
+        wall = time.perf_counter() - self.wall_start
+        self.profiler._tags.pop(threading.get_ident(), None)
+        self.profiler._record_span(self.stage, self.email_id, self.chars, cpu, wall)
+
+
+class RunProfiler:
+    """
+    Profiles everything run inside it and writes the results on exit.
+    """
+
+    def __init__(self, output_prefix: str = 'profile', sample_interval: float = None):
+        """
+        Initialize the profiler.
+
+        Args:
+            output_prefix: Path prefix of the .pstats, .collapsed and
+                .spans.json files
+            sample_interval: Seconds between stack samples. Defaults to
+                PROFILE_SAMPLE_INTERVAL or 5 ms.
+        """
+        self.output_prefix = output_prefix
+        if sample_interval is None:
+            sample_interval = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005'))
+        self.sample_interval = sample_interval
+        self.samples = Counter()
+        self.spans = defaultdict(lambda: {'chars': 0, 'cpu_seconds': defaultdict(float),
+                                          'wall_seconds': defaultdict(float)})
+        self.stats = None
+        self._tags = {}
+        self._main_profile = cProfile.Profile()
+        self._thread_profiles = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name='profiler-sampler', daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        self.write()
+
+    def start(self) -> None:
+        """Start sampling and profiling the current thread and every thread started from now on."""
+        # Started before the thread hook is set, so the sampler itself is not profiled.
+        self._sampler.start()
+        threading.setprofile(self._profile_thread)
+        self._main_profile.enable()
+
+    def stop(self) -> None:
+        """
+        Stop profiling and merge the profiles of every thread.
+
+        Threads started while profiling must have finished, as the pipeline's
+        and the clients' worker threads have once process_emails returns.
+        """
+        self._main_profile.disable()
+        threading.setprofile(None)
+        self._stop.set()
+        self._sampler.join()
+
+        self.stats = pstats.Stats(self._main_profile)
+        for profile in self._thread_profiles:
+            self.stats.add(profile)
+
+    def span(self, stage: str, email_id: str, chars: int = 0) -> _Span:
+        """
+        Time the work on one email.
+
+        Args:
+            stage: Pipeline stage doing the work ('parse', 'write')
+            email_id: Id of the email
+            chars: Length of the email body
+
+        Returns:
+            Context manager recording the span
+        """
+        return _Span(self, stage, email_id, chars)
+
+    def _record_span(self, stage: str, email_id: str, chars: int, cpu: float, wall: float) -> None:
+        with self._lock:
+            span = self.spans[email_id]
+            span['chars'] = max(span['chars'], chars)
+            span['cpu_seconds'][stage] += cpu
+            span['wall_seconds'][stage] += wall
+
+    def _profile_thread(self, frame, event, arg) -> None:
+        # Installed with threading.setprofile: runs once in every new thread
+        # and replaces itself with a cProfile profiler for that thread. Before
+        # Python 3.12 cProfile only sees the thread that enabled it.
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # From 3.12 cProfile runs on sys.monitoring: the main profile
+            # already covers every thread and a second one is refused. Remove
+            # the hook, or it would run again on every call in this thread.
+            sys.setprofile(None)
+            return
+        with self._lock:
+            self._thread_profiles.append(profile)
+
+    def _sample(self) -> None:
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.sample_interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                prefix = [_THREAD_NUMBER.sub('', names.get(ident, str(ident)))]
+                tag = self._tags.get(ident)
+                if tag:
+                    prefix.append(tag)
+                self.samples[';'.join(prefix + stack[::-1])] += 1
+
+    def span_summary(self) -> List[Dict[str, Any]]:
+        """
+        Get the per-email spans, the most CPU-intensive email first.
+
+        Returns:
+            One dictionary per email with its body length and CPU and wall
+            seconds per stage
+        """
+        rows = []
+        for email_id, span in self.spans.items():
+            rows.append({
+                'email_id': email_id,
+                'chars': span['chars'],
+                'cpu_seconds': round(sum(span['cpu_seconds'].values()), 6),
+                'wall_seconds': round(sum(span['wall_seconds'].values()), 6),
+                'stages': {stage: {'cpu_seconds': round(cpu, 6),
+                                   'wall_seconds': round(span['wall_seconds'][stage], 6)}
+                           for stage, cpu in span['cpu_seconds'].items()},
+            })
+        rows.sort(key=lambda row: row['cpu_seconds'], reverse=True)
+        return rows
+
+    def write(self) -> List[str]:
+        """
+        Write the pstats, collapsed stack and span files.
+
+        Returns:
+            Paths of the written files
+        """
+        directory = os.path.dirname(self.output_prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        pstats_path = f"{self.output_prefix}.pstats"
+        self.stats.dump_stats(pstats_path)
+
+        collapsed_path = f"{self.output_prefix}.collapsed"
+        with open(collapsed_path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.samples.items()):
+                f.write(f"{stack} {count}\n")
+
+        spans_path = f"{self.output_prefix}.spans.json"
+        with open(spans_path, 'w', encoding='utf-8') as f:
+            json.dump(self.span_summary(), f, ensure_ascii=False, indent=2)
+
+        return [pstats_path, collapsed_path, spans_path]
+
+    def report(self, top: int = 10) -> List[str]:
+        """
+        Describe the most expensive functions and emails.
+
+        Args:
+            top: Number of functions and emails listed
+
+        Returns:
+            Report lines
+        """
+        lines = [f"Profile written to {self.output_prefix}.pstats, .collapsed and .spans.json "
+                 f"({sum(self.samples.values())} stack samples)"]
+
+        # Own time rather than cumulative, which is dominated by threads waiting on each other.
+        entries = sorted(self.stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+        for (filename, line, function), (_, calls, own, cumulative, _) in entries[:top]:
+            lines.append(f"{own:8.3f}s own {cumulative:8.3f}s cumulative {calls:8d} calls "
+                         f"{function} ({os.path.basename(filename)}:{line})")
+
+        for row in self.span_summary()[:top]:
+            lines.append(f"email {row['email_id']}: {row['cpu_seconds'] * 1000:.2f} ms CPU, "
+                         f"{row['wall_seconds'] * 1000:.2f} ms wall, {row['chars']} chars")
+        return lines
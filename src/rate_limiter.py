@@ -0,0 +1,70 @@
+"""
+Token-bucket rate limiting for API quotas expressed per minute.
+"""
+import threading
+import time
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at a per-minute rate."""
+
+    def __init__(self, per_minute: float):
+        """
+        Initialize a full bucket.
+
+        Args:
+            per_minute: Bucket capacity and refill amount per minute
+        """
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take tokens from the bucket, going into debt if necessary.
+
+        Args:
+            amount: Number of tokens to take; capped at the bucket capacity
+
+        Returns:
+            Seconds the caller must wait before the reservation is covered
+        """
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class RateLimiter:
+    """Combined requests-per-minute and tokens-per-minute limiter."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        """
+        Initialize the limiter.
+
+        Args:
+            requests_per_minute: Allowed requests per minute
+            tokens_per_minute: Allowed tokens per minute
+        """
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def acquire(self, tokens: int) -> None:
+        """
+        Block until one request of the given token size fits in both quotas.
+
+        Args:
+            tokens: Estimated tokens consumed by the request
+        """
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        if wait > 0:
+            time.sleep(wait)
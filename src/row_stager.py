@@ -0,0 +1,133 @@
+"""
+Local staging of BigQuery rows as NDJSON or Parquet files for load jobs.
+"""
+import base64
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from field_registry import FIELDS, FieldSpec
+
+NDJSON = 'ndjson'
+PARQUET = 'parquet'
+
+class RowStager:
+    """
+    Writes rows to rolling local files, one chunk at a time.
+
+    NDJSON files are appended line by line. Parquet files are written one row
+    group per chunk through pyarrow; creating a Parquet stager fails without it.
+    A new file is started once the current one exceeds ``max_file_rows``.
+    """
+
+    def __init__(self, stage_dir: str, file_format: str = NDJSON, max_file_rows: int = 1000000,
+                 fields: Optional[List[FieldSpec]] = None, prefix: str = 'rows'):
+        """
+        Initialize the stager.
+
+        Args:
+            stage_dir: Directory the staged files are written to
+            file_format: Either 'ndjson' or 'parquet'
+            max_file_rows: Number of rows after which a new file is started
+            fields: Field specs of the staged table's columns, FIELDS by default
+            prefix: File name prefix, distinguishing stagers sharing a directory
+        """
+        if file_format not in (NDJSON, PARQUET):
+            raise ValueError(f"Unsupported staging format: {file_format}")
+        if file_format == PARQUET:
+            # Checked up front: a missing pyarrow would otherwise only surface
+            # on the first flush, after the rows have left the buffer.
+            try:
+                import pyarrow
+            except ImportError as e:
+                raise ImportError("The parquet staging format requires pyarrow") from e
+
+        self.stage_dir = stage_dir
+        self.file_format = file_format
+        self.max_file_rows = max_file_rows
+        self.fields = fields if fields is not None else FIELDS
+        self.prefix = prefix
+        self.files = []
+        self._file = None
+        self._writer = None
+        self._path = None
+        self._rows_in_file = 0
+        self._sequence = 0
+
+        os.makedirs(self.stage_dir, exist_ok=True)
+
+    def write_rows(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Append a chunk of rows to the current staging file.
+
+        Args:
+            rows: Row dictionaries keyed by column name
+        """
+        if not rows:
+            return
+
+        if self._path is None:
+            self._open_file()
+
+        if self.file_format == NDJSON:
+            self._file.writelines(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+        else:
+            self._write_parquet(rows)
+
+        self._rows_in_file += len(rows)
+        if self._rows_in_file >= self.max_file_rows:
+            self._close_file()
+
+    def close(self) -> List[Dict[str, Any]]:
+        """
+        Finish the current file.
+
+        Returns:
+            List of {'path', 'rows'} dictionaries for every staged file
+        """
+        self._close_file()
+        return self.files
+
+    def _open_file(self) -> None:
+        self._sequence += 1
+        extension = 'json' if self.file_format == NDJSON else 'parquet'
+        self._path = os.path.join(self.stage_dir, f"{self.prefix}-{os.getpid()}-{self._sequence:05d}.{extension}")
+        self._rows_in_file = 0
+        if self.file_format == NDJSON:
+            self._file = open(self._path, 'w', encoding='utf-8')
+
+    def _close_file(self) -> None:
+        if self._path is None:
+            return
+
+        if self._file:
+            self._file.close()
+        if self._writer:
+            self._writer.close()
+
+        self.files.append({'path': self._path, 'rows': self._rows_in_file})
+        self._file = None
+        self._writer = None
+        self._path = None
+
+    def _write_parquet(self, rows: List[Dict[str, Any]]) -> None:
+        """Write one chunk of rows as a Parquet row group."""
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        arrow_types = {'TIMESTAMP': pa.timestamp('us', tz='UTC'), 'BYTES': pa.binary()}
+        schema = pa.schema([(spec.column, arrow_types.get(spec.bq_type, pa.string())) for spec in self.fields])
+
+        frame = pd.DataFrame(rows, columns=schema.names)
+        for spec in self.fields:
+            if spec.bq_type == 'TIMESTAMP':
+                frame[spec.column] = pd.to_datetime(frame[spec.column], errors='coerce', utc=True, format='mixed')
+            elif spec.bq_type == 'BYTES':
+                # JSON rows carry BYTES base64-encoded; Parquet stores the raw bytes.
+                frame[spec.column] = [base64.b64decode(value) if value else None for value in frame[spec.column]]
+        table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._path, schema)
+        self._writer.write_table(table)
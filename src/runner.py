@@ -0,0 +1,168 @@
+"""
+Runs of the fetch, parse, AI and write pipeline and their metrics.
+
+Shared by the one-shot and scheduled runs in main and by the polling daemon.
+"""
+import logging
+import os
+from itertools import islice
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List
+
+from email_classifier import EmailClassifier
+from field_registry import empty_ai_result
+from metrics import METRICS
+from pipeline import Pipeline, Stage
+
+if TYPE_CHECKING:
+    from email_parser import EmailParser
+    from bigquery_client import BigQueryClient
+    from profiler import RunProfiler
+
+logger = logging.getLogger(__name__)
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """
+    Split an iterable into lists of at most the given size.
+    
+    Args:
+        items: Items to split
+        size: Maximum chunk size
+        
+    Yields:
+        Lists of consecutive items
+    """
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, max(1, size)))
+        if not chunk:
+            return
+        yield chunk
+
+def extract_ai_data(email_parser: 'EmailParser', classifier: EmailClassifier,
+                    emails: List[Dict[str, Any]], regex_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Run AI extraction for the emails that pass the classifier.
+    
+    Emails the classifier rejects get an empty AI payload carrying the skip reason.
+    
+    Args:
+        email_parser: Parser used for AI extraction
+        classifier: Gate in front of the AI step, or None to send every email
+        emails: Email data dictionaries
+        regex_results: Regex extraction results for the same emails
+        
+    Returns:
+        AI extraction results, in the order of emails
+    """
+    if classifier is None:
+        return email_parser.extract_info_ai_many([email.get('body', '') for email in emails])
+    
+    decisions = [classifier.needs_ai(email, regex_data) for email, regex_data in zip(emails, regex_results)]
+    ai_bodies = [email.get('body', '') for email, (needs, _) in zip(emails, decisions) if needs]
+    ai_results = iter(email_parser.extract_info_ai_many(ai_bodies))
+    
+    return [next(ai_results) if needs else dict(empty_ai_result(), skip_reason=reason)
+            for needs, reason in decisions]
+
+def run_pipeline(emails: Iterable[Dict[str, Any]], email_parser: 'EmailParser', classifier: EmailClassifier,
+                 bigquery_client: 'BigQueryClient', workers: int = 1,
+                 profiler: 'RunProfiler' = None) -> Pipeline:
+    """
+    Run emails through the parse, AI and write stages and close the BigQuery client.
+    
+    Args:
+        emails: Email data dictionaries, usually a lazy Gmail fetch
+        email_parser: Parser used for regex and AI extraction
+        classifier: Gate in front of the AI step, or None to send every email
+        bigquery_client: Client the rows are written with
+        workers: Number of processes decoding bodies and running regex
+            extraction. Parsing stays in this process when 1.
+        profiler: Profiler recording a span per email in the parse and write
+            stages, or None
+        
+    Returns:
+        The finished pipeline, whose stats describe every stage
+    """
+    from parse_pool import ParsePool
+    
+    parse_pool = ParsePool(workers) if workers > 1 else None
+    
+    def parse(chunk):
+        if parse_pool:
+            return list(zip(chunk, parse_pool.parse(chunk)))
+        if profiler:
+            results = []
+            for email in chunk:
+                body = email.get('body', '')
+                with profiler.span('parse', email['id'], len(body)):
+                    results.append((email, email_parser.extract_info_regex(body)))
+            return results
+        return [(email, email_parser.extract_info_regex(email.get('body', ''))) for email in chunk]
+    
+    def extract(chunk):
+        emails = [email for email, _ in chunk]
+        regex_results = [regex_data for _, regex_data in chunk]
+        ai_results = extract_ai_data(email_parser, classifier, emails, regex_results)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Extracted regex and AI data for %d emails", len(chunk), extra={
+                'email_ids': [email['id'] for email in emails],
+                'ai_skipped': [email['id'] for email, ai_data in zip(emails, ai_results)
+                               if ai_data.get('skip_reason')],
+            })
+        return list(zip(emails, regex_results, ai_results))
+    
+    def write(chunk):
+        for email, regex_data, ai_data in chunk:
+            if profiler:
+                with profiler.span('write', email['id']):
+                    bigquery_client.add_row(email, regex_data, ai_data)
+            else:
+                bigquery_client.add_row(email, regex_data, ai_data)
+    
+    # With a process pool, one parse thread per process keeps every process busy.
+    parse_workers = workers if parse_pool else int(os.getenv('PIPELINE_PARSE_WORKERS', '1'))
+    chunk_size = int(os.getenv('PIPELINE_CHUNK_SIZE', str(email_parser.max_concurrency * 4)))
+    pipeline = Pipeline('fetch', chunked(emails, chunk_size), [
+        Stage('parse', parse, workers=parse_workers),
+        Stage('ai', extract, workers=int(os.getenv('PIPELINE_AI_WORKERS', '2'))),
+        Stage('write', write, workers=int(os.getenv('PIPELINE_WRITE_WORKERS', '1'))),
+    ], queue_size=int(os.getenv('PIPELINE_QUEUE_SIZE', '4')))
+    
+    try:
+        pipeline.run()
+    finally:
+        bigquery_client.close()
+        if parse_pool:
+            parse_pool.close()
+        for line in pipeline.report():
+            logger.info("Pipeline stage %s", line)
+    
+    return pipeline
+
+def write_run_metrics(run: Dict[str, Any]) -> None:
+    """
+    Write the run summary and the operation metrics.
+    
+    The JSON summary goes to METRICS_FILE (skipped when empty) and, when
+    METRICS_PROMETHEUS_FILE is set, the same metrics are written in the
+    Prometheus text format for the node-exporter textfile collector.
+    
+    Args:
+        run: Run-level fields written next to the operation metrics
+    """
+    metrics_file = os.getenv('METRICS_FILE', 'run_metrics.json')
+    prometheus_file = os.getenv('METRICS_PROMETHEUS_FILE')
+    try:
+        if metrics_file:
+            METRICS.write_json(metrics_file, run)
+            logger.info("Wrote run metrics to %s", metrics_file)
+        if prometheus_file:
+            METRICS.write_prometheus(prometheus_file, {
+                'timestamp_seconds': run['finished_at_epoch'],
+                'duration_seconds': run['duration_seconds'],
+                'emails': run['emails'],
+                'failed_rows': run['failed_rows'],
+                'success': int(run['status'] != 'failed'),
+            }, ai_decisions=run.get('ai_decisions'))
+    except OSError as e:
+        logger.error("Error writing run metrics: %s", e)
@@ -0,0 +1,53 @@
+"""
+Checkpoint storage for incremental Gmail synchronisation.
+"""
+import json
+import logging
+import os
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+class SyncState:
+    """Stores the last processed Gmail history id in a local JSON file."""
+
+    def __init__(self, state_file: Optional[str] = None):
+        """
+        Initialize the sync state store.
+
+        Args:
+            state_file: Path of the checkpoint file. Defaults to GMAIL_SYNC_STATE_FILE.
+        """
+        self.state_file = state_file or os.getenv('GMAIL_SYNC_STATE_FILE', 'sync_state.json')
+
+    def load_history_id(self) -> Optional[str]:
+        """
+        Load the stored history id.
+
+        Returns:
+            The stored history id, or None if no checkpoint exists
+        """
+        if not os.path.exists(self.state_file):
+            return None
+
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f).get('history_id')
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable sync state %s: %s", self.state_file, e)
+            return None
+
+    def save_history_id(self, history_id: str) -> None:
+        """
+        Atomically store the history id.
+
+        Args:
+            history_id: Gmail history id to resume from on the next run
+        """
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({'history_id': history_id}, f)
+        os.replace(tmp_file, self.state_file)
@@ -0,0 +1,173 @@
+"""
+Tests for concurrent AI extraction against a local fake completion server.
+"""
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+from benchmarks.corpus import make_corpus
+from benchmarks.fake_bigquery import FakeBigQueryClient
+from benchmarks.fake_openai import FakeCompletionServer, default_answer
+from bigquery_client import BigQueryClient
+from email_parser import EmailParser, PROMPT_VERSION
+from llm_cache import LLMCache
+from rate_limiter import TokenBucket
+from runner import run_pipeline
+
+
+def make_parser(server, **env):
+    """Build an EmailParser that talks to the fake server."""
+    settings = {'OPENAI_API_KEY': 'test-key', 'OPENAI_BASE_URL': server.base_url,
+                'OPENAI_RETRY_BASE_DELAY': '0', 'OPENAI_CACHE_FILE': ''}
+    settings.update(env)
+    os.environ.update(settings)
+    try:
+        return EmailParser()
+    finally:
+        for name in settings:
+            os.environ.pop(name, None)
+
+
+def test_extract_info_ai_many_runs_concurrently_in_order():
+    """Requests overlap up to the in-flight limit and results keep input order."""
+    with FakeCompletionServer(latency=0.1) as server:
+        parser = make_parser(server, OPENAI_MAX_CONCURRENCY='4')
+
+        start = time.perf_counter()
+        results = parser.extract_info_ai_many([f"本文{i}" for i in range(8)])
+        elapsed = time.perf_counter() - start
+
+    assert len(results) == 8
+    assert all(result['contract_type'] == '準委任' for result in results)
+    assert server.max_in_flight == 4
+    assert elapsed < 0.6
+
+
+def test_pipeline_ai_workers_share_the_in_flight_limit():
+    """Several AI stage workers together never exceed OPENAI_MAX_CONCURRENCY requests."""
+    with FakeCompletionServer(latency=0.02) as server:
+        parser = make_parser(server, OPENAI_MAX_CONCURRENCY='4', OPENAI_RPM='1000000', OPENAI_TPM='1000000000')
+        fake = FakeBigQueryClient()
+        run_pipeline(iter(make_corpus(64, seed=7)), parser, None, BigQueryClient(client=fake))
+
+    assert len(fake.table_rows['extracted_info']) == 64
+    assert server.requests == 64
+    assert server.max_in_flight <= parser.max_concurrency
+
+
+def test_extract_info_ai_retries_rate_limit_errors():
+    """429 responses are retried until the request succeeds."""
+    with FakeCompletionServer(fail_first=2) as server:
+        parser = make_parser(server)
+        result = parser.extract_info_ai("本文")
+
+    assert server.requests == 3
+    assert result['project_type'] == '新規開発'
+
+
+def test_token_bucket_reports_wait_when_empty():
+    """A drained bucket asks callers to wait for the refill."""
+    bucket = TokenBucket(per_minute=60)
+
+    assert bucket.reserve(60) == 0
+    assert 0.9 < bucket.reserve(1) <= 1.0
+
+
+def test_llm_cache_skips_network_for_reposted_mail():
+    """A re-post that differs only in whitespace is answered from the cache."""
+    with tempfile.TemporaryDirectory() as tmp_dir, FakeCompletionServer() as server:
+        parser = make_parser(server, OPENAI_CACHE_FILE=os.path.join(tmp_dir, 'cache.sqlite3'))
+
+        first = parser.extract_info_ai("【案件名】データ基盤構築\n準委任")
+        second = parser.extract_info_ai("【案件名】データ基盤構築  \n\n準委任\n")
+        parser.cache.close()
+
+    assert server.requests == 1
+    assert first == second
+    assert (parser.cache.hits, parser.cache.misses) == (1, 1)
+
+
+def test_malformed_answer_is_not_cached():
+    """An answer cut off mid-JSON yields an empty result and is asked again next time."""
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            FakeCompletionServer(answer=lambda messages: '{"担当役割": "エン') as server:
+        parser = make_parser(server, OPENAI_CACHE_FILE=os.path.join(tmp_dir, 'cache.sqlite3'))
+
+        first = parser.extract_info_ai("【案件名】データ基盤構築")
+        second = parser.extract_info_ai("【案件名】データ基盤構築")
+        parser.cache.close()
+
+    assert server.requests == 2
+    assert first == second == {key: '' for key in first}
+
+
+def test_fenced_json_answers_are_parsed():
+    """Single and batch answers wrapped in a ```json block are both accepted."""
+    def answer(messages):
+        return f"```json\n{default_answer(messages)}\n```"
+
+    with FakeCompletionServer(answer=answer) as server:
+        single = make_parser(server).extract_info_ai("本文")
+        batch = make_parser(server, OPENAI_BATCH_SIZE='2').extract_info_ai_many(["本文0", "本文1"])
+
+    assert server.requests == 2
+    assert [result['roles'] for result in [single] + batch] == ['エンジニア'] * 3
+
+
+def test_llm_cache_key_changes_with_prompt_and_model():
+    """Changing the prompt version or model produces a different key."""
+    key = LLMCache.make_key("本文", PROMPT_VERSION, 'gpt-4')
+
+    assert key == LLMCache.make_key(" 本文 ", PROMPT_VERSION, 'gpt-4')
+    assert key != LLMCache.make_key("本文", 'other-prompt', 'gpt-4')
+    assert key != LLMCache.make_key("本文", PROMPT_VERSION, 'gpt-4o')
+
+
+def test_llm_cache_evicts_expired_and_excess_entries():
+    """Expired entries are not served and the entry count stays bounded."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = LLMCache(os.path.join(tmp_dir, 'cache.sqlite3'), ttl_seconds=3600, max_entries=5)
+        cache.EVICT_EVERY = 1
+        for i in range(10):
+            cache.put(f"key-{i}", {'roles': str(i)})
+
+        assert cache.get('key-0') is None
+        assert cache.get('key-9') == {'roles': '9'}
+
+        cache.ttl_seconds = -1
+        assert cache.get('key-9') is None
+        cache.close()
+
+
+def test_batch_mode_packs_emails_into_one_request():
+    """Batch mode extracts several emails per request and keeps input order."""
+    with FakeCompletionServer() as server:
+        parser = make_parser(server, OPENAI_BATCH_SIZE='5')
+        results = parser.extract_info_ai_many([f"本文{i}" for i in range(10)])
+
+    assert server.requests == 2
+    assert parser.requests_made == 2
+    assert parser.tokens_used == 300
+    assert [result['roles'] for result in results] == ['エンジニア'] * 10
+
+
+def test_batch_mode_splits_malformed_batches():
+    """A batch answer missing an email is split and retried in halves."""
+    def answer(messages):
+        email_ids = re.findall(r'メールID: (\S+) ---', messages[-1]['content'])
+        if len(email_ids) > 2:
+            return json.dumps([{'id': email_ids[0], '担当役割': 'PM'}], ensure_ascii=False)
+        return default_answer(messages)
+
+    with FakeCompletionServer(answer=answer) as server:
+        parser = make_parser(server, OPENAI_BATCH_SIZE='4')
+        results = parser.extract_info_ai_many([f"本文{i}" for i in range(4)])
+
+    assert server.requests == 3
+    assert all(result['roles'] == 'エンジニア' for result in results)
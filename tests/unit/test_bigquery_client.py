@@ -0,0 +1,344 @@
+"""
+Tests for buffered streaming inserts in BigQueryClient.
+"""
+import base64
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import zlib
+
+import pytest
+from google.cloud import bigquery
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+from benchmarks.fake_bigquery import FakeBigQueryClient
+from bigquery_client import SCHEMA, BigQueryClient
+from field_registry import build_row
+from metadata_cache import MetadataCache
+from row_stager import RowStager
+
+
+def add_rows(client, count):
+    """Buffer count minimal rows."""
+    for i in range(count):
+        client.add_row({'id': f"msg-{i:04d}", 'body': '本文'}, {}, {})
+
+
+def test_buffered_rows_are_sent_in_few_insert_calls():
+    """1,000 buffered emails take two 500-row insert calls per table."""
+    fake = FakeBigQueryClient()
+    with BigQueryClient(client=fake) as client:
+        add_rows(client, 1000)
+
+    assert fake.insert_calls == 4
+    assert len(fake.table_rows['extracted_info']) == 1000
+    assert len(fake.table_rows['extracted_info_raw']) == 1000
+
+
+def test_flush_on_exit_sends_partial_buffer():
+    """Rows below the threshold are flushed when the writer closes."""
+    fake = FakeBigQueryClient()
+    with BigQueryClient(client=fake) as client:
+        add_rows(client, 10)
+        assert fake.insert_calls == 0
+
+    assert len(fake.table_rows['extracted_info']) == 10
+
+
+def test_only_failed_rows_are_retried(monkeypatch):
+    """Retriable failures resend only their rows; invalid rows are dropped."""
+    monkeypatch.setenv('BIGQUERY_RETRY_BASE_DELAY', '0')
+    fake = FakeBigQueryClient(invalid_ids={'msg-0001'}, flaky_ids={'msg-0002', 'msg-0003'})
+    with BigQueryClient(client=fake) as client:
+        add_rows(client, 10)
+
+    assert fake.insert_calls == 3  # the flaky rows only fail once, in the first table
+    assert len(fake.table_rows['extracted_info']) == 9
+    assert len(fake.table_rows['extracted_info_raw']) == 9
+    assert client.failed_rows == 2
+
+
+def test_insert_retries_back_off_exponentially(monkeypatch):
+    """Failed insert attempts are retried after growing, jittered delays."""
+    delays = []
+    monkeypatch.setattr('bigquery_client.time.sleep', delays.append)
+    fake = FakeBigQueryClient()
+
+    def unavailable(*args, **kwargs):
+        fake.insert_calls += 1
+        raise ConnectionError("connection reset")
+
+    monkeypatch.setattr(fake, 'insert_rows_json', unavailable)
+    client = BigQueryClient(client=fake)
+    client.retry_base_delay = 1.0
+
+    assert client._insert_chunk([{'email_id': 'a'}], fake.dataset('d').table('t')) == 1
+    assert fake.insert_calls == client.insert_retries + 1
+    assert len(delays) == client.insert_retries
+    assert all(2 ** attempt <= delay < 2 ** (attempt + 1) for attempt, delay in enumerate(delays))
+
+
+def test_batch_mode_stages_rows_and_runs_one_load_job_per_file():
+    """Batch mode writes NDJSON files locally and loads each with one job."""
+    fake = FakeBigQueryClient()
+    with tempfile.TemporaryDirectory() as stage_dir:
+        os.environ.update({'BIGQUERY_STAGE_DIR': stage_dir, 'BIGQUERY_LOAD_FILE_ROWS': '1000'})
+        try:
+            client = BigQueryClient(client=fake, load_mode='batch')
+        finally:
+            os.environ.pop('BIGQUERY_STAGE_DIR')
+            os.environ.pop('BIGQUERY_LOAD_FILE_ROWS')
+
+        with client:
+            add_rows(client, 1500)
+        remaining = os.listdir(stage_dir)
+
+    assert fake.insert_calls == 0
+    assert client.load_jobs == 4
+    assert [(data['destination'], data['data'].count(b'\n')) for data in fake.loaded_files] == [
+        ('extracted_info', 1000), ('extracted_info', 500), ('extracted_info_raw', 1000), ('extracted_info_raw', 500)
+    ]
+    assert json.loads(fake.loaded_files[0]['data'].splitlines()[0])['email_id'] == 'msg-0000'
+    assert remaining == []
+
+
+def test_concurrent_writers_share_the_stagers(monkeypatch):
+    """Write workers flushing at the same time in batch mode lose no staged rows."""
+    fake = FakeBigQueryClient()
+    monkeypatch.setenv('BIGQUERY_BUFFER_ROWS', '1')
+    with tempfile.TemporaryDirectory() as stage_dir:
+        monkeypatch.setenv('BIGQUERY_STAGE_DIR', stage_dir)
+        monkeypatch.setenv('BIGQUERY_LOAD_FILE_ROWS', '500')
+        client = BigQueryClient(client=fake, load_mode='batch')
+
+        def write(worker):
+            for i in range(3000):
+                client.add_row({'id': f"msg-{worker}-{i:04d}", 'body': '本文'}, {}, {})
+
+        threads = [threading.Thread(target=write, args=(worker,)) for worker in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert client.close() is True
+
+    loaded = [data for data in fake.loaded_files if data['destination'] == 'extracted_info']
+    assert sum(data['data'].count(b'\n') for data in loaded) == 6000
+    assert client.failed_rows == 0
+
+
+def test_row_stager_writes_parquet_row_groups():
+    """Parquet staging writes typed columns that read back row for row."""
+    pq = pytest.importorskip('pyarrow.parquet')
+    with tempfile.TemporaryDirectory() as stage_dir:
+        stager = RowStager(stage_dir, file_format='parquet')
+        stager.write_rows([build_row({'id': 'a', 'date': 'Mon, 01 May 2023 09:00:00 +0900'}, {}, {})])
+        stager.write_rows([build_row({'id': 'b'}, {'company_name': '株式会社テスト'}, {})])
+        files = stager.close()
+
+        table = pq.read_table(files[0]['path'])
+
+    assert files[0]['rows'] == 2
+    assert table.column('email_id').to_pylist() == ['a', 'b']
+    assert table.column('company_name').to_pylist() == ['', '株式会社テスト']
+    assert str(table.column('received_date')[0]) == '2023-05-01 00:00:00+00:00'
+
+
+def test_upsert_loads_into_staging_table_and_merges_once():
+    """Upsert mode loads each table into a temporary table, runs one MERGE and drops it."""
+    fake = FakeBigQueryClient()
+    with tempfile.TemporaryDirectory() as stage_dir:
+        os.environ['BIGQUERY_STAGE_DIR'] = stage_dir
+        try:
+            client = BigQueryClient(client=fake, upsert=True)
+        finally:
+            os.environ.pop('BIGQUERY_STAGE_DIR')
+
+        with client:
+            add_rows(client, 20)
+            add_rows(client, 5)
+
+    staging_id, raw_staging_id = [table.table_id for table in fake.created_tables]
+    assert raw_staging_id.startswith('extracted_info_raw_staging_')
+    assert fake.insert_calls == 0
+    assert [data['destination'] for data in fake.loaded_files] == [staging_id, raw_staging_id]
+    assert len(fake.queries) == 2
+    assert fake.queries[1].startswith("MERGE `fake-project.email_data.extracted_info_raw` T")
+    assert fake.queries[0].startswith("MERGE `fake-project.email_data.extracted_info` T")
+    assert f"FROM `fake-project.email_data.{staging_id}`" in fake.queries[0]
+    assert "ON T.email_id = S.email_id" in fake.queries[0]
+    assert fake.deleted_tables[0].table_id == staging_id
+    assert fake.created_tables[0].expires is not None
+
+
+def test_failed_merge_keeps_the_staged_files(monkeypatch):
+    """When the MERGE fails, the staged files stay behind so the rows can be loaded again."""
+    fake = FakeBigQueryClient()
+
+    def failing_query(sql, job_config=None, **kwargs):
+        raise RuntimeError("MERGE failed")
+
+    monkeypatch.setattr(fake, 'query', failing_query)
+    with tempfile.TemporaryDirectory() as stage_dir:
+        monkeypatch.setenv('BIGQUERY_STAGE_DIR', stage_dir)
+        client = BigQueryClient(client=fake, upsert=True)
+        add_rows(client, 10)
+
+        assert client.close() is False
+        remaining = sorted(os.listdir(stage_dir))
+
+    assert client.failed_rows == 20  # both tables
+    assert len(remaining) == 2
+    assert [table.table_id for table in fake.deleted_tables] == [table.table_id for table in fake.created_tables]
+
+
+def test_streaming_inserts_use_email_id_as_insert_id():
+    """Streaming inserts pass email_ids as insertIds for best-effort dedup."""
+    calls = []
+    fake = FakeBigQueryClient()
+    insert_rows_json = fake.insert_rows_json
+    fake.insert_rows_json = lambda table, rows, row_ids=None: calls.append(row_ids) or insert_rows_json(table, rows)
+
+    with BigQueryClient(client=fake) as client:
+        add_rows(client, 3)
+
+    assert calls == [['msg-0000', 'msg-0001', 'msg-0002']] * 2
+
+
+def test_new_table_is_partitioned_and_clustered():
+    """A new table is partitioned by day on received_date and clustered."""
+    fake = FakeBigQueryClient()
+    BigQueryClient(client=fake).create_table_if_not_exists()
+
+    table = fake.created_tables[0]
+    assert table.time_partitioning.field == 'received_date'
+    assert table.time_partitioning.type_ == 'DAY'
+    assert table.clustering_fields == ['company_name', 'prefecture']
+
+
+def test_migrate_table_rebuilds_unpartitioned_table():
+    """An unpartitioned table is copied into a partitioned one that takes its name."""
+    fake = FakeBigQueryClient()
+    client = BigQueryClient(client=fake)
+    fake.create_table(bigquery.Table(client.table_ref, schema=SCHEMA))
+
+    assert client.migrate_table()
+
+    script = fake.queries[0]
+    assert "CREATE TABLE `fake-project.email_data.extracted_info_partitioned`" in script
+    assert "PARTITION BY DATE(received_date)" in script
+    assert "CLUSTER BY company_name, prefecture" in script
+    assert "RENAME TO extracted_info;" in script
+
+
+def test_migrate_table_moves_legacy_bodies_into_the_raw_table():
+    """email_body is copied into the raw table and left out of the rebuilt table."""
+    fake = FakeBigQueryClient()
+    client = BigQueryClient(client=fake)
+    fake.create_table(bigquery.Table(client.table_ref, schema=SCHEMA + [bigquery.SchemaField('email_body', 'STRING')]))
+
+    assert client.migrate_table()
+
+    script = fake.queries[0]
+    assert 'extracted_info_raw' in fake.tables
+    assert script.index("INSERT INTO `fake-project.email_data.extracted_info_raw`") < script.index("CREATE TABLE")
+    assert "SELECT email_id, received_date, email_body, TO_HEX(SHA256(email_body))" in script
+    assert "AS SELECT * EXCEPT (email_body) FROM `fake-project.email_data.extracted_info`;" in script
+
+
+def test_migrate_table_drops_legacy_bodies_from_a_partitioned_table():
+    """A partitioned table with email_body gets its bodies copied and the column dropped."""
+    fake = FakeBigQueryClient()
+    client = BigQueryClient(client=fake)
+    table = bigquery.Table(client.table_ref, schema=SCHEMA + [bigquery.SchemaField('email_body', 'STRING')])
+    table.time_partitioning = bigquery.TimePartitioning(field='received_date')
+    table.clustering_fields = ['company_name', 'prefecture']
+    fake.create_table(table)
+
+    assert client.migrate_table()
+
+    script = fake.queries[0]
+    assert "INSERT INTO `fake-project.email_data.extracted_info_raw`" in script
+    assert script.endswith("ALTER TABLE `fake-project.email_data.extracted_info` DROP COLUMN email_body;")
+    assert "CREATE TABLE" not in script
+
+
+def test_upsert_merge_prunes_target_partitions():
+    """The MERGE only matches target rows in the run's received_date range."""
+    fake = FakeBigQueryClient()
+    with tempfile.TemporaryDirectory() as stage_dir:
+        os.environ['BIGQUERY_STAGE_DIR'] = stage_dir
+        try:
+            with BigQueryClient(client=fake, upsert=True) as client:
+                client.add_row({'id': 'a', 'date': 'Tue, 2 May 2023 10:00:00 +0900'}, {}, {})
+                client.add_row({'id': 'b', 'date': 'Mon, 1 May 2023 09:00:00 +0900'}, {}, {})
+        finally:
+            os.environ.pop('BIGQUERY_STAGE_DIR')
+
+    assert ("T.received_date BETWEEN TIMESTAMP('2023-05-01T00:00:00+00:00') "
+            "AND TIMESTAMP('2023-05-02T01:00:00+00:00') OR T.received_date IS NULL") in fake.queries[0]
+
+
+def test_upsert_range_is_reset_after_each_merge():
+    """A client reused across runs (as by the daemon) only prunes to the latest run's dates."""
+    fake = FakeBigQueryClient()
+    with tempfile.TemporaryDirectory() as stage_dir:
+        os.environ['BIGQUERY_STAGE_DIR'] = stage_dir
+        try:
+            client = BigQueryClient(client=fake, upsert=True)
+            client.add_row({'id': 'a', 'date': 'Mon, 1 May 2023 09:00:00 +0900'}, {}, {})
+            client.close()
+            client.add_row({'id': 'b', 'date': 'Tue, 6 Jun 2023 10:00:00 +0900'}, {}, {})
+            client.close()
+        finally:
+            os.environ.pop('BIGQUERY_STAGE_DIR')
+
+    assert ("T.received_date BETWEEN TIMESTAMP('2023-06-06T01:00:00+00:00') "
+            "AND TIMESTAMP('2023-06-06T01:00:00+00:00') OR T.received_date IS NULL") in fake.queries[-1]
+
+
+def test_raw_bodies_are_written_to_the_raw_table():
+    """Bodies go to the raw table with their hash, optionally zlib-compressed."""
+    fake = FakeBigQueryClient()
+    os.environ['BIGQUERY_BODY_COMPRESSION'] = 'zlib'
+    try:
+        client = BigQueryClient(client=fake)
+    finally:
+        os.environ.pop('BIGQUERY_BODY_COMPRESSION')
+    with client:
+        client.add_row({'id': 'a', 'body': '【法人名】株式会社テスト'}, {}, {})
+
+    row, = fake.table_rows['extracted_info']
+    raw_row, = fake.table_rows['extracted_info_raw']
+    assert 'email_body' not in row
+    assert raw_row['email_id'] == 'a'
+    assert raw_row['body'] is None
+    assert raw_row['body_sha256'] == hashlib.sha256('【法人名】株式会社テスト'.encode('utf-8')).hexdigest()
+    assert zlib.decompress(base64.b64decode(raw_row['body_compressed'])).decode('utf-8') == '【法人名】株式会社テスト'
+
+
+def test_metadata_cache_skips_existence_checks_on_later_runs():
+    """Once the dataset and tables are recorded, later runs make no metadata calls."""
+    fake = FakeBigQueryClient()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache_file = os.path.join(cache_dir, 'bq_metadata.json')
+        for _ in range(2):
+            client = BigQueryClient(client=fake, metadata_cache=MetadataCache(cache_file))
+            client.create_dataset_if_not_exists()
+            client.create_table_if_not_exists()
+
+    assert fake.metadata_calls == 3
+    assert len(fake.created_tables) == 2
+
+
+def test_parquet_stager_without_pyarrow_fails_before_buffering(monkeypatch):
+    """A missing pyarrow is reported when the stager is created, not after rows were taken from the buffer."""
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    with tempfile.TemporaryDirectory() as stage_dir:
+        with pytest.raises(ImportError, match='pyarrow'):
+            RowStager(stage_dir, file_format='parquet')
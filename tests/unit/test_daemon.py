@@ -0,0 +1,142 @@
+"""
+Tests for the polling daemon using the in-process fake Gmail and BigQuery clients.
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+from benchmarks.fake_bigquery import FakeBigQueryClient
+from benchmarks.fake_gmail import FakeGmailService, make_message
+from bigquery_client import BigQueryClient
+from daemon import AdaptiveInterval, Daemon
+from email_classifier import EmailClassifier
+from email_parser import EmailParser
+from gmail_client import GmailClient
+from sync_state import SyncState
+
+
+def make_daemon(tmp, count=3, failing_ids=None, invalid_ids=None):
+    """Build a daemon over a fake mailbox with the given number of messages."""
+    messages = [make_message(f"msg-{i:04d}", f"【法人名】株式会社テスト{i}\n") for i in range(count)]
+    service = FakeGmailService(messages, latency=0, failing_ids=failing_ids)
+    gmail_client = GmailClient(service=service)
+    gmail_client.fetch_retry_delay = 0
+    fake = FakeBigQueryClient(invalid_ids=invalid_ids)
+    daemon = Daemon(ai_gating=False, interval=AdaptiveInterval(0.01, 0.05),
+                    gmail_client=gmail_client, email_parser=EmailParser(),
+                    bigquery_client=BigQueryClient(client=fake),
+                    sync_state=SyncState(os.path.join(tmp, 'sync_state.json')))
+    return daemon, service, fake
+
+
+def test_interval_drops_on_mail_and_backs_off_while_idle():
+    """Empty polls double the wait up to the maximum; a poll with mail resets it."""
+    interval = AdaptiveInterval(min_interval=30, max_interval=100, backoff=2)
+
+    assert [interval.next(0) for _ in range(3)] == [60, 100, 100]
+    assert interval.next(5) == 30
+
+
+def test_daemon_picks_up_new_mail_with_the_same_clients(monkeypatch):
+    """New mail is written by the next poll and stopping ends the loop with the checkpoint saved."""
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    monkeypatch.setenv('METRICS_FILE', '')
+    with tempfile.TemporaryDirectory() as tmp:
+        daemon, service, fake = make_daemon(tmp)
+        thread = threading.Thread(target=daemon.run)
+        thread.start()
+        try:
+            deadline = time.time() + 5
+            while len(fake.table_rows['extracted_info']) < 3 and time.time() < deadline:
+                time.sleep(0.01)
+            service.add_message(make_message('msg-new', "【法人名】株式会社新着\n"))
+            daemon.wake()
+            while len(fake.table_rows['extracted_info']) < 4 and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            daemon.stop()
+            thread.join(5)
+
+        checkpoint = daemon.sync_state.load_history_id()
+
+    assert not thread.is_alive()
+    assert [row['email_id'] for row in fake.table_rows['extracted_info']][-1] == 'msg-new'
+    assert len(fake.table_rows['extracted_info']) == 4
+    assert checkpoint == str(service.history_id)
+    assert daemon.emails == 4 and daemon.polls >= 2
+
+
+def test_stopped_poll_keeps_the_checkpoint(monkeypatch):
+    """A poll cut short by a stop writes what it fetched but does not advance the checkpoint."""
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    with tempfile.TemporaryDirectory() as tmp:
+        daemon, _, fake = make_daemon(tmp)
+        daemon.stop()
+
+        assert daemon.poll() == 0
+        assert daemon.sync_state.load_history_id() is None
+    assert fake.table_rows['extracted_info'] == []
+
+
+def test_unfetched_message_keeps_the_checkpoint(monkeypatch):
+    """A message that still fails after the retries is not skipped by advancing the checkpoint."""
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    with tempfile.TemporaryDirectory() as tmp:
+        daemon, _, fake = make_daemon(tmp, failing_ids={'msg-0001'})
+
+        assert daemon.poll() == 2
+        assert daemon.sync_state.load_history_id() is None
+    assert len(fake.table_rows['extracted_info']) == 2
+
+
+def test_failed_insert_recreates_the_table_on_the_next_poll(monkeypatch):
+    """After failed rows the next poll makes sure the table exists again before writing."""
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    with tempfile.TemporaryDirectory() as tmp:
+        daemon, _, fake = make_daemon(tmp, invalid_ids={'msg-0001'})
+
+        assert daemon.poll() == 3
+        assert daemon.last_failed_rows
+        fake.tables.clear()
+        fake.invalid_ids.clear()
+        assert daemon.poll() == 3
+        checkpoint = daemon.sync_state.load_history_id()
+
+    assert 'extracted_info' in fake.tables
+    assert daemon.last_failed_rows == 0
+    assert checkpoint is not None
+
+
+def test_poll_metrics_count_ai_gating_decisions(monkeypatch):
+    """The run summary and the Prometheus file carry the classifier's decisions by reason."""
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    with tempfile.TemporaryDirectory() as tmp:
+        metrics_file = os.path.join(tmp, 'run_metrics.json')
+        prometheus_file = os.path.join(tmp, 'run.prom')
+        monkeypatch.setenv('METRICS_FILE', metrics_file)
+        monkeypatch.setenv('METRICS_PROMETHEUS_FILE', prometheus_file)
+        daemon, _, fake = make_daemon(tmp)
+        daemon.classifier = EmailClassifier()
+        thread = threading.Thread(target=daemon.run)
+        thread.start()
+        try:
+            deadline = time.time() + 5
+            while daemon.polls < 1 and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            daemon.stop()
+            thread.join(5)
+
+        with open(metrics_file) as f:
+            document = json.load(f)
+        with open(prometheus_file) as f:
+            lines = f.read().splitlines()
+
+    assert document['ai_decisions'] == {'no_project_section': 3}
+    assert 'email_processor_ai_decisions_total{reason="no_project_section"} 3' in lines
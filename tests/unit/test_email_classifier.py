@@ -0,0 +1,27 @@
+"""
+Tests for the regex-first gate in front of AI extraction.
+"""
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+from email_classifier import EmailClassifier
+
+
+def test_project_mail_needs_ai():
+    """Mails with a 案件 section are sent to the AI extractor."""
+    classifier = EmailClassifier()
+    email = {'subject': '案件のご紹介', 'body': '【法人名】株式会社テスト\n■案件概要\n【案件名】開発'}
+
+    assert classifier.needs_ai(email, {'company_name': '株式会社テスト'}) == (True, 'project_section')
+
+
+def test_non_project_mail_is_skipped_with_reason():
+    """Auto-replies, newsletters and empty mails are skipped and counted."""
+    classifier = EmailClassifier()
+
+    assert classifier.needs_ai({'subject': '自動返信: 不在のお知らせ', 'body': '■案件概要'}, {}) == (False, 'auto_reply')
+    assert classifier.needs_ai({'subject': 'ニュース', 'body': '配信停止はこちら'}, {}) == (False, 'newsletter')
+    assert classifier.needs_ai({'subject': '', 'body': '  '}, {}) == (False, 'empty_body')
+    assert classifier.decisions == {'auto_reply': 1, 'newsletter': 1, 'empty_body': 1}
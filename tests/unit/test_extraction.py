@@ -0,0 +1,61 @@
+"""
+Tests for the label-dispatch regex extractor in EmailParser.
+"""
+import os
+import random
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+from benchmarks.bench_regex import legacy_extract_info_regex
+from email_parser import EmailParser
+
+SAMPLE_BODY = """
+【法人名】株式会社エルハウジング
+【URL】https://l-housing.co.jp/
+【業界】建設 / 総合建設 / ビル・住宅建築
+【設立】2005年4月1日
+【資本金】60,000,000円
+【売上】13,392,000,000円
+【決算】3月
+【社員数】122名
+【都道府県】京都府
+【最寄駅】太秦天神川駅
+【法人概要】新築住宅分譲事業を展開しています。
+工業団地の分譲による雇用創出も行っています。
+
+■案件概要
+【案件名】AIを活用した不動産価格予測システムの開発
+"""
+
+TOKENS = [
+    '【法人名】', '【URL】', '【業界】', '【設立】', '【資本金】', '【売上】', '【決算】', '【社員数】',
+    '【都道府県】', '【最寄駅】', '【法人概要】', '【', '】', '【案件名】', ' ', '\n', '  \n', '\t',
+    'abc', '東京都', '京都府', '駅', '渋谷駅', '2020年1月1日', '100名', '12月', '1,000円',
+    'https://example.jp/a', 'http:// bad', '都', '【法人', '名】',
+]
+
+
+def test_extract_info_regex_sample():
+    """All eleven fields are extracted from a typical 案件 mail."""
+    result = EmailParser().extract_info_regex(SAMPLE_BODY)
+
+    assert result['company_name'] == '株式会社エルハウジング'
+    assert result['url'] == 'https://l-housing.co.jp/'
+    assert result['established_year'] == '2005年4月1日'
+    assert result['employee_count'] == '122名'
+    assert result['nearest_station'] == '太秦天神川駅'
+    assert result['company_overview'] == (
+        '新築住宅分譲事業を展開しています。\n工業団地の分譲による雇用創出も行っています。\n\n■案件概要'
+    )
+
+
+def test_extract_info_regex_matches_legacy_output():
+    """The single-pass extractor returns exactly what the eleven re.search calls did."""
+    parser = EmailParser()
+    rng = random.Random(1)
+
+    for _ in range(20000):
+        body = ''.join(rng.choice(TOKENS) for _ in range(rng.randint(0, 25)))
+        assert parser.extract_info_regex(body) == legacy_extract_info_regex(body), repr(body)
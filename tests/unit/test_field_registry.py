@@ -0,0 +1,48 @@
+"""
+Tests for the field registry that drives extraction, schema and row building.
+"""
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+from bigquery_client import SCHEMA
+from field_registry import build_row, empty_ai_result
+
+
+def test_schema_columns():
+    """The generated schema keeps the extracted_info column layout."""
+    columns = [field.name for field in SCHEMA]
+
+    assert len(columns) == 26
+    assert columns[:6] == ['email_id', 'subject', 'from_email', 'to_email', 'received_date', 'processed_date']
+    assert columns[-1] == 'ai_skip_reason'
+    assert 'email_body' not in columns
+    assert SCHEMA[0].mode == 'REQUIRED'
+
+
+def test_build_row_maps_every_source():
+    """Rows pick values from the email, regex and AI dicts by column."""
+    email = {'id': 'm1', 'from': 'a@example.com', 'body': 'body'}
+    regex = {'company_name': '株式会社テスト', 'industry': 'IT'}
+    ai = dict(empty_ai_result(), industry='金融', roles=None)
+
+    row = build_row(email, regex, ai)
+
+    assert list(row) == [field.name for field in SCHEMA]
+    assert row['email_id'] == 'm1'
+    assert row['from_email'] == 'a@example.com'
+    assert row['industry'] == 'IT'
+    assert row['ai_industry'] == '金融'
+    assert row['roles'] is None
+    assert row['url'] == ''
+    assert row['processed_date']
+
+
+def test_received_date_is_stored_as_utc_timestamp():
+    """The RFC 2822 Date header is converted to an ISO timestamp in UTC."""
+    row = build_row({'id': 'm1', 'date': 'Mon, 1 May 2023 09:00:00 +0900'}, {}, {})
+
+    assert row['received_date'] == '2023-05-01T00:00:00+00:00'
+    assert build_row({'id': 'm2', 'date': 'not a date'}, {}, {})['received_date'] is None
+    assert build_row({'id': 'm3'}, {}, {})['received_date'] is None
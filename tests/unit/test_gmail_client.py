@@ -0,0 +1,109 @@
+"""
+Tests for GmailClient using the in-process fake Gmail service.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+from benchmarks.fake_gmail import FakeGmailService, make_message
+from gmail_client import GmailClient
+from message_cache import MessageCache
+
+
+def make_client(count=120, failing_ids=None):
+    """Build a GmailClient over a fake mailbox with the given number of messages."""
+    messages = [make_message(f"msg-{i:04d}", f"【法人名】株式会社テスト{i}\n") for i in range(count)]
+    service = FakeGmailService(messages, latency=0, failing_ids=failing_ids)
+    client = GmailClient(service=service)
+    client.batch_size = 50
+    client.fetch_workers = 3
+    client.fetch_retry_delay = 0
+    return client, service
+
+
+def test_fetch_messages_batches_and_keeps_order():
+    """Messages are fetched in batches and returned in request order."""
+    client, service = make_client()
+    ids = [f"msg-{i:04d}" for i in range(120)]
+
+    emails = client.fetch_messages(ids)
+
+    assert [email['id'] for email in emails] == ids
+    assert emails[7]['body'] == "【法人名】株式会社テスト7\n"
+    assert service.round_trips == 3
+
+
+def test_fetch_messages_skips_failed_messages():
+    """A failing message is retried, then skipped without losing the rest."""
+    client, service = make_client(failing_ids={'msg-0003'})
+    ids = [f"msg-{i:04d}" for i in range(120)]
+
+    emails = client.fetch_messages(ids)
+
+    assert len(emails) == 119
+    assert 'msg-0003' not in [email['id'] for email in emails]
+    assert service.round_trips == 4
+    assert client.failed_fetches == 1
+
+
+def test_iter_emails_follows_every_page():
+    """iter_emails keeps listing until nextPageToken is exhausted."""
+    client, service = make_client(count=250)
+
+    emails = list(client.iter_emails(days=1, page_size=100))
+
+    assert len(emails) == 250
+    assert emails[-1]['id'] == 'msg-0249'
+
+
+def test_iter_emails_since_fetches_only_new_messages():
+    """Only messages added after the checkpoint are returned."""
+    client, service = make_client(count=10)
+    checkpoint = client.get_history_id()
+    service.add_message(make_message('new-1', "【法人名】株式会社新規\n"))
+    service.add_message(make_message('new-2', "【法人名】株式会社新規2\n", to='other@example.com'))
+
+    emails = list(client.iter_emails_since(checkpoint))
+
+    assert [email['id'] for email in emails] == ['new-1']
+
+
+def test_iter_emails_since_falls_back_when_checkpoint_expired():
+    """An expired history id triggers a full window scan."""
+    client, service = make_client(count=10)
+    service.oldest_history_id = service.history_id + 1
+
+    emails = list(client.iter_emails_since('1'))
+
+    assert len(emails) == 10
+
+
+def test_cached_messages_need_no_api_calls():
+    """A second fetch of the same window is served from the message cache."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        client, service = make_client(count=60)
+        client.cache = MessageCache(cache_dir)
+        list(client.iter_emails(days=1))
+        round_trips = service.round_trips
+
+        client.fetch_messages([f"msg-{i:04d}" for i in range(60)])
+        assert service.round_trips == round_trips
+
+        replay = GmailClient(service=None, cache=MessageCache(cache_dir))
+        assert len(list(replay.iter_cached_emails(days=1))) == 60
+        assert replay._service is None
+
+
+def test_message_cache_evicts_least_recently_used():
+    """The cache stays under its byte budget by evicting the oldest entries."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = MessageCache(cache_dir, max_bytes=2000)
+        for i in range(20):
+            cache.put(make_message(f"msg-{i:04d}", "x" * 100))
+
+        assert cache._total_bytes <= 2000
+        assert cache.get('msg-0019') is not None
+        assert cache.get('msg-0000') is None
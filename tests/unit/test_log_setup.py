@@ -0,0 +1,51 @@
+"""
+Tests for the queue-based JSON logging setup.
+"""
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+from logging.handlers import QueueHandler
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+from log_setup import configure_logging, stop_logging
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../src'))
+
+
+def test_records_are_written_as_json_lines_through_the_queue(capsys):
+    """INFO records and their extra fields reach the file as JSON; DEBUG is dropped at INFO."""
+    logger = logging.getLogger('test_log_setup')
+    with tempfile.TemporaryDirectory() as tmp:
+        log_file = os.path.join(tmp, 'run.log')
+        configure_logging(level='INFO', log_file=log_file, log_format='json')
+        try:
+            logger.info("Processed %d emails", 3, extra={'emails': 3})
+            logger.debug("Per-email detail %s", 'msg-1')
+            try:
+                raise ValueError("bad row")
+            except ValueError:
+                logger.exception("Insert failed")
+        finally:
+            stop_logging()
+
+        with open(log_file, encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f]
+
+    assert [entry['message'] for entry in entries] == ["Processed 3 emails", "Insert failed"]
+    assert entries[0]['emails'] == 3
+    assert entries[0]['level'] == 'INFO' and entries[0]['logger'] == 'test_log_setup'
+    assert entries[1]['exception'].endswith("ValueError: bad row")
+    assert "Processed 3 emails" in capsys.readouterr().out
+    assert not any(isinstance(handler, QueueHandler) for handler in logging.getLogger().handlers)
+
+
+def test_importing_main_configures_no_handlers():
+    """Importing main (as the benchmarks and tests do) creates no log file."""
+    with tempfile.TemporaryDirectory() as tmp:
+        subprocess.run([sys.executable, '-c', 'import main, logging; assert not logging.getLogger().handlers'],
+                       cwd=tmp, env=dict(os.environ, PYTHONPATH=SRC_DIR), check=True)
+        assert os.listdir(tmp) == []
@@ -0,0 +1,107 @@
+"""
+Tests for the run metrics registry.
+"""
+import json
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+from benchmarks.fake_bigquery import FakeBigQueryClient
+from bigquery_client import BigQueryClient
+from metrics import METRICS, Metrics
+
+
+def test_timed_records_calls_counters_and_errors():
+    """Every block is a call; escaping exceptions count as errors and the counters add up."""
+    metrics = Metrics()
+    for size in (10, 20):
+        with metrics.timed('fetch') as counts:
+            counts['bytes'] = size
+    with pytest.raises(RuntimeError):
+        with metrics.timed('fetch'):
+            raise RuntimeError("boom")
+    metrics.count('fetch', retries=2)
+
+    summary = metrics.summary()['fetch']
+    assert (summary['calls'], summary['errors'], summary['retries'], summary['bytes']) == (3, 1, 2, 30)
+    assert 0 <= summary['latency_seconds']['p50'] <= summary['latency_seconds']['max']
+
+
+def test_quantiles_are_interpolated_within_buckets():
+    """Ninety fast and ten slow observations put p50 in the fast bucket and p99 in the slow one."""
+    metrics = Metrics()
+    operation = metrics._operation('ai')
+    for _ in range(90):
+        operation.observe(0.003)
+    for _ in range(10):
+        operation.observe(2.0)
+
+    assert 0.001 < operation.quantile(0.5) <= 0.005
+    assert 1.0 < operation.quantile(0.99) <= 2.0
+
+
+def test_drained_state_merges_into_another_registry():
+    """Worker metrics handed over with drain() add up in the parent registry."""
+    worker, parent = Metrics(), Metrics()
+    with worker.timed('regex_extract'):
+        pass
+    with parent.timed('regex_extract'):
+        pass
+
+    parent.merge(worker.drain())
+
+    assert parent.summary()['regex_extract']['calls'] == 2
+    assert worker.summary() == {}
+
+
+def test_json_and_prometheus_files():
+    """The summary is written as JSON and as Prometheus text with cumulative buckets."""
+    metrics = Metrics()
+    for _ in range(3):
+        with metrics.timed('bigquery_insert') as counts:
+            counts['bytes'] = 100
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'run.json')
+        prom_path = os.path.join(tmp, 'run.prom')
+        metrics.write_json(json_path, {'status': 'ok', 'emails': 3})
+        metrics.write_prometheus(prom_path, {'emails': 3, 'status': 'ok'},
+                                 ai_decisions={'project_section': 2, 'newsletter': 1})
+
+        with open(json_path) as f:
+            document = json.load(f)
+        with open(prom_path) as f:
+            lines = f.read().splitlines()
+
+    assert document['emails'] == 3
+    assert document['operations']['bigquery_insert']['bytes'] == 300
+    assert 'email_processor_operation_duration_seconds_bucket{operation="bigquery_insert",le="+Inf"} 3' in lines
+    assert 'email_processor_operation_duration_seconds_count{operation="bigquery_insert"} 3' in lines
+    assert 'email_processor_operation_bytes_total{operation="bigquery_insert"} 300' in lines
+    assert 'email_processor_last_run_emails 3' in lines
+    assert 'email_processor_ai_decisions_total{reason="newsletter"} 1' in lines
+    assert 'email_processor_ai_decisions_total{reason="project_section"} 2' in lines
+    assert not any('status' in line for line in lines)
+    buckets = [int(line.rsplit(' ', 1)[1]) for line in lines if '_bucket{' in line]
+    assert buckets == sorted(buckets)
+
+
+def test_insert_retries_and_row_errors_are_recorded(monkeypatch):
+    """Streaming inserts record one call per chunk with its retries, row errors and bytes."""
+    monkeypatch.setenv('BIGQUERY_RETRY_BASE_DELAY', '0')
+    METRICS.reset()
+    fake = FakeBigQueryClient(invalid_ids={'msg-0001'}, flaky_ids={'msg-0002'})
+    with BigQueryClient(client=fake) as client:
+        for i in range(5):
+            client.add_row({'id': f"msg-{i:04d}", 'body': '本文'}, {}, {})
+
+    summary = METRICS.summary()['bigquery_insert']
+    assert summary['calls'] == 2  # one chunk per table
+    assert summary['retries'] == 1
+    assert summary['errors'] == 3  # invalid row in both tables, flaky row once
+    assert summary['bytes'] > 0
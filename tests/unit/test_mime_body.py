@@ -0,0 +1,65 @@
+"""
+Tests for body extraction from nested, non-UTF-8 and oversized MIME payloads.
+"""
+import base64
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+from gmail_client import get_email_body
+from metrics import METRICS
+from mime_body import extract_body
+
+
+def make_part(mime_type, text, charset='utf-8', filename='', encoding=None):
+    """Build a Gmail API leaf part declaring the charset, encoded with it unless another encoding is given."""
+    return {
+        'mimeType': mime_type,
+        'filename': filename,
+        'headers': [{'name': 'Content-Type', 'value': f'{mime_type}; charset="{charset}"'}],
+        'body': {'data': base64.urlsafe_b64encode(text.encode(encoding or charset)).decode('ascii')},
+    }
+
+
+def test_nested_plain_part_is_decoded_with_its_charset():
+    """text/plain inside mixed > alternative is found and decoded as ISO-2022-JP; attachments are ignored."""
+    payload = {'mimeType': 'multipart/mixed', 'parts': [
+        {'mimeType': 'multipart/alternative', 'parts': [
+            make_part('text/plain', '【法人名】株式会社テスト\n', charset='iso-2022-jp'),
+            make_part('text/html', '<p>HTML版</p>'),
+        ]},
+        make_part('text/plain', '添付ファイル', filename='memo.txt'),
+    ]}
+
+    assert get_email_body({'payload': payload}) == '【法人名】株式会社テスト\n'
+
+
+def test_html_only_body_falls_back_to_text():
+    """A Shift_JIS HTML-only mail becomes text, one line per block, without scripts and styles.
+
+    Mailers label Windows-31J text (with ① and the like) as Shift_JIS.
+    """
+    html = ('<html><head><style>p {color: red}</style></head><body>'
+            '<p>【法人名】株式会社テスト&amp;サンズ</p><div>【都道府県】東京都<br>【法人概要】①受託開発</div>'
+            '<script>alert(1)</script></body></html>')
+    payload = {'mimeType': 'multipart/alternative',
+               'parts': [make_part('text/html', html, charset='shift_jis', encoding='cp932')]}
+
+    body, _ = extract_body(payload)
+
+    assert body.splitlines() == ['【法人名】株式会社テスト&サンズ', '【都道府県】東京都', '【法人概要】①受託開発']
+
+
+def test_oversized_body_is_capped():
+    """Decoding stops at the cap, and the decoded bytes are counted for the body_decode metric."""
+    text = '案件' * 200000  # 1.2 MB in UTF-8
+    payload = make_part('text/plain', text)
+    METRICS.reset()
+
+    body, size = extract_body(payload, max_bytes=100001)
+    get_email_body({'payload': payload})
+
+    assert size == 100001
+    assert text.startswith(body.rstrip('�')) and len(body) == 33334
+    assert METRICS.summary()['body_decode']['bytes'] == 1024 * 1024
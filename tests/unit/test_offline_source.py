@@ -0,0 +1,76 @@
+"""
+Tests for the offline .eml / mbox / JSONL email source.
+"""
+import json
+import os
+import sys
+import tempfile
+from email.message import EmailMessage
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+from offline_source import OfflineSource
+
+
+def make_eml(message_id, body, charset='utf-8'):
+    """Build a raw RFC 822 message with a text/plain body."""
+    message = EmailMessage()
+    message['Message-ID'] = f"<{message_id}@example.com>"
+    message['Subject'] = '案件のご紹介'
+    message['From'] = 'sender@example.com'
+    message['To'] = 'rc_support@frontier-gr.jp'
+    message['Date'] = 'Mon, 01 May 2023 09:00:00 +0900'
+    message.set_content(body, charset=charset)
+    return message.as_bytes()
+
+
+def test_mbox_archive_is_streamed_message_by_message():
+    """Every message of an mbox archive is yielded, including escaped From lines."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'mail.mbox')
+        with open(path, 'wb') as f:
+            for i in range(3):
+                raw = make_eml(f"m{i}", f"【法人名】株式会社テスト{i}\nFrom the desk of\n")
+                f.write(b"From sender@example.com Mon May  1 09:00:00 2023\n")
+                f.write(raw.replace(b"\nFrom the", b"\n>From the") + b"\n")
+
+        emails = list(OfflineSource(path).iter_emails())
+
+    assert [email['id'] for email in emails] == ['m0@example.com', 'm1@example.com', 'm2@example.com']
+    assert emails[1]['body'] == '【法人名】株式会社テスト1\nFrom the desk of\n'
+    assert emails[0]['subject'] == '案件のご紹介'
+    assert emails[0]['date'] == 'Mon, 01 May 2023 09:00:00 +0900'
+
+
+def test_eml_directory_and_jsonl_dump():
+    """.eml directories are read in name order and JSONL lines keep their fields."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        eml_dir = os.path.join(tmp_dir, 'eml')
+        os.mkdir(eml_dir)
+        for name in ('b', 'a'):
+            with open(os.path.join(eml_dir, f"{name}.eml"), 'wb') as f:
+                f.write(make_eml(name, f"本文{name}\n"))
+
+        jsonl_path = os.path.join(tmp_dir, 'dump.jsonl')
+        with open(jsonl_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'id': 'j1', 'subject': 's', 'body': '本文'}, ensure_ascii=False) + '\n\n')
+
+        eml_emails = list(OfflineSource(eml_dir).iter_emails())
+        jsonl_emails = list(OfflineSource(jsonl_path).iter_emails())
+
+    assert [(email['id'], email['body']) for email in eml_emails] == [('a@example.com', '本文a\n'),
+                                                                      ('b@example.com', '本文b\n')]
+    assert jsonl_emails == [{'id': 'j1', 'subject': 's', 'from': '', 'to': '', 'date': '', 'body': '本文'}]
+
+
+def test_jsonl_null_fields_become_empty_strings():
+    """null values in a JSONL dump are read like missing fields, not passed on as None."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        jsonl_path = os.path.join(tmp_dir, 'dump.jsonl')
+        with open(jsonl_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'id': 'j1', 'subject': None, 'from': None, 'to': None, 'date': None,
+                                'body': None}) + '\n')
+
+        email, = OfflineSource(jsonl_path).iter_emails()
+
+    assert email == {'id': 'j1', 'subject': '', 'from': '', 'to': '', 'date': '', 'body': ''}
@@ -0,0 +1,95 @@
+"""
+Tests for the process pool used by --workers.
+"""
+import base64
+import json
+import os
+import random
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+from benchmarks.corpus import make_body
+from benchmarks.fake_gmail import make_message
+from email_parser import EmailParser
+from gmail_client import GmailClient
+from log_setup import configure_logging, stop_logging
+from metrics import METRICS
+from parse_pool import ParsePool
+
+
+def test_pool_results_match_in_process_parsing_in_order():
+    """Decoding and extraction in worker processes give the in-process results, in input order."""
+    rng = random.Random(7)
+    messages = [make_message(f"msg-{i:03d}", make_body(rng)) for i in range(50)]
+    gmail_client = GmailClient(service=object())
+    gmail_client.decode_bodies = False
+    emails = [gmail_client._to_email_data(message) for message in messages]
+    emails[0] = dict(emails[0], body='【法人名】株式会社デコード済み\n', payload=None)
+
+    with ParsePool(2, chunk_size=8) as pool:
+        regex_results = pool.parse(emails)
+
+    parser = EmailParser()
+    assert [email['id'] for email in emails] == [message['id'] for message in messages]
+    assert all('payload' not in email for email in emails)
+    assert emails[0]['body'] == '【法人名】株式会社デコード済み\n'
+    assert regex_results == [parser.extract_info_regex(email['body']) for email in emails]
+
+
+def test_worker_metrics_are_merged_into_the_parent():
+    """Decode and regex metrics recorded in the workers show up in this process."""
+    rng = random.Random(8)
+    gmail_client = GmailClient(service=object())
+    gmail_client.decode_bodies = False
+    emails = [gmail_client._to_email_data(make_message(f"msg-{i:03d}", make_body(rng))) for i in range(20)]
+
+    METRICS.reset()
+    with ParsePool(2, chunk_size=4) as pool:
+        pool.parse(emails)
+
+    summary = METRICS.summary()
+    assert summary['body_decode']['calls'] == 20
+    assert summary['regex_extract']['calls'] == 20
+
+
+def test_worker_log_records_reach_the_parent_log(monkeypatch):
+    """Warnings logged in worker processes are written to the parent's log file."""
+    monkeypatch.setenv('EMAIL_MAX_BODY_BYTES', '100')
+    gmail_client = GmailClient(service=object())
+    gmail_client.decode_bodies = False
+    emails = [gmail_client._to_email_data(make_message(f"msg-{i:03d}", '案件' * 100)) for i in range(5)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_file = os.path.join(tmp, 'run.log')
+        configure_logging(level='INFO', log_file=log_file, log_format='json')
+        try:
+            with ParsePool(2, chunk_size=1) as pool:
+                pool.parse(emails)
+        finally:
+            stop_logging()
+
+        with open(log_file, encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f]
+
+    truncated = [entry for entry in entries if entry['message'].startswith('Truncated a body')]
+    assert len(truncated) == 5
+    assert truncated[0]['logger'] == 'mime_body'
+
+
+def test_single_part_charset_survives_the_trip_to_the_workers():
+    """The Content-Type of a single-part message reaches the worker, so Shift_JIS bodies decode."""
+    message = make_message('msg-sjis', '')
+    message['payload']['headers'].append({'name': 'Content-Type', 'value': 'text/plain; charset=Shift_JIS'})
+    message['payload']['body']['data'] = base64.urlsafe_b64encode('【法人名】株式会社テスト\n'.encode('cp932')).decode()
+    gmail_client = GmailClient(service=object())
+    gmail_client.decode_bodies = False
+    emails = [gmail_client._to_email_data(message)]
+
+    with ParsePool(2) as pool:
+        regex_results = pool.parse(emails)
+
+    assert emails[0]['body'] == '【法人名】株式会社テスト\n'
+    assert regex_results[0]['company_name'] == '株式会社テスト'
@@ -0,0 +1,81 @@
+"""
+Tests for the staged pipeline with bounded queues.
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+from pipeline import Pipeline, Stage
+
+
+def sleeper(seconds):
+    """Stage function that sleeps per chunk and passes the chunk on."""
+    def run(chunk):
+        time.sleep(seconds)
+        return chunk
+    return run
+
+
+def test_stages_overlap_so_wall_time_follows_the_slowest_stage():
+    """Three 50ms stages over 10 chunks take about 10 x 50ms, not 30 x 50ms."""
+    done = []
+    pipeline = Pipeline('source', ([i] for i in range(10)), [
+        Stage('a', sleeper(0.05)),
+        Stage('b', sleeper(0.05)),
+        Stage('c', lambda chunk: done.extend(chunk) or time.sleep(0.05)),
+    ])
+
+    pipeline.run()
+
+    assert sorted(done) == list(range(10))
+    assert pipeline.elapsed < 1.0
+    assert [stats.items for stats in pipeline.stats] == [10, 10, 10, 10]
+
+
+def test_backpressure_bounds_chunks_in_flight():
+    """A slow last stage keeps the source from running ahead of the queues."""
+    produced = []
+    in_flight = []
+    consumed = []
+    lock = threading.Lock()
+
+    def source():
+        for i in range(30):
+            with lock:
+                produced.append(i)
+                in_flight.append(len(produced) - len(consumed))
+            yield [i]
+
+    def slow(chunk):
+        time.sleep(0.01)
+        with lock:
+            consumed.extend(chunk)
+
+    pipeline = Pipeline('source', source(), [Stage('fast', lambda chunk: chunk), Stage('slow', slow)],
+                        queue_size=2)
+    pipeline.run()
+
+    assert len(consumed) == 30
+    # Two queues of two chunks, plus one chunk held by each stage and the source.
+    assert max(in_flight) <= 7
+    assert pipeline.stats[2].max_queue_depth <= 2
+
+
+def test_stage_errors_stop_the_pipeline_and_are_raised():
+    """The first stage error is re-raised once every thread has stopped."""
+    def fail_on_three(chunk):
+        if chunk == [3]:
+            raise ValueError('bad chunk')
+        return chunk
+
+    pipeline = Pipeline('source', ([i] for i in range(100)), [Stage('check', fail_on_three, workers=2),
+                                                              Stage('sink', lambda chunk: None)])
+
+    with pytest.raises(ValueError, match='bad chunk'):
+        pipeline.run()
+    assert pipeline.stats[0].items < 100
@@ -0,0 +1,85 @@
+"""
+Tests for the --profile run profiler.
+"""
+import json
+import os
+import pstats
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+from benchmarks.corpus import make_corpus
+from benchmarks.fake_bigquery import FakeBigQueryClient
+from bigquery_client import BigQueryClient
+from email_parser import EmailParser
+from profiler import RunProfiler
+from runner import run_pipeline
+
+
+def test_profiled_pipeline_writes_pstats_stacks_and_email_spans(monkeypatch):
+    """Worker threads are profiled, and every email gets parse and write spans."""
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    emails = make_corpus(40, seed=3)
+    emails[7]['body'] += '\n' + '【法人概要】' + 'とても長い概要です。' * 20000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prefix = os.path.join(tmp, 'run')
+        with RunProfiler(prefix, sample_interval=0.001) as profiler:
+            run_pipeline(iter(emails), EmailParser(), None, BigQueryClient(client=FakeBigQueryClient()),
+                         profiler=profiler)
+
+        functions = {function for _, _, function in pstats.Stats(f"{prefix}.pstats").stats}
+        with open(f"{prefix}.collapsed") as f:
+            stacks = f.read().splitlines()
+        with open(f"{prefix}.spans.json") as f:
+            spans = json.load(f)
+
+    assert 'extract_info_regex' in functions  # runs in a pipeline thread
+    assert 'add_row' in functions
+    assert stacks and all(line.rsplit(' ', 1)[1].isdigit() for line in stacks)
+    assert len(spans) == 40
+    assert set(spans[0]['stages']) == {'parse', 'write'}
+    assert spans[0]['email_id'] == emails[7]['id']
+    assert profiler.report()[0].startswith("Profile written to")
+
+
+def test_pipeline_without_profiler_installs_no_profile_hook(monkeypatch):
+    """The default path leaves profiling entirely alone."""
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    fake = FakeBigQueryClient()
+
+    run_pipeline(iter(make_corpus(5, seed=5)), EmailParser(), None, BigQueryClient(client=fake))
+
+    assert len(fake.table_rows['extracted_info']) == 5
+    assert sys.getprofile() is None
+
+
+def test_thread_hook_removes_itself_when_cprofile_refuses_a_second_profiler(monkeypatch):
+    """On interpreters where cProfile already covers all threads, the hook runs once per thread."""
+    calls = []
+
+    class RefusingProfile:
+        def enable(self):
+            calls.append(threading.get_ident())
+            raise ValueError("Another profiling tool is already active")
+
+    profiler = RunProfiler(sample_interval=1)
+    monkeypatch.setattr('profiler.cProfile.Profile', RefusingProfile)
+    hooks = []
+
+    def work():
+        sys.setprofile(profiler._profile_thread)
+        for _ in range(1000):
+            len('x')
+        hooks.append(sys.getprofile())
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+
+    assert len(calls) == 1
+    assert hooks == [None]
+    assert profiler._thread_profiles == []
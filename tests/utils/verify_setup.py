@@ -89,7 +89,8 @@ def check_imports():
     ]
     
     optional_packages = [
-        'openai'
+        'openai',
+        'pyarrow'
     ]
     
     all_required_installed = True